@@ -1,2 +1 @@
 from .apicm import NiagaraCMApi
-import cmd_line_scripts
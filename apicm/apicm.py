@@ -1,10 +1,189 @@
-from cm_api.api_client import ApiResource, ApiException
-# pathos module allows to use
-# class methods in multiprocessing.
+import hashlib
+import json
+import posixpath
+import time
+
+from .cache import TTLCache
+from .commands import CommandTracker
+from .instrumentation import Instrumentation, instrumented
+
+# Time to live (in seconds) of cached cloudera manager entities.
+# Clusters and services are effectively immutable, roles carry state
+# and are kept for a short time only.
+DEFAULT_CACHE_TTLS = {
+    'cluster': 600,
+    'service': 600,
+    'hosts': 300,
+    'roles': 15,
+    'role_index': 15,
+    'role_names': 15,
+    'role_config_groups': 300,
+    'role_config_groups_full': 300,
+    'role_types': 3600,
+}
+
+# Config keys of ports returned by NiagaraCMApi.get_service_ports.
+SERVICE_PORT_KEYS = {'kafka': 'port', 'zookeeper': 'clientPort'}
+
+# Scopes of NiagaraCMApi.get_configs.
+CONFIG_SCOPES = ('service', 'group', 'role')
+
+# Config keys, which are unique per role by design and are not compared by
+# NiagaraCMApi.detect_config_drift (see check_broker_ids).
+DRIFT_IGNORED_KEYS = ('broker.id',)
+
+# Role fields, which changes are streamed by NiagaraCMApi.watch_roles.
+WATCHED_FIELDS = ('roleState', 'healthSummary', 'maintenanceMode', 'haStatus')
+
+
+def config_value(config, key, default=None):
+    """
+    Function gets value from config dictionary of summary (str values)
+    or full (ApiConfig values) view.
+    """
+    value = config.get(key, default)
+    try:
+        return value.value
+    except AttributeError:
+        return value
+
+
+def resolve_config(items):
+    """
+    Function resolves full view config list (JSON items with name, value
+    and default) to dictionary name:value, where value is override if set,
+    default otherwise.
+    """
+    config = {}
+    for item in items or []:
+        value = item.get('value')
+        config[item['name']] = value if value is not None else item.get('default')
+    return config
+
+
+def split_log_dirs(log_dirs):
+    return [log_dir.strip() for log_dir in (log_dirs or '').split(',') if log_dir.strip()]
+
+
+def plan_log_dirs(log_dirs, add=(), remove=()):
+    """
+    Function computes new log.dirs list. Dirs are matched as whole path
+    elements, so removing /data1 does not touch /data10.
+
+    Args:
+        log_dirs(list): Current log dirs.
+        add(list): Dirs to append, unless already present.
+        remove(list): Dirs to remove.
+
+    Returns:
+        New list of log dirs.
+    """
+    removed = set(posixpath.normpath(log_dir) for log_dir in remove)
+    new_log_dirs = [log_dir for log_dir in log_dirs if posixpath.normpath(log_dir) not in removed]
+    present = set(posixpath.normpath(log_dir) for log_dir in new_log_dirs)
+    for log_dir in add:
+        if posixpath.normpath(log_dir) not in present:
+            new_log_dirs.append(log_dir)
+            present.add(posixpath.normpath(log_dir))
+    return new_log_dirs
+
+
+def check_broker_ids(broker_ids):
+    """
+    Function finds brokers without broker.id and broker ids used by more than one broker.
+
+    Args:
+        broker_ids(dict): Dictionary hostname:broker.id.
+
+    Returns:
+        problems(dict): Dictionary with sorted list of hostnames without id ('missing')
+            and dictionary broker.id:hostnames of duplicated ids ('duplicates').
+    """
+    hostnames_by_id = {}
+    missing = []
+    for hostname, broker_id in broker_ids.items():
+        if broker_id is None:
+            missing.append(hostname)
+        else:
+            hostnames_by_id.setdefault(broker_id, []).append(hostname)
+    duplicates = dict(
+        (broker_id, sorted(hostnames)) for broker_id, hostnames in hostnames_by_id.items() if len(hostnames) > 1
+    )
+    return {'missing': sorted(missing), 'duplicates': duplicates}
+
+
+def normalize_config(config):
+    """
+    Function normalizes config values, so configs differing only in
+    whitespace around values or items of comma separated lists compare equal.
+    """
+    normalized = {}
+    for key, value in config.items():
+        if isinstance(value, basestring):
+            value = ','.join(item.strip() for item in value.split(',')) if ',' in value else value.strip()
+        normalized[key] = value
+    return normalized
+
+
+def role_overrides(node):
+    """
+    Function gets config overrides of role from full view of roles listing,
+    same as ApiRole.get_config in summary view.
+    """
+    return dict((item['name'], item['value']) for item in (node.get('config') or {}).get('items', [])
+                if item.get('value') is not None)
+
+
+def config_hash(config):
+    return hashlib.sha1(json.dumps(config, sort_keys=True)).hexdigest()
+
+
+def find_config_drift(configs):
+    """
+    Function groups identical configs by their hash and finds outliers. The
+    largest group (first hostname wins ties) is the reference config.
+
+    Args:
+        configs(dict): Dictionary hostname:{key: value} of normalized configs.
+
+    Returns:
+        drift(dict): Dictionary with groups (list of hash, hostnames and reference flag,
+            largest first) and outliers (dictionary hostname:{key: {'expected': value, 'actual': value}}).
+    """
+    hostnames_by_hash = {}
+    for hostname, config in configs.items():
+        hostnames_by_hash.setdefault(config_hash(config), []).append(hostname)
+    groups = sorted(((digest, sorted(hostnames)) for digest, hostnames in hostnames_by_hash.items()),
+                    key=lambda group: (-len(group[1]), group[1][0]))
+    outliers = {}
+    if groups:
+        reference = configs[groups[0][1][0]]
+        for digest, hostnames in groups[1:]:
+            config = configs[hostnames[0]]
+            diff = dict((key, {'expected': reference.get(key), 'actual': config.get(key)})
+                        for key in set(reference) | set(config) if reference.get(key) != config.get(key))
+            for hostname in hostnames:
+                outliers[hostname] = diff
+    return {
+        'groups': [{'hash': digest, 'hostnames': hostnames, 'reference': i == 0}
+                   for i, (digest, hostnames) in enumerate(groups)],
+        'outliers': outliers,
+    }
 
 
 class NiagaraCMApi(object):
-    def __init__(self, cm_host, user, password, cluster='cluster', port='7180', version=17):
+    """
+    Cloudera manager API client of one cluster.
+
+    Client is thread-safe and could be shared by many threads: cached
+    topology is loaded once for all of them (identical concurrent loads are
+    coalesced, see TTLCache.fetch) and shared transport (see
+    apicm.transport.PooledTransport) coalesces identical concurrent reads and
+    limits request rate of the whole process.
+    """
+
+    def __init__(self, cm_host, user, password, cluster='cluster', port='7180', version=17,
+                 cache_ttls=None, cache_size=1024, cache=None, timeout=None, instrumentation=None, transport=None):
         self.cm_host = cm_host
         self.user = user
         self.password = password
@@ -12,10 +191,163 @@ class NiagaraCMApi(object):
         self.port = port
         self.version = version
 
+        # cm_api is imported on first client creation, so importing apicm stays cheap.
+        from cm_api.api_client import ApiResource
+        # Authorization header is sent with every request, urllib2 auth handler answering
+        # 401 challenges is not thread-safe and doubles number of requests.
         self.api = ApiResource(server_host=self.cm_host, server_port=self.port,
                                username=self.user, password=self.password,
-                               version=self.version)
+                               version=self.version, timeout=timeout, preemptive_auth=True)
+        if transport is not None:
+            from .transport import TransportClient
+
+            # Transport (f.e. apicm.transport.PooledTransport) replaces urllib2 client of cm_api
+            # and handles retries itself, so cm_api does not retry GET requests again. Transport
+            # could be shared, every client instruments its own handle of it.
+            self.api._client = TransportClient(transport)
+            self.api.retries = 0
+        # Every request to cloudera manager is published to subscribers of instrumentation.
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+        self.instrumentation.instrument_client(self.api._client)
+
+        self.cache_ttls = dict(DEFAULT_CACHE_TTLS)
+        if cache_ttls is not None:
+            self.cache_ttls.update(cache_ttls)
+        # Cache could be shared between clients, f.e. by AsyncNiagaraCMApi workers.
+        self.cache = cache if cache is not None else TTLCache(maxsize=cache_size)
+
+    def _cached(self, key, loader):
+        return self.cache.fetch(key, self.cache_ttls.get(key[0], 0), loader)
+
+    def _get_cluster(self):
+        return self._cached(('cluster', self.cluster), lambda: self.api.get_cluster(self.cluster))
+
+    def _get_service(self, service_name):
+        return self._cached(('service', service_name), lambda: self._get_cluster().get_service(service_name))
+
+    def _get_roles(self, service_name, role):
+        return self._cached(
+            ('roles', service_name, role), lambda: self._get_service(service_name).get_roles_by_type(role)
+        )
+
+    def _get_role_index(self, service_name, role):
+        def build_index():
+            index = {}
+            for node in self._get_roles(service_name, role):
+                index.setdefault(self.get_hostname(node.hostRef.hostId), node)
+            return index
+        return self._cached(('role_index', service_name, role), build_index)
+
+    def _get_role_names(self, service_name):
+        return self._cached(
+            ('role_names', service_name),
+            lambda: dict((node.name, node) for node in self._get_service(service_name).get_all_roles())
+        )
+
+    def invalidate(self, service_name=None):
+        """
+        Method drops cached state. Called automatically after every method,
+        that changes state of cloudera manager.
+
+        Args:
+            service_name(str): Drop only roles and role config groups of this service.
+                If not set, whole cache is cleared.
+        """
+        if service_name is None:
+            self.cache.invalidate()
+        else:
+            self.cache.invalidate('roles', service_name)
+            self.cache.invalidate('role_index', service_name)
+            self.cache.invalidate('role_names', service_name)
+            self.cache.invalidate('role_config_groups', service_name)
+            self.cache.invalidate('role_config_groups_full', service_name)
+
+    @instrumented
+    def refresh_hosts(self):
+        """
+        Method fetches whole hosts listing with single request and rebuilds
+        hostId:hostname index and its reverse.
+        """
+        return self.cache.refresh(('hosts',), self.cache_ttls['hosts'], self._load_hosts)
+
+    def _load_hosts(self):
+        hostnames = {}
+        host_ids = {}
+        for host in self.api.get_all_hosts():
+            hostnames[host.hostId] = host.hostname
+            host_ids[host.hostname] = host.hostId
+        return hostnames, host_ids
+
+    def _get_hosts(self):
+        return self._cached(('hosts',), self._load_hosts)
+
+    @instrumented
+    def get_host_index(self):
+        """
+        Method gets index of all hosts known to cloudera manager. Index is built
+        on first use and reused until it expires or refresh_hosts is called.
+
+        Returns:
+            hostnames(dict): Dictionary hostId:hostname.
+        """
+        hostnames, _ = self._get_hosts()
+        return hostnames
+
+    @instrumented
+    def get_hostname(self, host_id):
+        """
+        Method resolves hostId to hostname using host index.
+
+        Args:
+            host_id(str): Cloudera manager host id (f.e. from role's hostRef).
+
+        Returns:
+            Hostname of the host.
+        """
+        hostname = self.get_host_index().get(host_id)
+        if hostname is None:
+            # Host could be added after index was built.
+            hostnames, _ = self.refresh_hosts()
+            hostname = hostnames.get(host_id)
+        if hostname is None:
+            hostname = self.api.get_host(host_id).hostname
+        return hostname
+
+    @instrumented
+    def get_host_id(self, hostname):
+        """
+        Method resolves hostname to hostId using host index.
+
+        Args:
+            hostname(str): Hostname of server.
 
+        Returns:
+            Cloudera manager host id or None if host is unknown.
+        """
+        _, host_ids = self._get_hosts()
+        host_id = host_ids.get(hostname)
+        if host_id is None:
+            _, host_ids = self.refresh_hosts()
+            host_id = host_ids.get(hostname)
+        return host_id
+
+    @instrumented
+    def iter_hosts_by_role(self, service_name, role, haStatus=None):
+        """
+        Method yields hostnames of all hosts that runs specific service and role,
+        one by one as they are resolved.
+
+        Args:
+            service_name(str): Name of service that runs under cloudera manager.
+            role(str): Role name (f.e. KAFKA_BROKER)
+            haStatus(str): Yield only ACTIVE roles if set to ACTIVE.
+        """
+        for server in self._get_roles(service_name, role):
+            if haStatus == 'ACTIVE' and server.haStatus != 'ACTIVE':
+                continue
+            yield self.get_hostname(server.hostRef.hostId)
+
+    @instrumented
     def get_hosts_by_role(self, service_name, role, haStatus=None):
         """
         Method gets all hosts that runs specific service and role.
@@ -28,57 +360,304 @@ class NiagaraCMApi(object):
             Sorted list of hostnames, that runs specific service and type.
 
         """
-        cluster = self.api.get_cluster(self.cluster)
-        service = cluster.get_service(service_name)
-        service_nodes = service.get_roles_by_type(role)
+        return list(self.iter_hosts_by_role(service_name, role, haStatus=haStatus))
+
+    @instrumented
+    def get_roles_on_host(self, hostname):
+        """
+        Method gets all roles of the cluster, that run on host. Host's roleRefs
+        are fetched with one request and resolved with roles index of every
+        service, which is cached and shared by all hosts.
+
+        Args:
+            hostname(str): Hostname of server.
+
+        Returns:
+            roles(list): List of dictionaries with service, type, name, roleState and haStatus,
+                sorted by service and role name. None if host is unknown.
+        """
+        host_id = self.get_host_id(hostname)
+        if host_id is None:
+            return None
         result = []
-        for server in service_nodes:
-            if haStatus == 'ACTIVE' and server.haStatus != 'ACTIVE':
+        for ref in self.api.get_host(host_id).roleRefs or []:
+            # Roles of other clusters and of cloudera management service are skipped.
+            if ref.clusterName != self.cluster:
                 continue
-            host_reference = server.hostRef.hostId
-            result.append(self.api.get_host(host_reference).hostname)
-        return result
+            node = self._get_role_names(ref.serviceName).get(ref.roleName)
+            if node is None:
+                # Role could be added after index was built.
+                self.cache.invalidate('role_names', ref.serviceName)
+                node = self._get_role_names(ref.serviceName).get(ref.roleName)
+            if node is None:
+                continue
+            result.append({
+                'service': ref.serviceName,
+                'type': node.type,
+                'name': node.name,
+                'roleState': node.roleState,
+                'haStatus': node.haStatus,
+            })
+        return sorted(result, key=lambda role: (role['service'], role['name']))
+
+    @instrumented
+    def get_role_by_hostname(self, nodename, service_name='kafka', role='KAFKA_BROKER'):
+        """
+        Method gets role of specific type, that runs on host.
+
+        Args:
+            nodename(str): Hostname of server.
+            service_name(str): Name of service that runs under cloudera manager.
+            role(str): Role name (f.e. KAFKA_BROKER)
+
+        Returns:
+            ApiRole object or None if host does not run such role.
+        """
+        return self._get_role_index(service_name, role).get(nodename)
+
+    @instrumented
+    def get_roles_by_hostnames(self, nodenames, service_name='kafka', role='KAFKA_BROKER'):
+        """
+        Method resolves roles for many hosts in one pass.
 
+        Args:
+            nodenames(list): Hostnames of servers.
+            service_name(str): Name of service that runs under cloudera manager.
+            role(str): Role name (f.e. KAFKA_BROKER)
+
+        Returns:
+            roles(dict): Dictionary hostname:ApiRole, None for hosts without such role.
+        """
+        index = self._get_role_index(service_name, role)
+        return dict((nodename, index.get(nodename)) for nodename in nodenames)
+
+    @instrumented
     def get_kafka_broker_id_by_hostname(self, nodename, role='KAFKA_BROKER', service_name='kafka'):
-        cluster = self.api.get_cluster(self.cluster)
-        service = cluster.get_service(service_name)
-        service_nodes = service.get_roles_by_type(role)
-        for node in service_nodes:
-            hostname = self.api.get_host(node.hostRef.hostId).hostname
-            if hostname == nodename:
-                broker_id = node.get_config()['broker.id']
-                return broker_id
+        node = self.get_role_by_hostname(nodename, service_name, role)
+        if node is not None:
+            broker_id = node.get_config()['broker.id']
+            return broker_id
+
+    @instrumented
+    def iter_all_kafka_broker_ids(self, role='KAFKA_BROKER', service_name='kafka'):
+        """
+        Method yields (hostname, broker.id) of every broker. Role configs of all
+        brokers are read with one request (full view of roles listing), hosts
+        are resolved with host index.
+
+        Args:
+            role(str): Role name (f.e. KAFKA_BROKER)
+            service_name(str): Name of service that runs under cloudera manager.
+        """
+        for hostname, _, overrides in self._iter_role_overrides(service_name, role):
+            yield hostname, overrides.get('broker.id')
+
+    @instrumented
+    def get_all_kafka_broker_ids(self, role='KAFKA_BROKER', service_name='kafka'):
+        """
+        Method gets broker.id of every broker (see iter_all_kafka_broker_ids).
+
+        Args:
+            role(str): Role name (f.e. KAFKA_BROKER)
+            service_name(str): Name of service that runs under cloudera manager.
+
+        Returns:
+            broker_ids(dict): Dictionary hostname:broker.id, None if broker has no broker.id.
+        """
+        return dict(self.iter_all_kafka_broker_ids(role=role, service_name=service_name))
+
+    def _get_role_config_groups_full(self, service_name):
+        def load():
+            response = self.api.get('/clusters/{0}/services/{1}/roleConfigGroups'.format(self.cluster, service_name),
+                                    params={'view': 'full'})
+            return dict((group['name'], {'roleType': group.get('roleType'),
+                                         'config': resolve_config((group.get('config') or {}).get('items'))})
+                        for group in response.get('items', []))
+        return self._cached(('role_config_groups_full', service_name), load)
+
+    @instrumented
+    def get_configs(self, service_name, keys, scope='group', role=None):
+        """
+        Method gets values of config keys, cloudera manager defaults are used
+        for keys without override. Service and group scopes cost one request
+        (all role config groups are read at once with full view), role scope
+        adds host index and roles listing with full view, which carries
+        overrides of all roles.
+
+        Args:
+            service_name(str): Name of service that runs under cloudera manager.
+            keys(list): Config keys (f.e. ['port', 'log.dirs']).
+            scope(str): service, group or role.
+            role(str): Role type (f.e. KAFKA_BROKER). Limits groups to the role type, required by role scope.
+
+        Returns:
+            configs(dict): Dictionary key:value for service scope, role config group name:{key: value}
+                for group scope, hostname:{key: value} for role scope. None for unknown keys.
+        """
+        if scope not in CONFIG_SCOPES:
+            raise ValueError('Unknown config scope {0}, expected one of {1}.'.format(scope, ', '.join(CONFIG_SCOPES)))
+        if scope == 'service':
+            response = self.api.get('/clusters/{0}/services/{1}/config'.format(self.cluster, service_name),
+                                    params={'view': 'full'})
+            config = resolve_config(response.get('items'))
+            return dict((key, config.get(key)) for key in keys)
+        if scope == 'role' and role is None:
+            raise ValueError('Role type is required by role scope.')
+        return dict(self.iter_configs(service_name, keys, scope=scope, role=role))
+
+    @instrumented
+    def iter_configs(self, service_name, keys, scope='group', role=None):
+        """
+        Method yields (name, {key: value}) records of group or role scope of
+        get_configs.
+
+        Args:
+            service_name(str): Name of service that runs under cloudera manager.
+            keys(list): Config keys (f.e. ['port', 'log.dirs']).
+            scope(str): group or role.
+            role(str): Role type (f.e. KAFKA_BROKER). Limits groups to the role type, required by role scope.
+        """
+        if scope not in ('group', 'role'):
+            raise ValueError('Only group and role config scopes could be iterated, got {0}.'.format(scope))
+
+        def project(config):
+            return dict((key, config.get(key)) for key in keys)
+
+        groups = self._get_role_config_groups_full(service_name)
+        if scope == 'group':
+            for name, group in groups.items():
+                if role is None or group['roleType'] == role:
+                    yield name, project(group['config'])
+            return
+
+        if role is None:
+            raise ValueError('Role type is required by role scope.')
+
+        for hostname, group_name, overrides in self._iter_role_overrides(service_name, role):
+            config = dict(groups.get(group_name, {'config': {}})['config'])
+            config.update(overrides)
+            yield hostname, project(config)
+
+    def _iter_role_overrides(self, service_name, role):
+        """
+        Method yields (hostname, role config group name, overrides) of every
+        role of type with one request (full view of roles listing).
+
+        Args:
+            service_name(str): Name of service that runs under cloudera manager.
+            role(str): Role type (f.e. KAFKA_BROKER).
+        """
+        hostnames = set()
+        for node in self._get_roles_full(service_name):
+            if node.get('type') != role:
+                continue
+            hostname = self.get_hostname(node['hostRef']['hostId'])
+            if hostname in hostnames:
+                continue
+            hostnames.add(hostname)
+            yield hostname, (node.get('roleConfigGroupRef') or {}).get('roleConfigGroupName'), role_overrides(node)
+
+    def _get_roles_full(self, service_name):
+        """
+        Method gets full view of service's roles listing, with config of every role.
+
+        Args:
+            service_name(str): Name of service that runs under cloudera manager.
+
+        Returns:
+            List of roles as JSON dictionaries.
+        """
+        # cm_api drops config from role listing, so the listing is read raw.
+        response = self.api.get('/clusters/{0}/services/{1}/roles'.format(self.cluster, service_name),
+                                params={'view': 'full'})
+        return response.get('items', [])
+
+    @instrumented
+    def detect_config_drift(self, service_name='kafka', role='KAFKA_BROKER', keys=None, ignore=DRIFT_IGNORED_KEYS,
+                            baseline=None):
+        """
+        Method finds roles, which config differs from config of most roles of
+        the same type. Effective config of every role (role config group
+        config with role overrides) is normalized and hashed, so identical
+        configs collapse into groups and only outliers are reported with
+        key-level diff. Overrides of all roles are read with one request.
+
+        Baseline keeps hash of every role's effective config between runs,
+        so roles which config changed since previous run (applied or not)
+        are reported as well.
+
+        Args:
+            service_name(str): Name of service that runs under cloudera manager.
+            role(str): Role type (f.e. KAFKA_BROKER).
+            keys(list): Compared config keys. Default: all keys overridden by any role.
+            ignore(list): Keys, which are not compared (f.e. broker.id).
+            baseline(dict): Dictionary hostname:config hash of previous run, JSON serializable, updated in place.
+
+        Returns:
+            drift(dict): Result of find_config_drift with compared keys, number of roles
+                and hostnames of roles changed since baseline (every role without baseline).
+        """
+        baseline = {} if baseline is None else baseline
+        groups = self._get_role_config_groups_full(service_name)
+        effective = {}
+        overridden = set()
+        for hostname, group_name, overrides in self._iter_role_overrides(service_name, role):
+            config = normalize_config(groups.get(group_name, {'config': {}})['config'])
+            config.update(normalize_config(overrides))
+            effective[hostname] = config
+            overridden.update(overrides)
+
+        hashes = dict((hostname, config_hash(config)) for hostname, config in effective.items())
+        changed = sorted(hostname for hostname, digest in hashes.items() if baseline.get(hostname) != digest)
+        # Roles removed from the service are dropped from baseline.
+        baseline.clear()
+        baseline.update(hashes)
 
+        if keys is None:
+            keys = overridden
+        keys = sorted(set(keys) - set(ignore or ()))
+        configs = dict((hostname, dict((key, config.get(key)) for key in keys))
+                       for hostname, config in effective.items())
+        drift = find_config_drift(configs)
+        drift.update({'keys': keys, 'roles': len(effective), 'changed': changed})
+        return drift
+
+    @instrumented
     def get_service_ports(self, service_name, role_config_group):
         """
-        Method gets ports of specific type of service.
+        Method gets port of specific type of service.
 
         Args:
             service_name(str): Name of service that runs under cloudera manager.
             role_config_group(str): Role config group name (f.e. kafka-KAFKA_BROKER-BASE)
 
         Returns:
-            ports(dict): Dictionary hostname:port.
+            port(str): Port of role config group, cloudera manager default if not overridden.
         """
-
-        cluster = self.api.get_cluster(self.cluster)
-        service = cluster.get_service(service_name)
-        config = service.get_role_config_group(role_config_group)
-        if service_name == 'kafka':
-            try:
-                kafka_port = config.config['port'].value
-            except AttributeError:
-                kafka_port = config.config['port']
-            return kafka_port
-        elif service_name == 'zookeeper':
-            try:
-                zk_port = config.config['clientPort'].value
-            except AttributeError:
-                zk_port = config.config['clientPort']
-            return zk_port
-        else:
+        if service_name not in SERVICE_PORT_KEYS:
             raise ValueError("Unknown service {0}".format(service_name))
+        key = SERVICE_PORT_KEYS[service_name]
+        groups = self.get_configs(service_name, [key])
+        if role_config_group not in groups:
+            raise ValueError("Unknown role config group {0}".format(role_config_group))
+        return groups[role_config_group][key]
+
+    @instrumented
+    def iter_all_role_config_groups(self, service_name):
+        """
+        Method yields names of all service's role config groups.
+
+        Args:
+            service_name(str): Name of service that runs under cloudera manager.
+        """
+        all_role_groups = self._cached(
+            ('role_config_groups', service_name),
+            lambda: self._get_service(service_name).get_all_role_config_groups()
+        )
+        for role_group in all_role_groups:
+            yield role_group.name
 
+    @instrumented
     def get_all_role_config_groups(self, service_name):
         """
         Method gets all service's role config groups names, that could be
@@ -90,92 +669,359 @@ class NiagaraCMApi(object):
         Returns:
             result(dict): Dictionary with all available role config groups names.
         """
+        return list(self.iter_all_role_config_groups(service_name))
 
-        cluster = self.api.get_cluster(self.cluster)
-        service = cluster.get_service(service_name)
-        all_role_groups = service.get_all_role_config_groups()
-        result = []
-        for role_group in all_role_groups:
-            result.append(role_group.name)
-        return result
-
+    @instrumented
     def get_log_dirs_for_kafka_broker(self, nodename, service_name='kafka', role='KAFKA_BROKER'):
-        cluster = self.api.get_cluster(self.cluster)
-        service = cluster.get_service(service_name)
-        service_nodes = service.get_roles_by_type(role)
-        for node in service_nodes:
-            hostname = self.api.get_host(node.hostRef.hostId).hostname
-            if hostname == nodename:
-                config = node.get_config()['log.dirs'].split(',')
-                return config
+        node = self.get_role_by_hostname(nodename, service_name, role)
+        if node is not None:
+            config = node.get_config()['log.dirs'].split(',')
+            return config
 
+    @instrumented
     def get_broker_status(self, nodename, service_name='kafka', role='KAFKA_BROKER'):
-        cluster = self.api.get_cluster(self.cluster)
-        service = cluster.get_service(service_name)
-        service_nodes = service.get_roles_by_type(role)
-        for node in service_nodes:
-            hostname = self.api.get_host(node.hostRef.hostId).hostname
-            if hostname == nodename:
-                return node.roleState, node.maintenanceMode
+        node = self.get_role_by_hostname(nodename, service_name, role)
+        if node is not None:
+            return node.roleState, node.maintenanceMode
+
+    @instrumented
+    def iter_service_status(self, service_name='kafka', role='KAFKA_BROKER'):
+        """
+        Method yields (hostname, status) of every role of given type, status
+        is the same as in get_service_status.
+
+        Args:
+            service_name(str): Name of service that runs under cloudera manager.
+            role(str): Role name (f.e. KAFKA_BROKER)
+        """
+        for hostname, node in self._get_role_index(service_name, role).items():
+            yield hostname, {
+                'role': node.name,
+                'roleState': node.roleState,
+                'healthSummary': node.healthSummary,
+                'maintenanceMode': node.maintenanceMode,
+                'haStatus': node.haStatus,
+                'configStalenessStatus': node.configStalenessStatus,
+                'healthChecks': [{'name': check.get('name'), 'summary': check.get('summary')}
+                                 for check in node.healthChecks or []],
+            }
+
+    @instrumented
+    def get_service_status(self, service_name='kafka', role='KAFKA_BROKER'):
+        """
+        Method gets status of every role of given type from one roles listing and host index.
+
+        Args:
+            service_name(str): Name of service that runs under cloudera manager.
+            role(str): Role name (f.e. KAFKA_BROKER)
 
+        Returns:
+            status(dict): Dictionary hostname:status, where status is dictionary with role name,
+                roleState, healthSummary, maintenanceMode, haStatus, configStalenessStatus and
+                healthChecks (list of dictionaries with name and summary).
+        """
+        return dict(self.iter_service_status(service_name, role))
+
+    @instrumented
     def kafka_broker_action(self, nodename, action, service_name='kafka', role='KAFKA_BROKER'):
-        cluster = self.api.get_cluster(self.cluster)
-        service = cluster.get_service(service_name)
-        service_nodes = service.get_roles_by_type(role)
-        for node in service_nodes:
-            hostname = self.api.get_host(node.hostRef.hostId).hostname
-            if hostname == nodename:
-                _, maintenance = self.get_broker_status(nodename=nodename)
-                if not maintenance:
-                    if action == 'start':
-                        cmd = service.start_roles(node.name)
-                    elif action == 'stop':
-                        cmd = service.stop_roles(node.name)
-                    elif action == 'restart':
-                        cmd = service.restart_roles(node.name)
-                    else:
-                        return 'Unknown action {0}'.format(action)
-
-                    cmd[0].wait()
-                    state, _ = self.get_broker_status(nodename=nodename)
-                    return state
+        node = self.get_role_by_hostname(nodename, service_name, role)
+        if node is not None:
+            service = self._get_service(service_name)
+            _, maintenance = self.get_broker_status(nodename=nodename, service_name=service_name, role=role)
+            if not maintenance:
+                if action == 'start':
+                    cmd = service.start_roles(node.name)
+                elif action == 'stop':
+                    cmd = service.stop_roles(node.name)
+                elif action == 'restart':
+                    cmd = service.restart_roles(node.name)
                 else:
-                    return maintenance
+                    return 'Unknown action {0}'.format(action)
 
-    def edit_log_dir_from_kafka_broker(self, nodename, log_dir, action, service_name='kafka', role='KAFKA_BROKER'):
-        cluster = self.api.get_cluster(self.cluster)
-        service = cluster.get_service(service_name)
-        service_nodes = service.get_roles_by_type(role)
-        for node in service_nodes:
-            hostname = self.api.get_host(node.hostRef.hostId).hostname
-            if hostname == nodename:
-                config = node.get_config()
                 try:
-                    log_dirs = config['log.dirs']
-                except KeyError:
-                    error = "No log dirs exists."
-                    log_dirs = ''
-                if action == 'remove':
-                    if log_dir in log_dirs:
-                        new_log_dirs = log_dirs.replace(log_dir, '').replace(',,', ',').strip(',')
-                    else:
-                        return 0, 'Log dir {0} is not in a config.'.format(log_dir)
-                elif action == 'add':
-                    if log_dir not in log_dirs:
-                        new_log_dirs = log_dirs + ',' + log_dir.replace(',,', ',').strip(',')
-                    else:
-                        return 0, 'Log dir {0} is already in a config.'.format(log_dir)
+                    CommandTracker(min_poll=1, max_poll=5).wait(cmd)
+                finally:
+                    self.invalidate(service_name)
+                state, _ = self.get_broker_status(nodename=nodename, service_name=service_name, role=role)
+                return state
+            else:
+                return maintenance
+
+    @instrumented
+    def kafka_brokers_action(self, action, nodenames=None, role_config_group=None, max_in_flight=10,
+                             poll_interval=1, timeout=None, service_name='kafka', role='KAFKA_BROKER'):
+        """
+        Method starts, stops or restarts many brokers. Role commands are
+        submitted in batches, so that at most max_in_flight brokers are
+        processed at once. Freed slots are refilled with one bulk request.
+
+        Args:
+            action(str): One of start, stop or restart.
+            nodenames(list): Hostnames of brokers.
+            role_config_group(str): Process all brokers of this role config group instead of nodenames.
+            max_in_flight(int): Max number of brokers processed at once.
+            poll_interval(int): Initial seconds between polls of running commands, grows while nothing changes.
+            timeout(int): Max amount of seconds to wait for one broker's command.
+            service_name(str): Name of service that runs under cloudera manager.
+            role(str): Role name (f.e. KAFKA_BROKER)
+
+        Yields:
+            (hostname, result) as soon as broker is processed. Result is broker's role state,
+            True if broker is in maintenance mode (broker is skipped), None if host does not
+            run a broker, or error message.
+
+        Raises:
+            ValueError: Unknown action or max_in_flight is less than 1.
+        """
+        service = self._get_service(service_name)
+        commands = {'start': service.start_roles, 'stop': service.stop_roles, 'restart': service.restart_roles}
+        if action not in commands:
+            raise ValueError('Unknown action {0}'.format(action))
+        if max_in_flight < 1:
+            raise ValueError('max_in_flight should be at least 1, got {0}'.format(max_in_flight))
+
+        index = self._get_role_index(service_name, role)
+        if role_config_group is not None:
+            nodenames = sorted(
+                hostname for hostname, node in index.items()
+                if node.roleConfigGroupRef is not None and
+                node.roleConfigGroupRef.roleConfigGroupName == role_config_group
+            )
+
+        hostnames = {}
+        pending = []
+        for nodename in nodenames or []:
+            node = index.get(nodename)
+            if node is None:
+                yield nodename, None
+            elif node.maintenanceMode:
+                yield nodename, node.maintenanceMode
+            else:
+                hostnames[node.name] = nodename
+                pending.append(node.name)
+
+        tracker = CommandTracker(list_active=service.get_commands, timeout=timeout,
+                                 min_poll=poll_interval, max_poll=max(poll_interval, 10))
+
+        def submit():
+            # Slots of commands that were not submitted are refilled right away, so
+            # remaining brokers are submitted even if whole batch failed.
+            errors = []
+            while pending and tracker.pending() < max_in_flight:
+                batch = pending[:max_in_flight - tracker.pending()]
+                del pending[:len(batch)]
+                submitted, batch_errors = self._match_role_commands(batch, commands[action](*batch))
+                for role_name, cmd in submitted.items():
+                    tracker.track(cmd, tag=role_name)
+                errors.extend(batch_errors)
+            return errors
+
+        for role_name, error in submit():
+            yield hostnames[role_name], 'Error: {0}'.format(error)
+        for finished in tracker.iter_rounds():
+            self.invalidate(service_name)
+            index = self._get_role_index(service_name, role)
+            for future in finished:
+                hostname = hostnames[future.tag]
+                node = index.get(hostname)
+                if future.timed_out:
+                    yield hostname, 'Error: command {0} timed out'.format(future.id)
+                elif future.success:
+                    yield hostname, node.roleState if node is not None else None
                 else:
-                    return 2, 'Error: unknown action {0}'.format(action)
-                new_config = config
-                new_config['log.dirs'] = new_log_dirs
-                try:
-                    node.update_config(new_config)
-                except ApiException as e:
-                    return 1, 'Error: {0}'.format(e)
+                    yield hostname, 'Error: {0}'.format(future.command.resultMessage)
+            for role_name, error in submit():
+                yield hostnames[role_name], 'Error: {0}'.format(error)
+
+    @staticmethod
+    def _match_role_commands(role_names, submitted):
+        """
+        Method maps commands of bulk role command to role names.
+
+        Returns:
+            Dictionary role name:ApiCommand and list of (role name, error) for roles without command.
+        """
+        commands = list(submitted)
+        matched = {}
+        if all(cmd.roleRef is not None for cmd in commands):
+            for cmd in commands:
+                matched[cmd.roleRef.roleName] = cmd
+        elif len(commands) == len(role_names):
+            matched.update(zip(role_names, commands))
+        errors = getattr(submitted, 'errors', None) or ['Command was not submitted.']
+        return matched, [(role_name, '; '.join(errors)) for role_name in role_names if role_name not in matched]
+
+    @instrumented
+    def edit_log_dir_from_kafka_broker(self, nodename, log_dir, action, service_name='kafka', role='KAFKA_BROKER'):
+        node = self.get_role_by_hostname(nodename, service_name, role)
+        if node is not None:
+            if action not in ('add', 'remove'):
+                return 2, 'Error: unknown action {0}'.format(action)
+            log_dirs = split_log_dirs(self.get_role_config_value(node, 'log.dirs', service_name))
+            if action == 'remove':
+                new_log_dirs = plan_log_dirs(log_dirs, remove=[log_dir])
+                if new_log_dirs == log_dirs:
+                    return 0, 'Log dir {0} is not in a config.'.format(log_dir)
+            else:
+                new_log_dirs = plan_log_dirs(log_dirs, add=[log_dir])
+                if new_log_dirs == log_dirs:
+                    return 0, 'Log dir {0} is already in a config.'.format(log_dir)
+            from cm_api.api_client import ApiException
+            try:
+                node.update_config({'log.dirs': ','.join(new_log_dirs)})
+            except ApiException as e:
+                return 1, 'Error: {0}'.format(e)
+            else:
+                self.invalidate(service_name)
+                return 0, 'Broker config updated.'
+
+    @instrumented
+    def get_role_config_value(self, node, key, service_name='kafka'):
+        """
+        Method gets effective value of role's config key: role override or,
+        if role does not override it, value of role's config group with
+        cloudera manager default resolved.
+
+        Args:
+            node(ApiRole): Role object.
+            key(str): Config key (f.e. log.dirs).
+            service_name(str): Name of service that runs under cloudera manager.
+
+        Returns:
+            Config value or None if it is not set neither on role nor on group.
+        """
+        value = node.get_config().get(key)
+        if value is None and node.roleConfigGroupRef is not None:
+            group = self._get_role_config_groups_full(service_name).get(node.roleConfigGroupRef.roleConfigGroupName)
+            if group is not None:
+                value = group['config'].get(key)
+        return value
+
+    @instrumented
+    def edit_kafka_log_dirs(self, changes, dry_run=False, workers=8, service_name='kafka', role='KAFKA_BROKER'):
+        """
+        Method adds and removes log dirs on many brokers concurrently. Every
+        broker's config is read once and only log.dirs key is written back,
+        brokers, which log dirs do not change, are not written at all.
+
+        Args:
+            changes(dict): Dictionary hostname:{'add': [dirs], 'remove': [dirs]}.
+            dry_run(bool): Only plan changes, do not write anything.
+            workers(int): Max number of brokers processed at once.
+            service_name(str): Name of service that runs under cloudera manager.
+            role(str): Role name (f.e. KAFKA_BROKER)
+
+        Returns:
+            result(dict): Dictionary hostname:plan, where plan is dictionary with old and new
+                log dirs lists and status: planned, updated, unchanged or error (with message).
+        """
+        from multiprocessing.pool import ThreadPool
+        from cm_api.api_client import ApiException
+
+        nodes = self.get_roles_by_hostnames(changes.keys(), service_name, role)
+
+        def edit(nodename):
+            plan = {'old': None, 'new': None, 'status': 'error', 'message': None}
+            node = nodes[nodename]
+            if node is None:
+                plan['message'] = 'Host does not run {0}.'.format(role)
+                return nodename, plan
+            try:
+                plan['old'] = split_log_dirs(self.get_role_config_value(node, 'log.dirs', service_name))
+                change = changes[nodename]
+                plan['new'] = plan_log_dirs(plan['old'], change.get('add', ()), change.get('remove', ()))
+                if plan['new'] == plan['old']:
+                    plan['status'] = 'unchanged'
+                elif dry_run:
+                    plan['status'] = 'planned'
                 else:
-                    return 0, 'Broker config updated.'
+                    node.update_config({'log.dirs': ','.join(plan['new'])})
+                    plan['status'] = 'updated'
+            except (ApiException, IOError) as e:
+                # Connection failures (URLError, CircuitOpenError) fail only this broker.
+                plan['message'] = 'Error: {0}'.format(e)
+            return nodename, plan
+
+        pool = ThreadPool(max(1, min(workers, len(changes))))
+        try:
+            result = dict(pool.map(self.instrumentation.bind(edit), changes.keys()))
+        finally:
+            pool.close()
+            if not dry_run:
+                self.invalidate(service_name)
+        return result
+
+    @instrumented
+    def watch_roles(self, service_name='kafka', role=None, hostnames=None, interval=1, max_interval=30):
+        """
+        Method polls all roles of service with one request per poll and yields
+        changes of WATCHED_FIELDS. Poll interval doubles up to max_interval while
+        nothing changes or polls fail and drops back to interval after a role change.
+
+        Args:
+            service_name(str): Name of service that runs under cloudera manager.
+            role(str): Watch only roles of this type (f.e. KAFKA_BROKER), all roles by default.
+            hostnames(list): Watch only roles on these hosts, all hosts by default.
+            interval(int): Min seconds between polls.
+            max_interval(int): Max seconds between polls.
+
+        Yields:
+            event(dict): Change of one role: time, service, role, type, hostname and
+                changes dictionary field:[old value, new value]. First poll reports
+                every role with old values None, removed roles report new values None.
+                Failed poll yields dictionary with time, service and error.
+        """
+        from cm_api.api_client import ApiException
+
+        known = {}
+        wait = interval
+        while True:
+            events = []
+            changed = False
+            try:
+                roles = self._get_service(service_name).get_all_roles()
+            except (ApiException, IOError) as e:
+                events.append({'time': time.time(), 'service': service_name, 'error': str(e)})
+            else:
+                now = time.time()
+                current = {}
+                for node in roles:
+                    if role is not None and node.type != role:
+                        continue
+                    hostname = self.get_hostname(node.hostRef.hostId)
+                    if hostnames is not None and hostname not in hostnames:
+                        continue
+                    current[node.name] = (node.type, hostname, dict((field, getattr(node, field, None))
+                                                                     for field in WATCHED_FIELDS))
+                empty = dict.fromkeys(WATCHED_FIELDS)
+                for name in sorted(set(known) | set(current)):
+                    role_type, hostname, old = known.get(name, (None, None, empty))
+                    role_type, hostname, new = current.get(name, (role_type, hostname, empty))
+                    changes = dict((field, [old[field], new[field]]) for field in WATCHED_FIELDS
+                                   if old[field] != new[field] or name not in known)
+                    if changes:
+                        events.append({'time': now, 'service': service_name, 'role': name, 'type': role_type,
+                                       'hostname': hostname, 'changes': changes})
+                known = current
+                changed = bool(events)
+
+            for event in events:
+                yield event
+            wait = interval if changed else min(wait * 2, max_interval)
+            time.sleep(wait)
+
+    @instrumented
+    def iter_role_types(self, service_name):
+        """
+        Method yields all service's role types.
+
+        Args:
+            service_name(str): Name of service that runs under cloudera manager.
+        """
+        for role_type in self.get_role_types(service_name):
+            yield role_type
 
+    @instrumented
     def get_role_types(self, service_name):
         """
         Methos gets all service's role names, that could be
@@ -190,9 +1036,9 @@ class NiagaraCMApi(object):
         :return:
         """
 
-        cluster = self.api.get_cluster(self.cluster)
-        service = cluster.get_service(service_name)
-        all_roles = service.get_role_types()
+        all_roles = self._cached(
+            ('role_types', service_name), lambda: self._get_service(service_name).get_role_types()
+        )
         return all_roles
 
 
@@ -0,0 +1,160 @@
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from .apicm import NiagaraCMApi
+from .cache import TTLCache
+from .instrumentation import Instrumentation
+
+PUBLIC_METHODS = (
+    'get_host_index',
+    'get_hostname',
+    'get_host_id',
+    'get_roles_on_host',
+    'get_role_by_hostname',
+    'get_roles_by_hostnames',
+    'get_hosts_by_role',
+    'get_kafka_broker_id_by_hostname',
+    'get_all_kafka_broker_ids',
+    'get_configs',
+    'detect_config_drift',
+    'get_service_ports',
+    'get_all_role_config_groups',
+    'get_log_dirs_for_kafka_broker',
+    'get_broker_status',
+    'get_service_status',
+    'kafka_broker_action',
+    'edit_log_dir_from_kafka_broker',
+    'get_role_types',
+)
+
+
+class AsyncNiagaraCMApi(object):
+    """
+    Concurrent counterpart of NiagaraCMApi.
+
+    Every public NiagaraCMApi method is mirrored and returns AsyncResult
+    instead of a value. Calls run on a bounded pool of worker threads.
+    Every worker keeps its own client and connection to cloudera manager,
+    while the cache is shared, so independent requests overlap their
+    latency instead of adding it up.
+
+    Example:
+        with AsyncNiagaraCMApi(cm_host, user, password) as cm:
+            kafka, zookeeper = gather([
+                cm.get_hosts_by_role('kafka', 'KAFKA_BROKER'),
+                cm.get_hosts_by_role('zookeeper', 'SERVER'),
+            ])
+    """
+
+    def __init__(self, cm_host, user, password, cluster='cluster', port='7180', version=17,
+                 workers=8, cache_ttls=None, cache_size=1024, instrumentation=None, transport=None):
+        self.cm_host = cm_host
+        self.user = user
+        self.password = password
+        self.cluster = cluster
+        self.port = port
+        self.version = version
+        self.cache_ttls = cache_ttls
+
+        self.cache = TTLCache(maxsize=cache_size)
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+        # Transport is thread safe and shared by all workers, so its pool bounds connections of all of them.
+        self.transport = transport
+        self.pool = ThreadPool(workers)
+        self._local = threading.local()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = NiagaraCMApi(self.cm_host, self.user, self.password, cluster=self.cluster,
+                                  port=self.port, version=self.version,
+                                  cache_ttls=self.cache_ttls, cache=self.cache,
+                                  instrumentation=self.instrumentation, transport=self.transport)
+            self._local.client = client
+        return client
+
+    def _call(self, method, args, kwargs):
+        return getattr(self._client(), method)(*args, **kwargs)
+
+    def submit(self, method, *args, **kwargs):
+        """
+        Method schedules NiagaraCMApi method call on worker pool.
+
+        Args:
+            method(str): Name of NiagaraCMApi method.
+
+        Returns:
+            AsyncResult of the call.
+        """
+        return self.pool.apply_async(self._call, (method, args, kwargs))
+
+    def map(self, method, calls, timeout=None):
+        """
+        Method calls one NiagaraCMApi method with many sets of arguments concurrently.
+
+        Args:
+            method(str): Name of NiagaraCMApi method.
+            calls(list): List of argument tuples or (args, kwargs) pairs.
+            timeout(int): Max amount of seconds to wait for all results.
+
+        Returns:
+            List of results in order of calls.
+        """
+        results = []
+        for call in calls:
+            if len(call) == 2 and isinstance(call[0], tuple) and isinstance(call[1], dict):
+                args, kwargs = call
+            else:
+                args, kwargs = call, {}
+            results.append(self.submit(method, *args, **kwargs))
+        return gather(results, timeout=timeout)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+def _mirror(name):
+    def method(self, *args, **kwargs):
+        return self.submit(name, *args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = 'Asynchronous NiagaraCMApi.{0}, returns AsyncResult.'.format(name)
+    return method
+
+
+for _name in PUBLIC_METHODS:
+    setattr(AsyncNiagaraCMApi, _name, _mirror(_name))
+
+
+def gather(results, timeout=None):
+    """
+    Function waits for many AsyncResults.
+
+    Args:
+        results(list): AsyncResults returned by AsyncNiagaraCMApi.
+        timeout(int): Max amount of seconds to wait for all results.
+
+    Returns:
+        List of values in order of results. First failed call re-raises its exception.
+
+    Raises:
+        multiprocessing.TimeoutError: Results are not ready in time.
+    """
+    deadline = None if timeout is None else time.time() + timeout
+    values = []
+    for result in results:
+        if deadline is None:
+            # AsyncResult.get without timeout can not be interrupted with Ctrl-C.
+            while not result.ready():
+                result.wait(1)
+            values.append(result.get())
+        else:
+            values.append(result.get(max(0, deadline - time.time())))
+    return values
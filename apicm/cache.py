@@ -0,0 +1,174 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.exc_info = None
+
+
+class SingleFlight(object):
+    """
+    Deduplicates concurrent calls with the same key: the first caller runs
+    the function, callers arriving while it runs wait for it and share its
+    result (or exception) instead of running the function again.
+    """
+
+    def __init__(self):
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        """
+        Method runs function or waits for running call with the same key.
+
+        Args:
+            key: Hashable key of the call.
+            function(callable): Function without arguments.
+
+        Returns:
+            Result of the function.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.exc_info is not None:
+                raise call.exc_info[0], call.exc_info[1], call.exc_info[2]
+            return call.value
+
+        try:
+            call.value = function()
+        except Exception:
+            call.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value
+
+
+class TTLCache(object):
+    """
+    Size bounded in-memory cache with per entry time to live and LRU eviction.
+
+    Keys are tuples, first element of the key is an entity kind
+    (f.e. ('roles', 'kafka', 'KAFKA_BROKER')), so related entries could be
+    invalidated by key prefix. Cache could be shared between threads,
+    loaders run outside of the lock and concurrent misses of the same key
+    are coalesced, so only one thread loads the value.
+    """
+
+    def __init__(self, maxsize=1024, timer=time.time):
+        self.maxsize = maxsize
+        self.timer = timer
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+        self._flights = SingleFlight()
+        # Bumped by invalidate, so values loaded before invalidation are not cached.
+        self._generation = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self._lookup(key) is not None
+
+    def _lookup(self, key):
+        with self._lock:
+            return self._lookup_locked(key)
+
+    def _lookup_locked(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < self.timer():
+            del self._data[key]
+            return None
+        # Move entry to the end, so least recently used entries are evicted first.
+        del self._data[key]
+        self._data[key] = entry
+        return entry
+
+    def get(self, key, default=None):
+        entry = self._lookup(key)
+        if entry is None:
+            return default
+        return entry[1]
+
+    def set(self, key, value, ttl):
+        if ttl <= 0:
+            return
+        with self._lock:
+            if key in self._data:
+                del self._data[key]
+            self._data[key] = (self.timer() + ttl, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def fetch(self, key, ttl, loader):
+        """
+        Method returns cached value or calls loader and caches its result.
+
+        Args:
+            key(tuple): Cache key.
+            ttl(int): Time to live of new entry in seconds, 0 disables caching.
+            loader(callable): Function without arguments, that loads value.
+
+        Returns:
+            Cached or freshly loaded value. Value loaded by concurrent call is shared.
+        """
+        entry = self._lookup(key)
+        if entry is not None:
+            return entry[1]
+        # Calls made after invalidation do not join loads started before it.
+        generation = self._generation
+        return self._flights.do((key, generation), lambda: self._load(key, ttl, loader, generation))
+
+    def refresh(self, key, ttl, loader):
+        """
+        Method loads value ignoring cached entry and caches it. Concurrent
+        refreshes and fetches of the key share one load.
+
+        Returns:
+            Freshly loaded value.
+        """
+        generation = self._generation
+        return self._flights.do((key, generation), lambda: self._load(key, ttl, loader, generation, reuse=False))
+
+    def _load(self, key, ttl, loader, generation, reuse=True):
+        # Value could be loaded by call, which finished after lookup of this one.
+        entry = self._lookup(key) if reuse else None
+        if entry is not None:
+            return entry[1]
+        value = loader()
+        with self._lock:
+            if generation == self._generation:
+                self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, *prefix):
+        """
+        Method removes all entries which keys start with prefix. Without prefix
+        whole cache is cleared.
+        """
+        with self._lock:
+            self._generation += 1
+            if not prefix:
+                self._data.clear()
+                return
+            for key in list(self._data):
+                if key[:len(prefix)] == prefix:
+                    del self._data[key]
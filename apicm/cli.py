@@ -0,0 +1,174 @@
+import importlib
+import json
+import sys
+from StringIO import StringIO
+
+# Subcommands of apicm command, same names as separate console scripts.
+COMMANDS = {
+    'get-kafka-brokers': ('cmd_line_scripts', 'get_kafka_brokers'),
+    'get-zk-nodes': ('cmd_line_scripts', 'get_zk_nodes'),
+    'get-zk-port': ('cmd_line_scripts', 'get_zk_ports'),
+    'get-kafka-port': ('cmd_line_scripts', 'get_kafka_ports'),
+    'get-kafka-roles': ('cmd_line_scripts', 'get_kafka_roles'),
+    'get-zk-roles': ('cmd_line_scripts', 'get_zk_roles'),
+    'get-kafka-role-groups': ('cmd_line_scripts', 'get_kafka_role_groups'),
+    'get-zk-role-groups': ('cmd_line_scripts', 'get_zk_role_groups'),
+    'get-hdfs-namenode': ('cmd_line_scripts', 'get_hdfs_namenode'),
+    'add-kafka-log-dir': ('cmd_line_scripts', 'add_kafka_log_dir'),
+    'remove-kafka-log-dir': ('cmd_line_scripts', 'remove_kafka_log_dir'),
+    'stop-kafka-broker': ('cmd_line_scripts', 'stop_kafka_broker'),
+    'start-kafka-broker': ('cmd_line_scripts', 'start_kafka_broker'),
+    'restart-kafka-broker': ('cmd_line_scripts', 'restart_kafka_broker'),
+    'get-kafka-broker-status': ('cmd_line_scripts', 'get_kafka_broker_status'),
+    'get-kafka-broker-log-dirs': ('cmd_line_scripts', 'get_log_dirs_list'),
+    'get-yarn-rm-host': ('cmd_line_scripts', 'get_yarn_resource_manager'),
+    'get-broker-id': ('cmd_line_scripts', 'get_broker_id'),
+    'get-broker-ids': ('cmd_line_scripts', 'get_broker_ids'),
+    'get-kafka-fleet-status': ('cmd_line_scripts', 'get_kafka_fleet_status'),
+    'get-zk-fleet-status': ('cmd_line_scripts', 'get_zk_fleet_status'),
+    'get-configs': ('cmd_line_scripts', 'get_configs'),
+    'get-host-roles': ('cmd_line_scripts', 'get_host_roles'),
+    'detect-config-drift': ('cmd_line_scripts', 'detect_config_drift'),
+    'start-kafka-brokers': ('cmd_line_scripts', 'start_kafka_brokers'),
+    'stop-kafka-brokers': ('cmd_line_scripts', 'stop_kafka_brokers'),
+    'restart-kafka-brokers': ('cmd_line_scripts', 'restart_kafka_brokers'),
+    'rolling-restart-kafka': ('cmd_line_scripts', 'rolling_restart_kafka'),
+    'edit-kafka-log-dirs': ('cmd_line_scripts', 'edit_kafka_log_dirs'),
+    'snapshot': ('cmd_line_scripts', 'create_snapshot'),
+    'daemon': ('daemon', 'main'),
+    'help': ('cmd_line_scripts', 'help'),
+}
+
+
+def get_command(command):
+    module_name, function_name = COMMANDS[command]
+    return getattr(importlib.import_module('.' + module_name, __package__), function_name)
+
+
+def run_command(command, args):
+    """
+    Function runs subcommand with its own command line arguments.
+
+    Args:
+        command(str): Name of subcommand (f.e. get-kafka-port).
+        args(list): Arguments of subcommand.
+
+    Returns:
+        Exit code of subcommand, 1 if it failed with exception (error is printed to stderr).
+    """
+    if command not in COMMANDS:
+        sys.stderr.write('Unknown command {0}. Run apicm help to list commands.\n'.format(command))
+        return 2
+    argv = sys.argv
+    sys.argv = [command] + list(args)
+    try:
+        get_command(command)()
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        sys.stderr.write('{0}\n'.format(e.code))
+        return 1
+    except Exception as e:
+        sys.stderr.write('Error: {0}: {1}\n'.format(command, e))
+        return 1
+    finally:
+        sys.argv = argv
+    return 0
+
+
+def read_batch(batch_file):
+    """
+    Function parses batch file: one command with its arguments per line,
+    empty lines and # comments are skipped.
+
+    Returns:
+        List of (line, argv) in order of batch file.
+    """
+    import shlex
+
+    commands = []
+    for line in batch_file:
+        argv = shlex.split(line, comments=True)
+        if argv:
+            commands.append((line.strip(), argv))
+    return commands
+
+
+def run_batch(commands, common_args=(), keep_going=False, ndjson=False, output=None):
+    """
+    Function runs many commands in one process, one after another. All
+    commands share one cloudera manager client and its cached topology.
+
+    Args:
+        commands(list): List of (line, argv) returned by read_batch.
+        common_args(list): Arguments appended to every command (f.e. --cm-host).
+        keep_going(bool): Run remaining commands after failed one.
+        ndjson(bool): Print one JSON object with command, status and output per command.
+        output(file): Where results are printed, stdout by default.
+
+    Returns:
+        Exit code of first failed command, 0 if all succeeded.
+    """
+    from .cmd_line_scripts import shared_clients
+
+    output = output or sys.stdout
+    exit_code = 0
+    with shared_clients():
+        for line, argv in commands:
+            if ndjson:
+                stdout = sys.stdout
+                sys.stdout = StringIO()
+                try:
+                    status = run_command(argv[0], argv[1:] + list(common_args))
+                    result = sys.stdout.getvalue()
+                finally:
+                    sys.stdout = stdout
+                output.write(json.dumps({'command': line, 'status': status, 'output': result}) + '\n')
+            else:
+                status = run_command(argv[0], argv[1:] + list(common_args))
+            output.flush()
+            if status and not exit_code:
+                exit_code = status
+            if status and not keep_going:
+                break
+    return exit_code
+
+
+def batch(args):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='apicm batch', description=(
+        'Run many apicm commands (one per line, read from stdin or --file) against one shared client. '
+        'Unknown arguments (f.e. --cm-host) are passed to every command.'))
+    parser.add_argument('-f', '--file', type=str, help='Batch file. Default: stdin.', default='-')
+    parser.add_argument('--keep-going', action='store_true', help='Run remaining commands after failed one.')
+    parser.add_argument('--ndjson', action='store_true',
+                        help='Print one JSON object with command, status and output per command.')
+    batch_args, common_args = parser.parse_known_args(args)
+    if batch_args.file == '-':
+        commands = read_batch(sys.stdin)
+    else:
+        with open(batch_args.file) as batch_file:
+            commands = read_batch(batch_file)
+    return run_batch(commands, common_args, keep_going=batch_args.keep_going, ndjson=batch_args.ndjson)
+
+
+def usage():
+    print 'Usage: apicm <command> [options]'
+    print '       apicm batch [--file FILE] [--keep-going] [--ndjson] [options] < commands'
+    print
+    print 'Commands:'
+    for command in sorted(COMMANDS):
+        print '    {0}'.format(command)
+    print
+    print 'Run apicm help for description of commands and options.'
+
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0] in ('-h', '--help'):
+        usage()
+        sys.exit(0 if args else 2)
+    if args[0] == 'batch':
+        sys.exit(batch(args[1:]))
+    sys.exit(run_command(args[0], args[1:]))
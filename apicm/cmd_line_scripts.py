@@ -1,13 +1,75 @@
-import argparse
+import atexit
+import json
 import os
 import sys
+from contextlib import contextmanager
 
 from apicm import NiagaraCMApi
+from .apicm import DRIFT_IGNORED_KEYS, check_broker_ids
+from .daemon_client import DaemonClient, DaemonUnavailable, default_socket_path, get_target
+
+# Modules, which are not needed by every command (cm_api, on-disk cache, snapshots,
+# rolling restart), are imported inside functions, so scripts start fast. Read-only
+# commands answered by apicm daemon or on-disk cache never import cm_api at all.
+
+# Results of these methods reflect current state of roles and are never cached on disk.
+VOLATILE_METHODS = frozenset(['get_broker_status', 'get_service_status', 'get_roles_on_host'])
+
+# Clients shared by all commands of one apicm batch, keyed by connection settings.
+_shared_clients = None
+
+
+@contextmanager
+def shared_clients():
+    """
+    Context manager, inside which every command reuses client (and its cached
+    topology) of previous command with the same connection settings.
+    """
+    global _shared_clients
+    _shared_clients = {}
+    try:
+        yield
+    finally:
+        _shared_clients = None
+
+
+def get_shared_client(key, factory):
+    if _shared_clients is None:
+        return factory()
+    if key not in _shared_clients:
+        _shared_clients[key] = factory()
+    return _shared_clients[key]
+
+
+class LazyClient(object):
+    """
+    Stand-in for NiagaraCMApi, which knows connection settings only. The real
+    client is created on first use of any of its methods.
+    """
+
+    def __init__(self, factory, cm_host, user, password, port, version, cluster='cluster'):
+        self._factory = factory
+        self._client = None
+        self.cm_host = cm_host
+        self.user = user
+        self.password = password
+        self.port = port
+        self.version = version
+        self.cluster = cluster
+
+    def __getattr__(self, name):
+        if self._client is None:
+            self._client = self._factory()
+        return getattr(self._client, name)
 
 
 def get_cm_api():
     args = parse_args()
 
+    if args.snapshot is not None:
+        from .snapshot import SnapshotNiagaraCMApi
+        return get_shared_client(('snapshot', args.snapshot), lambda: SnapshotNiagaraCMApi(args.snapshot)), args
+
     if args.cm_host is None:
         cm_host = os.getenv('CM_HOST')
     else:
@@ -46,127 +108,583 @@ def get_cm_api():
         )
         sys.exit(1)
 
-    cm = NiagaraCMApi(cm_host, cm_user, cm_pass, port=cm_port, version=cm_api_version)
+    def create_client():
+        transport = get_transport(args, cm_host, cm_user, cm_pass, cm_port, cm_api_version)
+        cm = NiagaraCMApi(cm_host, cm_user, cm_pass, port=cm_port, version=cm_api_version, transport=transport)
+        if args.profile:
+            from .instrumentation import CallCounter
+            atexit.register(print_profile, cm.instrumentation.subscribe(CallCounter()), transport)
+        return cm
+
+    cm = get_shared_client(
+        (cm_host, cm_user, cm_pass, cm_port, cm_api_version, args.profile),
+        lambda: LazyClient(create_client, cm_host, cm_user, cm_pass, cm_port, cm_api_version)
+    )
     return cm, args
 
 
+def get_transport(args, cm_host, user, password, port, version):
+    """
+    Function creates keep-alive transport of cloudera manager client.
+
+    Returns:
+        PooledTransport or None, if cm_api urllib2 client should be used (--no-keep-alive).
+    """
+    if args.no_keep_alive:
+        return None
+    from .transport import PooledTransport
+    return PooledTransport(cm_host, user, password, port=port, version=version, timeout=args.request_timeout,
+                           retries=args.retries, rate_limit=args.rate_limit)
+
+
+def print_profile(counter, transport=None):
+    sys.stderr.write('apicm profile: {0}\n'.format(counter.report()))
+    if transport is not None:
+        sys.stderr.write('apicm transport: {0}\n'.format(
+            ', '.join('{0}={1}'.format(key, value) for key, value in sorted(transport.stats().items()))))
+
+
+def require_online(args):
+    if args.snapshot is not None:
+        print 'This command changes cluster state and can not be used with --snapshot.'
+        sys.exit(1)
+
+
+def get_disk_cache(args):
+    if args.no_cache or not args.cache_dir:
+        return None
+    from .disk_cache import DiskCache
+    return DiskCache(args.cache_dir, ttl=args.cache_ttl)
+
+
+def query(cloudera_manager, args, method, *method_args, **method_kwargs):
+    """
+    Function calls read-only NiagaraCMApi method. If apicm daemon is running,
+    request is sent to the daemon. Otherwise, if on-disk cache is enabled,
+    result is answered from cache without touching cloudera manager.
+
+    Args:
+        cloudera_manager(NiagaraCMApi): Cloudera manager API client.
+        args(Namespace): Parsed command line arguments.
+        method(str): Name of NiagaraCMApi method.
+
+    Returns:
+        Result of the method call.
+    """
+    return _query(cloudera_manager, args, method, None, method_args, method_kwargs)
+
+
+def stream(cloudera_manager, args, method, iter_method, *method_args, **method_kwargs):
+    """
+    Function is streaming counterpart of query. With --format ndjson records
+    of iter_method (f.e. iter_hosts_by_role) are yielded as soon as they are
+    resolved, other formats print whole result anyway and get it from method.
+    Answers of apicm daemon, snapshot and on-disk cache come at once and are
+    iterated like iter_method: list items or (key, value) items of dictionary.
+
+    Returns:
+        Iterator over records of the method result.
+    """
+    if args.format != 'ndjson':
+        return _records(query(cloudera_manager, args, method, *method_args, **method_kwargs))
+    return _query(cloudera_manager, args, method, iter_method, method_args, method_kwargs)
+
+
+def _records(result):
+    return iter(result.items() if isinstance(result, dict) else result)
+
+
+def _cache_records(cache, key, records):
+    result = []
+    for record in records:
+        result.append(record)
+        yield record
+    # Only complete listings are cached.
+    cache.set(key, result)
+
+
+def _query(cloudera_manager, args, method, iter_method, method_args, method_kwargs):
+    if not args.no_daemon and args.snapshot is None:
+        try:
+            result = DaemonClient(args.socket).call(
+                get_target(cloudera_manager), method, *method_args, **method_kwargs
+            )
+            return result if iter_method is None else _records(result)
+        except DaemonUnavailable:
+            pass
+
+    def call():
+        if iter_method is None:
+            return getattr(cloudera_manager, method)(*method_args, **method_kwargs)
+        if args.snapshot is not None:
+            return _records(getattr(cloudera_manager, method)(*method_args, **method_kwargs))
+        return getattr(cloudera_manager, iter_method)(*method_args, **method_kwargs)
+
+    cache = get_disk_cache(args) if args.snapshot is None else None
+    if cache is None or method in VOLATILE_METHODS:
+        return call()
+
+    # Streamed records are cached apart from results of method.
+    key = [cloudera_manager.cm_host, cloudera_manager.port, cloudera_manager.cluster,
+           iter_method or method, list(method_args), method_kwargs]
+    if not args.refresh:
+        from .disk_cache import MISSING
+        result = cache.get(key)
+        if result is not MISSING:
+            return result if iter_method is None else iter(result)
+    if iter_method is not None:
+        return _cache_records(cache, key, call())
+    result = call()
+    cache.set(key, result)
+    return result
+
+
+def print_records(args, records, text=None, record_json=None):
+    """
+    Function prints records of listing in --format: text (one line per record),
+    ndjson (one JSON document per record, flushed as soon as record is resolved)
+    or json (one JSON list of all records).
+
+    Args:
+        args(Namespace): Parsed command line arguments.
+        records(iterable): Records of listing (f.e. returned by stream).
+        text(function): Text line of record. Default: str.
+        record_json(function): JSON serializable form of record. Default: record itself.
+    """
+    record_json = record_json or (lambda record: record)
+    if args.format == 'json':
+        print json.dumps([record_json(record) for record in records], sort_keys=True)
+        return
+    for record in records:
+        if args.format == 'ndjson':
+            sys.stdout.write(json.dumps(record_json(record), sort_keys=True) + '\n')
+        else:
+            print text(record) if text is not None else record
+        sys.stdout.flush()
+
+
+def keyed_json(key_name):
+    """
+    Function makes JSON form of (key, dictionary) record: the dictionary with key stored as key_name.
+    """
+    def record_json(record):
+        key, value = record
+        result = dict(value)
+        result[key_name] = key
+        return result
+    return record_json
+
+
+def result_text(record):
+    hostname, message = record
+    return '{0} {1}'.format(hostname, message)
+
+
+def result_json(record):
+    hostname, message = record
+    return {'hostname': hostname, 'result': message}
+
+
+def print_value(args, value, text=None):
+    """
+    Function prints single result in --format: text (value or text) or JSON
+    document (json and ndjson).
+    """
+    if args.format in ('json', 'ndjson'):
+        print json.dumps(value, sort_keys=True)
+    else:
+        print text if text is not None else value
+
+
+def invalidate_disk_cache(args):
+    cache = get_disk_cache(args)
+    if cache is not None:
+        cache.clear()
+
+
 def get_hdfs_namenode():
     cloudera_manager, args = get_cm_api()
-    namenodes = cloudera_manager.get_hosts_by_role('hdfs', 'NAMENODE', haStatus='ACTIVE')
-    for namenode in namenodes:
-        print namenode
+    namenodes = stream(cloudera_manager, args, 'get_hosts_by_role', 'iter_hosts_by_role', 'hdfs', 'NAMENODE',
+                       haStatus='ACTIVE')
+    print_records(args, namenodes)
 
 
 def get_kafka_brokers():
     cloudera_manager, args = get_cm_api()
-    kafka_hosts = cloudera_manager.get_hosts_by_role('kafka', 'KAFKA_BROKER')
-    for kafka_host in kafka_hosts:
-        print kafka_host
+    kafka_hosts = stream(cloudera_manager, args, 'get_hosts_by_role', 'iter_hosts_by_role', 'kafka', 'KAFKA_BROKER')
+    print_records(args, kafka_hosts)
 
 
 def get_zk_nodes():
     cloudera_manager, args = get_cm_api()
-    zookeeper_hosts = cloudera_manager.get_hosts_by_role('zookeeper', 'SERVER')
-    for zookeeper_host in zookeeper_hosts:
-        print zookeeper_host
+    zookeeper_hosts = stream(cloudera_manager, args, 'get_hosts_by_role', 'iter_hosts_by_role', 'zookeeper', 'SERVER')
+    print_records(args, zookeeper_hosts)
 
 
 def get_zk_ports():
     cloudera_manager, args = get_cm_api()
-    zookeeper_port = cloudera_manager.get_service_ports('zookeeper', 'zookeeper-SERVER-BASE')
-    print zookeeper_port
+    zookeeper_port = query(cloudera_manager, args, 'get_service_ports', 'zookeeper', 'zookeeper-SERVER-BASE')
+    print_value(args, zookeeper_port)
 
 
 def get_kafka_ports():
     cloudera_manager, args = get_cm_api()
-    kafka_port = cloudera_manager.get_service_ports('kafka', 'kafka-KAFKA_BROKER-BASE')
-    print kafka_port
+    kafka_port = query(cloudera_manager, args, 'get_service_ports', 'kafka', 'kafka-KAFKA_BROKER-BASE')
+    print_value(args, kafka_port)
 
 
 def get_kafka_roles():
     cloudera_manager, args = get_cm_api()
-    kafka_roles = cloudera_manager.get_role_types('kafka')
-    for role in kafka_roles:
-        print role
+    kafka_roles = stream(cloudera_manager, args, 'get_role_types', 'iter_role_types', 'kafka')
+    print_records(args, kafka_roles)
 
 
 def get_zk_roles():
     cloudera_manager, args = get_cm_api()
-    zk_roles = cloudera_manager.get_role_types('zookeeper')
-    for role in zk_roles:
-        print role
+    zk_roles = stream(cloudera_manager, args, 'get_role_types', 'iter_role_types', 'zookeeper')
+    print_records(args, zk_roles)
 
 
 def get_kafka_role_groups():
     cloudera_manager, args = get_cm_api()
-    kafka_roles_groups = cloudera_manager.get_all_role_config_groups('kafka')
-    for role in kafka_roles_groups:
-        print role
+    kafka_roles_groups = stream(cloudera_manager, args, 'get_all_role_config_groups', 'iter_all_role_config_groups',
+                                'kafka')
+    print_records(args, kafka_roles_groups)
 
 
 def get_zk_role_groups():
     cloudera_manager, args = get_cm_api()
-    zk_roles_groups = cloudera_manager.get_all_role_config_groups('zookeeper')
-    for role in zk_roles_groups:
-        print role
+    zk_roles_groups = stream(cloudera_manager, args, 'get_all_role_config_groups', 'iter_all_role_config_groups',
+                             'zookeeper')
+    print_records(args, zk_roles_groups)
 
 
 def add_kafka_log_dir():
     cloudera_manager, args = get_cm_api()
+    require_online(args)
     ret_code, message = cloudera_manager.edit_log_dir_from_kafka_broker(args.hostname, args.log_dir, 'add')
-    print message
+    invalidate_disk_cache(args)
+    print_value(args, message)
 
 
 def remove_kafka_log_dir():
     cloudera_manager, args = get_cm_api()
+    require_online(args)
     ret_code, message = cloudera_manager.edit_log_dir_from_kafka_broker(args.hostname, args.log_dir, 'remove')
-    print message
+    invalidate_disk_cache(args)
+    print_value(args, message)
+
+
+def edit_kafka_log_dirs():
+    cloudera_manager, args = get_cm_api()
+    require_online(args)
+    if args.changes is not None:
+        with open(args.changes) as changes_file:
+            changes = json.load(changes_file)
+    elif args.hostnames is not None:
+        change = {'add': args.add_log_dirs.split(',') if args.add_log_dirs else [],
+                  'remove': args.remove_log_dirs.split(',') if args.remove_log_dirs else []}
+        changes = dict((hostname, change) for hostname in args.hostnames.split(','))
+    else:
+        print 'Either --changes or --hostnames should be provided.'
+        sys.exit(1)
+
+    result = cloudera_manager.edit_kafka_log_dirs(changes, dry_run=args.dry_run, workers=args.max_in_flight)
+    if not args.dry_run:
+        invalidate_disk_cache(args)
+    def text(item):
+        hostname, plan = item
+        if plan['status'] == 'error':
+            return '{0} {1} {2}'.format(hostname, plan['status'], plan['message'])
+        return '{0} {1} {2} -> {3}'.format(hostname, plan['status'], ','.join(plan['old']), ','.join(plan['new']))
+
+    print_records(args, sorted(result.items()), text, keyed_json('hostname'))
+    if any(plan['status'] == 'error' for plan in result.values()):
+        sys.exit(1)
 
 
 def start_kafka_broker():
     cloudera_manager, args = get_cm_api()
+    require_online(args)
     message = cloudera_manager.kafka_broker_action(nodename=args.hostname, action='start')
-    print message
+    print_value(args, message)
 
 
 def stop_kafka_broker():
     cloudera_manager, args = get_cm_api()
+    require_online(args)
     message = cloudera_manager.kafka_broker_action(nodename=args.hostname, action='stop')
-    print message
+    print_value(args, message)
 
 
 def restart_kafka_broker():
     cloudera_manager, args = get_cm_api()
+    require_online(args)
     message = cloudera_manager.kafka_broker_action(nodename=args.hostname, action='restart')
-    print message
+    print_value(args, message)
+
+
+def kafka_brokers_action(action):
+    cloudera_manager, args = get_cm_api()
+    require_online(args)
+    nodenames = args.hostnames.split(',') if args.hostnames else None
+    if nodenames is None and args.role_group is None:
+        print 'Either --hostnames or --role-group should be provided.'
+        sys.exit(1)
+    results = cloudera_manager.kafka_brokers_action(
+        action, nodenames=nodenames, role_config_group=args.role_group, max_in_flight=args.max_in_flight
+    )
+    print_records(args, results, result_text, result_json)
+
+
+def start_kafka_brokers():
+    kafka_brokers_action('start')
+
+
+def stop_kafka_brokers():
+    kafka_brokers_action('stop')
+
+
+def restart_kafka_brokers():
+    kafka_brokers_action('restart')
+
+
+def rolling_restart_kafka():
+    from .rolling_restart import RollingRestart, RollingRestartError
+
+    cloudera_manager, args = get_cm_api()
+    require_online(args)
+    nodenames = args.hostnames.split(',') if args.hostnames else None
+    rollout = RollingRestart(cloudera_manager, batch_size=args.batch_size, state_file=args.state_file,
+                             timeout=args.timeout)
+    try:
+        print_records(args, rollout.run(nodenames), result_text, result_json)
+    except RollingRestartError as e:
+        print 'Error: {0}'.format(e)
+        sys.exit(1)
 
 
 def get_kafka_broker_status():
     cloudera_manager, args = get_cm_api()
-    message = cloudera_manager.get_broker_status(nodename=args.hostname)
-    print message
+    if args.watch:
+        watch_roles(cloudera_manager, args, 'kafka', 'KAFKA_BROKER')
+        return
+    message = query(cloudera_manager, args, 'get_broker_status', nodename=args.hostname)
+    print_value(args, message)
+
+
+def print_service_status(service_name, role):
+    cloudera_manager, args = get_cm_api()
+    if args.format == 'ndjson':
+        status = stream(cloudera_manager, args, 'get_service_status', 'iter_service_status', service_name, role)
+        print_records(args, status, record_json=keyed_json('hostname'))
+        return
+    status = query(cloudera_manager, args, 'get_service_status', service_name, role)
+    if args.format == 'json':
+        print json.dumps(status, sort_keys=True)
+        return
+    row = '{0:<40} {1:<10} {2:<12} {3:<11} {4:<10} {5:<18} {6}'
+    print row.format('HOSTNAME', 'STATE', 'HEALTH', 'MAINTENANCE', 'HA', 'CONFIG', 'FAILING CHECKS')
+    for hostname in sorted(status):
+        node = status[hostname]
+        failing = [check['name'] for check in node['healthChecks'] if check['summary'] not in ('GOOD', 'DISABLED')]
+        print row.format(hostname, node['roleState'], node['healthSummary'], str(node['maintenanceMode']),
+                         node['haStatus'] or '-', node['configStalenessStatus'], ','.join(failing) or '-')
+
+
+def get_kafka_fleet_status():
+    print_service_status('kafka', 'KAFKA_BROKER')
+
+
+def get_zk_fleet_status():
+    print_service_status('zookeeper', 'SERVER')
+
+
+def get_host_roles():
+    cloudera_manager, args = get_cm_api()
+    if args.hostname is None:
+        print 'Hostname should be provided with --hostname.'
+        sys.exit(1)
+    roles = query(cloudera_manager, args, 'get_roles_on_host', args.hostname)
+    if roles is None:
+        print 'Host {0} is not known to cloudera manager.'.format(args.hostname)
+        sys.exit(1)
+    if args.format in ('json', 'ndjson'):
+        print_records(args, roles)
+        return
+    row = '{0:<16} {1:<24} {2:<48} {3:<10} {4}'
+    print row.format('SERVICE', 'TYPE', 'NAME', 'STATE', 'HA')
+    for role in roles:
+        print row.format(role['service'], role['type'], role['name'], role['roleState'], role['haStatus'] or '-')
+
+
+def get_configs():
+    cloudera_manager, args = get_cm_api()
+    if not args.keys:
+        print 'Config keys should be provided with --keys.'
+        sys.exit(1)
+    keys = args.keys.split(',')
+    if args.scope == 'role' and args.role_type is None:
+        print 'Role type should be provided with --role-type.'
+        sys.exit(1)
+    if args.format == 'ndjson' and args.scope != 'service':
+        configs = stream(cloudera_manager, args, 'get_configs', 'iter_configs', args.service, keys, scope=args.scope,
+                         role=args.role_type)
+        print_records(args, configs, record_json=keyed_json('name'))
+        return
+    configs = query(cloudera_manager, args, 'get_configs', args.service, keys, scope=args.scope, role=args.role_type)
+    if args.format in ('json', 'ndjson'):
+        print json.dumps(configs, sort_keys=True)
+    elif args.scope == 'service':
+        for key in keys:
+            print key, configs[key]
+    else:
+        print ' '.join(['NAME'] + keys)
+        for name in sorted(configs):
+            print ' '.join([name] + [str(configs[name][key]) for key in keys])
+
+
+def load_baseline(path):
+    if path is None or not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as baseline_file:
+            return json.load(baseline_file)
+    except ValueError:
+        sys.stderr.write('Warning: baseline {0} is unreadable and is rebuilt.\n'.format(path))
+        return {}
+
+
+def save_baseline(path, baseline):
+    import tempfile
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.tmp-')
+    with os.fdopen(fd, 'w') as tmp_file:
+        json.dump(baseline, tmp_file)
+    os.rename(tmp_path, path)
+
+
+def detect_config_drift():
+    cloudera_manager, args = get_cm_api()
+    if args.snapshot is not None:
+        print 'Config drift is detected against cloudera manager and can not be used with --snapshot.'
+        sys.exit(1)
+    role_type = args.role_type or ('KAFKA_BROKER' if args.service == 'kafka' else None)
+    if role_type is None:
+        print 'Role type should be provided with --role-type.'
+        sys.exit(1)
+    keys = args.keys.split(',') if args.keys else None
+    ignore = [key for key in args.ignore.split(',') if key]
+    baseline = load_baseline(args.baseline)
+    drift = cloudera_manager.detect_config_drift(args.service, role_type, keys=keys, ignore=ignore,
+                                                 baseline=baseline)
+    if args.baseline is not None:
+        save_baseline(args.baseline, baseline)
+
+    outliers = sorted(drift['outliers'].items())
+    if args.format == 'json':
+        print json.dumps(drift, sort_keys=True)
+    elif args.format == 'ndjson':
+        print_records(args, outliers, record_json=lambda record: {'hostname': record[0], 'diff': record[1]})
+    else:
+        print '{0} roles, {1} distinct configs, {2} outliers.'.format(
+            drift['roles'], len(drift['groups']), len(outliers))
+        if args.baseline is not None:
+            print 'Config changed since baseline: {0}'.format(', '.join(drift['changed']) or 'none')
+        for hostname, diff in outliers:
+            for key in sorted(diff):
+                print '{0} {1}: {2} (expected {3})'.format(hostname, key, diff[key]['actual'], diff[key]['expected'])
+    if outliers:
+        sys.exit(1)
+
+
+def watch_roles(cloudera_manager, args, service_name, role):
+    require_online(args)
+    hostnames = None
+    if args.hostnames:
+        hostnames = args.hostnames.split(',')
+    elif args.hostname:
+        hostnames = [args.hostname]
+    events = cloudera_manager.watch_roles(service_name, role, hostnames=hostnames, interval=args.interval,
+                                          max_interval=args.max_interval)
+    try:
+        for event in events:
+            print json.dumps(event, sort_keys=True)
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
 
 
 def get_log_dirs_list():
     cloudera_manager, args = get_cm_api()
-    message = cloudera_manager.get_log_dirs_for_kafka_broker(nodename=args.hostname)
-    print message
+    message = query(cloudera_manager, args, 'get_log_dirs_for_kafka_broker', nodename=args.hostname)
+    if args.format == 'text':
+        print message
+    else:
+        print_records(args, message or [])
 
 
 def get_yarn_resource_manager():
     cloudera_manager, args = get_cm_api()
-    message = cloudera_manager.get_hosts_by_role(service_name=args.yarn_service_name, role='RESOURCEMANAGER', haStatus='ACTIVE')
-    for host in message:
-        print host
+    message = stream(
+        cloudera_manager, args, 'get_hosts_by_role', 'iter_hosts_by_role',
+        service_name=args.yarn_service_name, role='RESOURCEMANAGER', haStatus='ACTIVE'
+    )
+    print_records(args, message)
 
 
 def get_broker_id():
     cloudera_manager, args = get_cm_api()
-    message = cloudera_manager.get_kafka_broker_id_by_hostname(nodename=args.hostname)
-    print message
+    message = query(cloudera_manager, args, 'get_kafka_broker_id_by_hostname', nodename=args.hostname)
+    print_value(args, message)
+
+
+def create_snapshot():
+    from .snapshot import build_snapshot, write_snapshot
+
+    cloudera_manager, args = get_cm_api()
+    require_online(args)
+    if args.output is None:
+        print 'Snapshot file should be provided with --output.'
+        sys.exit(1)
+    write_snapshot(build_snapshot(cloudera_manager), args.output)
+    print_value(args, {'snapshot': args.output}, 'Snapshot written to {0}.'.format(args.output))
+
+
+def get_broker_ids():
+    cloudera_manager, args = get_cm_api()
+    if args.format == 'ndjson':
+        broker_ids = {}
+
+        def collect(record):
+            hostname, broker_id = record
+            broker_ids[hostname] = broker_id
+            return {'hostname': hostname, 'broker.id': broker_id}
+
+        print_records(args, stream(cloudera_manager, args, 'get_all_kafka_broker_ids', 'iter_all_kafka_broker_ids'),
+                      record_json=collect)
+    else:
+        broker_ids = query(cloudera_manager, args, 'get_all_kafka_broker_ids')
+    problems = check_broker_ids(broker_ids)
+    if args.format == 'json':
+        print json.dumps({'broker_ids': broker_ids, 'missing': problems['missing'],
+                          'duplicates': problems['duplicates']}, sort_keys=True)
+    else:
+        if args.format == 'text':
+            for hostname in sorted(broker_ids):
+                print hostname, broker_ids[hostname]
+        for hostname in problems['missing']:
+            sys.stderr.write('Warning: {0} has no broker.id.\n'.format(hostname))
+        for broker_id in sorted(problems['duplicates']):
+            sys.stderr.write('Warning: broker.id {0} is used by {1}.\n'.format(
+                broker_id, ', '.join(problems['duplicates'][broker_id])))
+    if problems['missing'] or problems['duplicates']:
+        sys.exit(1)
 
 
 def parse_args():
+    import argparse
+
     parser = argparse.ArgumentParser()
     parser.add_argument('--cm-host', type=str, help='Host with cloudera manager.', default=None)
     parser.add_argument('-u', '--user', type=str, help="Cloudera manager user.", default=None)
@@ -175,7 +693,65 @@ def parse_args():
     parser.add_argument('--api-version', type=str, help="Cloudera manager API version. Default: 17.", default='17')
     parser.add_argument('--log-dir', type=str, help='Log directory to remove or add', default=None)
     parser.add_argument('--hostname', type=str, help='Hostname of server.', default=None)
+    parser.add_argument('--hostnames', type=str, help='Comma separated hostnames of servers.', default=None)
+    parser.add_argument('--role-group', type=str, help='Role config group name (f.e. kafka-KAFKA_BROKER-BASE).',
+                        default=None)
+    parser.add_argument('--service', type=str, help='Name of the service. Default: kafka.', default='kafka')
+    parser.add_argument('--role-type', type=str, help='Role type (f.e. KAFKA_BROKER).', default=None)
+    parser.add_argument('--keys', type=str, help='Comma separated config keys (f.e. port,log.dirs).', default=None)
+    parser.add_argument('--scope', type=str, choices=['service', 'group', 'role'], default='group',
+                        help='Config of service, every role config group or every role. Default: group.')
+    parser.add_argument('--ignore', type=str, default=','.join(DRIFT_IGNORED_KEYS),
+                        help='Comma separated config keys not compared by detect-config-drift. Default: {0}.'.format(
+                            ','.join(DRIFT_IGNORED_KEYS)))
+    parser.add_argument('--baseline', type=str, default=None,
+                        help='JSON file with role config hashes of previous detect-config-drift run, updated after run.')
+    parser.add_argument('--max-in-flight', type=int, help='Max number of brokers processed at once. Default: 10.',
+                        default=10)
     parser.add_argument('--yarn-service-name', type=str, help='Name of the yarn service.', default='yarn')
+    parser.add_argument('--changes', type=str, default=None,
+                        help='JSON file with log dirs changes: {"hostname": {"add": [dirs], "remove": [dirs]}}.')
+    parser.add_argument('--add-log-dirs', type=str, help='Comma separated log dirs to add to --hostnames.',
+                        default=None)
+    parser.add_argument('--remove-log-dirs', type=str, help='Comma separated log dirs to remove from --hostnames.',
+                        default=None)
+    parser.add_argument('--dry-run', action='store_true', help='Only print planned changes.')
+    parser.add_argument('--batch-size', type=int, help='Number of brokers restarted at once. Default: 1.', default=1)
+    parser.add_argument('--state-file', type=str, help='File with state of rolling restart, used to resume it.',
+                        default=None)
+    parser.add_argument('--timeout', type=int, help='Seconds to wait for restart command and healthy brokers. Default: 600.',
+                        default=600)
+    parser.add_argument('--watch', action='store_true',
+                        help='Stream changes of role state as JSON lines instead of printing it once.')
+    parser.add_argument('--interval', type=int, help='Min seconds between polls of --watch. Default: 1.', default=1)
+    parser.add_argument('--max-interval', type=int, help='Max seconds between polls of --watch. Default: 30.',
+                        default=30)
+    parser.add_argument('--format', type=str, choices=['text', 'json', 'ndjson'], default='text',
+                        help='Output format: text, one JSON document or JSON line per record. Default: text.')
+    parser.add_argument('--snapshot', type=str, default=os.getenv('APICM_SNAPSHOT'),
+                        help='Answer from snapshot file written by apicm-snapshot instead of cloudera manager.')
+    parser.add_argument('--output', type=str, help='Output file of apicm-snapshot, gzipped if ends with .gz.',
+                        default=None)
+    parser.add_argument('--cache-dir', type=str, help='Directory of on-disk topology cache. Cache is disabled if not set.',
+                        default=os.getenv('APICM_CACHE_DIR'))
+    parser.add_argument('--cache-ttl', type=int, help='Time to live of on-disk cache entries in seconds. Default: 300.',
+                        default=int(os.getenv('APICM_CACHE_TTL', 300)))
+    parser.add_argument('--no-cache', action='store_true', help='Do not use on-disk topology cache.')
+    parser.add_argument('--refresh', action='store_true', help='Refresh on-disk topology cache from cloudera manager.')
+    parser.add_argument('--socket', type=str, help='Unix socket of apicm daemon.', default=default_socket_path())
+    parser.add_argument('--no-daemon', action='store_true', help='Do not send requests to apicm daemon.')
+    parser.add_argument('--profile', action='store_true',
+                        help='Print number of cloudera manager requests and their latency per method on exit.')
+    parser.add_argument('--request-timeout', type=int, default=30,
+                        help='Seconds to wait for response of cloudera manager. Default: 30.')
+    parser.add_argument('--retries', type=int, default=2,
+                        help='Retries of failed read-only cloudera manager requests. Default: 2.')
+    parser.add_argument('--rate-limit', type=float, default=float(os.getenv('APICM_RATE_LIMIT', 0)),
+                        help='Max cloudera manager requests per second, 0 is unlimited. Default: 0.')
+    parser.add_argument('--no-keep-alive', action='store_true',
+                        help='Open new connection for every cloudera manager request (cm_api urllib2 client).')
+    parser.add_argument('--refresh-interval', type=int, help='Topology refresh interval of apicm daemon in seconds. Default: 10.',
+                        default=10)
     args = parser.parse_args()
     return args
 
@@ -194,6 +770,12 @@ def help():
     CM_USER: Username of Cloudera Manager user. User should have at least read only permissions.
     CH_PASS: Cloudera manager user's password.
     CM_API_VERSION: Optional. Version of API to use. (default 17).  
+    APICM_CACHE_DIR: Optional. Directory of on-disk topology cache, shared between commands.
+    APICM_CACHE_TTL: Optional. Time to live of on-disk cache entries in seconds (default 300).
+    APICM_RATE_LIMIT: Optional. Max cloudera manager requests per second (default 0, unlimited).
+    APICM_SNAPSHOT: Optional. Snapshot file to answer read-only commands offline, same as --snapshot.
+    APICM_SOCKET: Optional. Unix socket of apicm daemon (default $XDG_RUNTIME_DIR/apicm.sock or
+        /tmp/apicm-<uid>/apicm.sock). Daemon is used only if socket is owned by current user.
     
     Available commands:
     get-kafka-brokers: Get hostnames of all kafka brokers.
@@ -204,5 +786,53 @@ def help():
     get-zk-roles: Get all available roles in zookeeper service.
     get-kafka-role-groups: Get all role config groups in kafka service.
     get-zk-role-groups: Get all rol config groups in kafka service.
+    start-kafka-brokers: Start many brokers (--hostnames or --role-group), at most --max-in-flight at once.
+    stop-kafka-brokers: Stop many brokers (--hostnames or --role-group), at most --max-in-flight at once.
+    restart-kafka-brokers: Restart many brokers (--hostnames or --role-group), at most --max-in-flight at once.
+    edit-kafka-log-dirs: Add and remove log dirs on many brokers (--changes file or --hostnames with
+        --add-log-dirs/--remove-log-dirs). Use --dry-run to print the plan only.
+    rolling-restart-kafka: Restart all brokers (or --hostnames) by --batch-size, waiting for GOOD health
+        between batches. Use --state-file to resume interrupted restart.
+    get-kafka-broker-status --watch: Stream changes of roleState, healthSummary, maintenanceMode and
+        haStatus of all brokers (or --hostname/--hostnames) as JSON lines. All brokers are polled with one
+        request, poll interval grows from --interval to --max-interval while nothing changes.
+    get-kafka-fleet-status: Get state, health, maintenance mode, config staleness and failing health checks
+        of all kafka brokers as table (or --format json) from one roles request.
+    get-zk-fleet-status: Same as get-kafka-fleet-status for zookeeper servers.
+    get-broker-ids: Get broker.id of every broker (--format text or json), exits with 1 on missing
+        or duplicated ids.
+    get-host-roles: Get service, type, name, state and HA status of every role running on --hostname
+        as table (or --format json).
+    get-configs: Get --keys of --service config with defaults resolved, per role config group (--scope group),
+        per host (--scope role with --role-type) or of service itself (--scope service). F.e. ports, data dirs
+        and heap of every broker:
+        get-configs --scope role --role-type KAFKA_BROKER --keys port,log.dirs,broker_max_heap_size
+    detect-config-drift: Compare effective config of every role of --service (--role-type, default
+        KAFKA_BROKER) and print roles, which differ from most roles, with key-level diff. Compared are
+        --keys or all keys overridden by any role, except --ignore (default broker.id, its uniqueness is
+        checked by get-broker-ids). Exits with 1 if drift is found. Overrides of all roles are read with
+        one request. With --baseline FILE hashes of role configs are kept between runs and roles, which
+        config changed since previous run, are reported as well.
+    apicm-snapshot: Dump whole cluster model to --output file, which could be used with --snapshot.
+    apicm-daemon: Run long living daemon, that answers read-only commands from warm cache.
     apicm-help: Print this help info.
+
+    All commands are also available as subcommands of single apicm command (f.e. apicm get-kafka-port).
+    apicm batch reads one command with its options per line from stdin (or --file) and runs all of
+    them in one process, sharing one client and its cached topology:
+        printf 'get-kafka-brokers\nget-kafka-port\nget-zk-nodes\n' | apicm batch
+
+    Every command accepts --profile, which prints number of cloudera manager requests, bytes and
+    latency per API method to stderr on exit. Requests answered by apicm daemon, on-disk cache
+    or snapshot are not sent to cloudera manager and are not counted.
+
+    Requests to cloudera manager reuse keep-alive connections. Read-only requests are retried
+    (--retries, default 2) on connection errors, timeouts (--request-timeout, default 30 seconds)
+    and 502/503/504 responses. After 5 consecutive failures requests fail fast for 30 seconds.
+    Identical concurrent requests are sent once and --rate-limit bounds requests per second.
+    --no-keep-alive falls back to plain cm_api client without rate limit.
+
+    --format json prints one JSON document, --format ndjson prints one JSON line per host, role or
+    config group as soon as it is resolved, so large fleet listings could be piped to jq or grep
+    before the whole listing is fetched.
     """
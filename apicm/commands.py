@@ -0,0 +1,222 @@
+import threading
+import time
+
+
+class CommandFuture(object):
+    """
+    Result of cloudera manager command tracked by CommandTracker.
+    """
+
+    def __init__(self, command, deadline=None, tag=None):
+        self.command = command
+        self.deadline = deadline
+        self.tag = tag
+        self.timed_out = False
+        self._event = threading.Event()
+
+    @property
+    def id(self):
+        return self.command.id
+
+    @property
+    def success(self):
+        return self.done() and not self.timed_out and bool(self.command.success)
+
+    def done(self):
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """
+        Method waits for command to finish.
+
+        Args:
+            timeout(int): Max amount of seconds to wait, forever by default.
+
+        Returns:
+            Last known ApiCommand. It is still active if command timed out.
+        """
+        self._event.wait(timeout)
+        return self.command
+
+    def _finish(self, command, timed_out=False):
+        self.command = command
+        self.timed_out = timed_out
+        self._event.set()
+
+
+class CommandTracker(object):
+    """
+    Tracker, that polls many cloudera manager commands in one loop.
+
+    Poll interval starts with min_poll and doubles up to max_poll while
+    nothing changes, and drops back to min_poll as soon as any command
+    finishes. If list_active is given (f.e. service.get_commands), every
+    round costs one listing of running commands, and only commands, that
+    are missing from it, are fetched one by one.
+
+    Results are available either as a generator (as_completed) or as
+    futures, which are completed by background thread (start).
+    """
+
+    def __init__(self, api=None, list_active=None, timeout=None, min_poll=0.5, max_poll=10,
+                 timer=time.time, sleep=time.sleep):
+        self.api = api
+        self.list_active = list_active
+        self.timeout = timeout
+        self.min_poll = min_poll
+        self.max_poll = max_poll
+        self.timer = timer
+        self.sleep = sleep
+        self._active = []
+        self._finished = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stopped = False
+
+    def track(self, command, timeout=None, tag=None):
+        """
+        Method starts tracking of command.
+
+        Args:
+            command: ApiCommand or id of submitted command.
+            timeout(int): Max amount of seconds to track command, tracker's timeout by default.
+            tag: Any value attached to future, f.e. role name.
+
+        Returns:
+            CommandFuture of the command.
+        """
+        if isinstance(command, (int, long)):
+            from cm_api.endpoints.types import ApiCommand
+            command = ApiCommand.from_json_dict({'id': int(command), 'active': True}, self.api)
+        timeout = self.timeout if timeout is None else timeout
+        deadline = None if timeout is None else self.timer() + timeout
+        future = CommandFuture(command, deadline, tag)
+        with self._lock:
+            if command.active:
+                self._active.append(future)
+            else:
+                future._finish(command)
+                self._finished.append(future)
+        self._wakeup.set()
+        return future
+
+    def track_all(self, commands, timeout=None):
+        return [self.track(command, timeout=timeout) for command in commands]
+
+    def pending(self):
+        with self._lock:
+            return len(self._active) + len(self._finished)
+
+    def poll(self):
+        """
+        Method makes one poll round.
+
+        Returns:
+            List of futures finished since last poll.
+        """
+        with self._lock:
+            active = list(self._active)
+            finished = self._finished
+            self._finished = []
+
+        running = None
+        if active and self.list_active is not None:
+            running = set(command.id for command in self.list_active())
+
+        now = self.timer()
+        for future in active:
+            if running is not None and future.id in running:
+                command = future.command
+            else:
+                command = future.command.fetch()
+            if not command.active:
+                future._finish(command)
+            elif future.deadline is not None and future.deadline <= now:
+                future._finish(command, timed_out=True)
+            else:
+                future.command = command
+                continue
+            finished.append(future)
+
+        with self._lock:
+            self._active = [future for future in self._active if not future.done()]
+        return finished
+
+    def _next_interval(self, interval, finished):
+        if finished:
+            interval = self.min_poll
+        else:
+            interval = min(interval * 2, self.max_poll)
+        with self._lock:
+            deadlines = [future.deadline for future in self._active if future.deadline is not None]
+        if deadlines:
+            interval = max(0, min(interval, min(deadlines) - self.timer()))
+        return interval
+
+    def iter_rounds(self):
+        """
+        Method polls tracked commands until all of them finish. Commands
+        tracked while iterating are picked up too.
+
+        Yields:
+            Non empty lists of futures finished in one poll round.
+        """
+        interval = self.min_poll / 2.0
+        while True:
+            finished = self.poll()
+            if finished:
+                yield finished
+            if not self.pending():
+                return
+            interval = self._next_interval(interval, finished)
+            self.sleep(interval)
+
+    def as_completed(self):
+        """
+        Method polls tracked commands until all of them finish.
+
+        Yields:
+            CommandFuture as soon as its command finishes or times out.
+        """
+        for finished in self.iter_rounds():
+            for future in finished:
+                yield future
+
+    def wait(self, commands=None, timeout=None):
+        """
+        Method tracks commands and waits for all tracked commands.
+
+        Returns:
+            List of finished futures of given commands.
+        """
+        futures = self.track_all(commands or [], timeout=timeout)
+        for _ in self.as_completed():
+            pass
+        return futures
+
+    def _run(self):
+        interval = self.min_poll
+        while not self._stopped:
+            finished = self.poll()
+            if not self.pending():
+                self._wakeup.wait()
+                self._wakeup.clear()
+                interval = self.min_poll
+                continue
+            interval = self._next_interval(interval, finished)
+            self.sleep(interval)
+
+    def start(self):
+        """
+        Method starts background thread, which completes futures of tracked commands.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
@@ -0,0 +1,181 @@
+import logging
+import os
+import socket
+import SocketServer
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from .daemon_client import READ_METHODS, DaemonClient, DaemonUnavailable, default_socket_path, get_target
+from .serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# Methods answered from cached topology (hosts, roles, role config groups),
+# which are replayed to rewarm standby client. Other methods read role
+# configs or state with uncached requests and are not replayed.
+REWARMED_METHODS = frozenset([
+    'get_hosts_by_role',
+    'get_service_ports',
+    'get_all_role_config_groups',
+    'get_role_types',
+])
+
+
+class RequestHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        try:
+            response = {'result': self.server.dispatch(loads(self.rfile.readline()))}
+        except Exception as e:
+            response = {'error': '{0}: {1}'.format(type(e).__name__, e)}
+        self.wfile.write(dumps(response) + '\n')
+
+
+class ApicmDaemon(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """
+    Long running server, that keeps warm NiagaraCMApi behind unix socket.
+
+    Daemon holds two clients built by cm_factory. One serves requests,
+    the other one is periodically invalidated and rewarmed with up to
+    max_queries most recent topology queries (see REWARMED_METHODS), then
+    clients are swapped. So refresh never blocks requests and answers come
+    from a warm cache. Clients are thread-safe, so requests run concurrently.
+    """
+    daemon_threads = True
+
+    def __init__(self, cm_factory, socket_path, refresh_interval=10, max_queries=256):
+        self.cm_factory = cm_factory
+        self.refresh_interval = refresh_interval
+        self.max_queries = max_queries
+        self.active = cm_factory()
+        self.standby = cm_factory()
+        self.target = get_target(self.active)
+        self.lock = threading.Lock()
+        self.queries = OrderedDict()
+        # Socket is created accessible only by owner, there is no window before chmod.
+        umask = os.umask(0o177)
+        try:
+            SocketServer.UnixStreamServer.__init__(self, socket_path, RequestHandler)
+        finally:
+            os.umask(umask)
+
+    def dispatch(self, request):
+        if request['target'] != self.target:
+            raise ValueError('Daemon serves {0}, not {1}.'.format(self.target, request['target']))
+        method = request['method']
+        if method not in READ_METHODS:
+            raise ValueError('Method {0} is not served by daemon.'.format(method))
+        args = request['args']
+        kwargs = request['kwargs']
+        with self.lock:
+            cloudera_manager = self.active
+            if method in REWARMED_METHODS:
+                key = dumps([method, args, kwargs])
+                # Most recently used queries are kept, the oldest are not rewarmed anymore.
+                self.queries.pop(key, None)
+                self.queries[key] = (method, args, kwargs)
+                while len(self.queries) > self.max_queries:
+                    self.queries.popitem(last=False)
+        return getattr(cloudera_manager, method)(*args, **kwargs)
+
+    def refresh(self):
+        """
+        Method rewarms standby client with recent topology queries and makes it active.
+        """
+        standby = self.standby
+        standby.invalidate()
+        standby.refresh_hosts()
+        with self.lock:
+            queries = list(self.queries.values())
+        for method, args, kwargs in queries:
+            try:
+                getattr(standby, method)(*args, **kwargs)
+            except Exception as e:
+                logger.warning('Can not refresh {0}{1}: {2}'.format(method, tuple(args), e))
+        with self.lock:
+            self.standby, self.active = self.active, standby
+
+    def refresh_forever(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error('Topology refresh failed: {0}'.format(e))
+
+    def start_refresher(self):
+        refresher = threading.Thread(target=self.refresh_forever)
+        refresher.daemon = True
+        refresher.start()
+        return refresher
+
+
+def ensure_socket_directory(socket_path):
+    """
+    Function creates directory of socket accessible only by owner, unless it exists.
+
+    Raises:
+        OSError: Directory could not be created or is owned by other user.
+    """
+    directory = os.path.dirname(os.path.abspath(socket_path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory, 0o700)
+    if os.stat(directory).st_uid != os.getuid():
+        raise OSError('Directory {0} is owned by other user.'.format(directory))
+
+
+def remove_stale_socket(socket_path):
+    """
+    Function removes socket file left by dead daemon.
+
+    Returns:
+        False if socket is served by running daemon, True otherwise.
+    """
+    if not os.path.exists(socket_path):
+        return True
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except socket.error:
+        os.unlink(socket_path)
+        return True
+    finally:
+        sock.close()
+    return False
+
+
+def main():
+    from .apicm import NiagaraCMApi
+    from .cmd_line_scripts import get_cm_api, get_transport
+
+    cloudera_manager, args = get_cm_api()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    # All clients created by daemon share pool of keep-alive connections and circuit breaker.
+    transport = get_transport(args, cloudera_manager.cm_host, cloudera_manager.user, cloudera_manager.password,
+                              cloudera_manager.port, cloudera_manager.version)
+
+    def cm_factory():
+        return NiagaraCMApi(cloudera_manager.cm_host, cloudera_manager.user, cloudera_manager.password,
+                            cluster=cloudera_manager.cluster, port=cloudera_manager.port,
+                            version=cloudera_manager.version, transport=transport)
+
+    try:
+        ensure_socket_directory(args.socket)
+    except OSError as e:
+        print 'Can not use socket {0}: {1}'.format(args.socket, e)
+        sys.exit(1)
+    if not remove_stale_socket(args.socket):
+        print 'apicm daemon is already running on {0}.'.format(args.socket)
+        sys.exit(1)
+
+    server = ApicmDaemon(cm_factory, args.socket, refresh_interval=args.refresh_interval)
+    server.start_refresher()
+    logger.info('apicm daemon serves {0} on {1}.'.format(server.target, args.socket))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
@@ -0,0 +1,107 @@
+# Client side of apicm daemon, kept apart from the server, so console
+# scripts talking to the daemon import only socket and json.
+import os
+import socket
+import stat
+
+from .serialization import dumps, loads
+
+# Only methods, that do not change cloudera manager state, are served by daemon.
+READ_METHODS = frozenset([
+    'get_hosts_by_role',
+    'get_roles_on_host',
+    'get_kafka_broker_id_by_hostname',
+    'get_all_kafka_broker_ids',
+    'get_configs',
+    'get_service_ports',
+    'get_all_role_config_groups',
+    'get_log_dirs_for_kafka_broker',
+    'get_broker_status',
+    'get_service_status',
+    'get_role_types',
+])
+
+
+def default_socket_path():
+    """
+    Function gets socket path of apicm daemon: APICM_SOCKET, socket in
+    XDG_RUNTIME_DIR or in private per-user directory in /tmp.
+    """
+    if os.getenv('APICM_SOCKET'):
+        return os.getenv('APICM_SOCKET')
+    if os.getenv('XDG_RUNTIME_DIR'):
+        return os.path.join(os.getenv('XDG_RUNTIME_DIR'), 'apicm.sock')
+    return '/tmp/apicm-{0}/apicm.sock'.format(os.getuid())
+
+
+def check_socket(socket_path):
+    """
+    Function checks, that socket path is a socket owned by current user, so
+    answers of daemon started by other user are never trusted.
+
+    Raises:
+        DaemonUnavailable: Socket does not exist, is not a socket or is owned by other user.
+    """
+    try:
+        socket_stat = os.lstat(socket_path)
+    except OSError:
+        raise DaemonUnavailable('Socket {0} does not exist.'.format(socket_path))
+    if not stat.S_ISSOCK(socket_stat.st_mode):
+        raise DaemonUnavailable('{0} is not a socket.'.format(socket_path))
+    if socket_stat.st_uid != os.getuid():
+        raise DaemonUnavailable('Socket {0} is owned by other user.'.format(socket_path))
+
+
+def get_target(cloudera_manager):
+    return [cloudera_manager.cm_host, str(cloudera_manager.port), cloudera_manager.cluster]
+
+
+class DaemonUnavailable(Exception):
+    pass
+
+
+class DaemonClient(object):
+    """
+    Client of apicm daemon. Every call is a single newline terminated JSON
+    request and response over the daemon's unix socket.
+    """
+
+    def __init__(self, socket_path, timeout=5):
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def call(self, target, method, *args, **kwargs):
+        """
+        Method calls NiagaraCMApi method in daemon.
+
+        Args:
+            target(list): cm_host, port and cluster, which daemon should serve.
+            method(str): Name of NiagaraCMApi method.
+
+        Returns:
+            Result of the method call.
+
+        Raises:
+            DaemonUnavailable: Daemon is not running, is not trusted, serves other cluster or failed to answer.
+        """
+        check_socket(self.socket_path)
+
+        request = dumps({'target': target, 'method': method, 'args': list(args), 'kwargs': kwargs})
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+            sock.sendall(request + '\n')
+            line = sock.makefile('rb').readline()
+        except socket.error as e:
+            raise DaemonUnavailable('Can not talk to daemon: {0}'.format(e))
+        finally:
+            sock.close()
+
+        try:
+            response = loads(line)
+        except ValueError:
+            raise DaemonUnavailable('Malformed daemon response.')
+        if 'error' in response:
+            raise DaemonUnavailable(response['error'])
+        return response['result']
@@ -0,0 +1,89 @@
+import errno
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from .serialization import encode, decode
+
+MISSING = object()
+
+
+class DiskCache(object):
+    """
+    On-disk cache of resolved cluster topology, shared between processes.
+
+    Every entry is stored in its own JSON file. Entries are written to
+    a temporary file in the same directory and renamed into place, so
+    concurrent readers always see either the old or the new entry, but
+    never a partially written one.
+    """
+
+    def __init__(self, directory, ttl=300, timer=time.time):
+        self.directory = directory
+        self.ttl = ttl
+        self.timer = timer
+
+    def _path(self, key):
+        digest = hashlib.sha1(json.dumps(key, sort_keys=True)).hexdigest()
+        return os.path.join(self.directory, digest + '.json')
+
+    def get(self, key, default=MISSING):
+        """
+        Method reads cached value.
+
+        Args:
+            key: JSON serializable cache key.
+            default: Value returned if entry is missing, expired or unreadable.
+
+        Returns:
+            Cached value or default.
+        """
+        # Key is compared with the stored one in its JSON form.
+        key = json.loads(json.dumps(key))
+        try:
+            with open(self._path(key)) as cache_file:
+                entry = json.load(cache_file)
+        except (IOError, OSError, ValueError):
+            return default
+        if entry.get('key') != key or entry.get('created', 0) + self.ttl < self.timer():
+            return default
+        return decode(entry['value'])
+
+    def set(self, key, value):
+        """
+        Method atomically writes value to cache.
+
+        Args:
+            key: JSON serializable cache key.
+            value: JSON serializable value.
+        """
+        try:
+            os.makedirs(self.directory, 0o700)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w') as tmp_file:
+                json.dump({'key': key, 'created': self.timer(), 'value': encode(value)}, tmp_file)
+            os.rename(tmp_path, self._path(key))
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def clear(self):
+        """
+        Method removes all cached entries.
+        """
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if name.endswith('.json'):
+                try:
+                    os.unlink(os.path.join(self.directory, name))
+                except OSError:
+                    pass
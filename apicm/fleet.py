@@ -0,0 +1,94 @@
+import time
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+from .apicm import NiagaraCMApi
+
+
+class FleetResult(object):
+    """
+    Results of one query against many cloudera manager targets.
+
+    Attributes:
+        results(list): Dictionaries with cm_host, cluster and result of every successful target.
+        errors(list): Dictionaries with cm_host, cluster and error of every failed or timed out target.
+    """
+
+    def __init__(self):
+        self.results = []
+        self.errors = []
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def merged(self):
+        """
+        Method merges list results of all targets.
+
+        Returns:
+            List of (cm_host, cluster, item) tuples.
+        """
+        merged = []
+        for result in self.results:
+            for item in result['result'] or []:
+                merged.append((result['cm_host'], result['cluster'], item))
+        return merged
+
+
+class FleetClient(object):
+    """
+    Client, that runs NiagaraCMApi queries against many cloudera managers
+    and clusters concurrently, so fleet query takes about as long as the
+    slowest target.
+
+    Example:
+        fleet = FleetClient([('cm-dc1', 'cluster'), ('cm-dc2', 'cluster')], user, password)
+        brokers = fleet.query('get_hosts_by_role', 'kafka', 'KAFKA_BROKER').merged()
+    """
+
+    def __init__(self, targets, user, password, port='7180', version=17, timeout=60, cache_ttls=None):
+        self.timeout = timeout
+        self.clients = [
+            NiagaraCMApi(cm_host, user, password, cluster=cluster, port=port, version=version,
+                         cache_ttls=cache_ttls, timeout=timeout)
+            for cm_host, cluster in targets
+        ]
+
+    def query(self, method, *args, **kwargs):
+        """
+        Method calls NiagaraCMApi method on every target concurrently.
+
+        Args:
+            method(str): Name of NiagaraCMApi method.
+
+        Returns:
+            FleetResult with per target results and errors. Targets, that
+            do not answer in timeout, are reported as errors.
+        """
+        fleet_result = FleetResult()
+        if not self.clients:
+            return fleet_result
+        pool = ThreadPool(len(self.clients))
+        try:
+            pending = [
+                (client, pool.apply_async(getattr(client, method), args, kwargs))
+                for client in self.clients
+            ]
+            deadline = time.time() + self.timeout
+            for client, async_result in pending:
+                target = {'cm_host': client.cm_host, 'cluster': client.cluster}
+                try:
+                    target['result'] = async_result.get(max(0, deadline - time.time()))
+                except TimeoutError:
+                    target['error'] = 'Timed out after {0} seconds.'.format(self.timeout)
+                    fleet_result.errors.append(target)
+                except Exception as e:
+                    target['error'] = '{0}: {1}'.format(type(e).__name__, e)
+                    fleet_result.errors.append(target)
+                else:
+                    fleet_result.results.append(target)
+        finally:
+            # Do not join, hung targets must not block the caller.
+            pool.close()
+        return fleet_result
@@ -0,0 +1,208 @@
+import functools
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+# Code flag of generator functions, same as inspect.CO_GENERATOR (inspect is slow to import).
+CO_GENERATOR = 0x20
+
+# One REST request made to cloudera manager. api_method is public NiagaraCMApi
+# method, that made the request, or None if request was made outside of it.
+RestCall = namedtuple('RestCall', ['api_method', 'http_method', 'path', 'status', 'bytes', 'latency'])
+
+
+class BufferedResponse(object):
+    """
+    Response, which body was already read by instrumentation.
+    """
+
+    def __init__(self, response, body):
+        self._response = response
+        self._body = body
+
+    def read(self):
+        return self._body
+
+    def info(self):
+        return self._response.info()
+
+    def getcode(self):
+        return self._response.getcode()
+
+
+class Instrumentation(object):
+    """
+    Hook layer, that records every REST request made by cloudera manager
+    client and publishes it as RestCall to subscribers. Subscriber is any
+    callable with single RestCall argument (f.e. LogSink or CallCounter).
+    Requests are not timed at all while there are no subscribers.
+    """
+
+    def __init__(self, timer=time.time):
+        self.timer = timer
+        self.subscribers = []
+        self._local = threading.local()
+
+    def subscribe(self, subscriber):
+        self.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.remove(subscriber)
+
+    def publish(self, call):
+        for subscriber in list(self.subscribers):
+            subscriber(call)
+
+    def current_method(self):
+        return getattr(self._local, 'method', None)
+
+    @contextmanager
+    def method(self, name):
+        """
+        Context manager, that attributes requests made inside it to public method.
+        Nested methods keep the outermost one, so requests are grouped per method
+        called by user.
+        """
+        previous = self.current_method()
+        if previous is None:
+            self._local.method = name
+        try:
+            yield
+        finally:
+            self._local.method = previous
+
+    def bind(self, function):
+        """
+        Method binds current public method to function, which runs in other thread (f.e. in ThreadPool).
+        """
+        name = self.current_method()
+        if name is None:
+            return function
+
+        @functools.wraps(function)
+        def bound(*args, **kwargs):
+            with self.method(name):
+                return function(*args, **kwargs)
+        return bound
+
+    def instrument_client(self, client):
+        """
+        Method wraps execute method of cm_api HttpClient, so every request is published.
+        """
+        execute = client.execute
+
+        def instrumented_execute(http_method, path, params=None, data=None, headers=None):
+            if not self.subscribers:
+                return execute(http_method, path, params=params, data=data, headers=headers)
+            start = self.timer()
+            status = None
+            body = ''
+            try:
+                response = execute(http_method, path, params=params, data=data, headers=headers)
+                body = response.read()
+                status = response.getcode()
+                return BufferedResponse(response, body)
+            except Exception as e:
+                status = getattr(e, 'code', None)
+                raise
+            finally:
+                self.publish(RestCall(self.current_method(), http_method, path, status, len(body),
+                                      self.timer() - start))
+
+        client.execute = instrumented_execute
+        return client
+
+
+def instrumented(method):
+    """
+    Decorator of public NiagaraCMApi methods, that attributes requests made by method to its name.
+    """
+    if method.__code__.co_flags & CO_GENERATOR:
+        @functools.wraps(method)
+        def generator_wrapper(self, *args, **kwargs):
+            generator = method(self, *args, **kwargs)
+            while True:
+                # Requests are attributed while generator runs, not while consumer handles its items.
+                with self.instrumentation.method(method.__name__):
+                    item = next(generator)
+                yield item
+        return generator_wrapper
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.instrumentation.method(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class LogSink(object):
+    """
+    Subscriber, that logs every request.
+    """
+
+    def __init__(self, logger=None, level=None):
+        import logging
+        self.logger = logger or logging.getLogger(__name__)
+        self.level = logging.DEBUG if level is None else level
+
+    def __call__(self, call):
+        self.logger.log(self.level, '{0}: {1} {2} -> {3}, {4} bytes, {5:.3f}s'.format(
+            call.api_method, call.http_method, call.path, call.status, call.bytes, call.latency))
+
+
+class CallCounter(object):
+    """
+    Subscriber, that aggregates number of requests, bytes and latency per
+    public method and per request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.methods = {}
+        self.requests = {}
+
+    def __call__(self, call):
+        with self._lock:
+            for stats, key in ((self.methods, call.api_method),
+                               (self.requests, (call.api_method, call.http_method, call.path))):
+                entry = stats.setdefault(key, {'count': 0, 'bytes': 0, 'latency': 0.0, 'errors': 0})
+                entry['count'] += 1
+                entry['bytes'] += call.bytes
+                entry['latency'] += call.latency
+                if call.status is None or call.status >= 400:
+                    entry['errors'] += 1
+
+    def total(self):
+        with self._lock:
+            total = {'count': 0, 'bytes': 0, 'latency': 0.0, 'errors': 0}
+            for entry in self.methods.values():
+                for key in total:
+                    total[key] += entry[key]
+            return total
+
+    def report(self, top=5):
+        """
+        Method formats call-count and latency breakdown per public method,
+        with top requests of every method by latency.
+
+        Returns:
+            report(str): Human readable report.
+        """
+        total = self.total()
+        lines = ['{0} requests, {1} errors, {2} bytes, {3:.3f}s'.format(
+            total['count'], total['errors'], total['bytes'], total['latency'])]
+        with self._lock:
+            methods = sorted(self.methods.items(), key=lambda item: -item[1]['latency'])
+            requests = sorted(self.requests.items(), key=lambda item: -item[1]['latency'])
+        for api_method, entry in methods:
+            lines.append('  {0}: {1} requests, {2} bytes, {3:.3f}s'.format(
+                api_method or '<unknown>', entry['count'], entry['bytes'], entry['latency']))
+            method_requests = [(key, stats) for key, stats in requests if key[0] == api_method]
+            for (_, http_method, path), stats in method_requests[:top]:
+                lines.append('    {0} {1}: {2} x, {3:.3f}s'.format(http_method, path, stats['count'],
+                                                                  stats['latency']))
+            if len(method_requests) > top:
+                lines.append('    ... {0} more'.format(len(method_requests) - top))
+        return '\n'.join(lines)
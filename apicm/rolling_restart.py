@@ -0,0 +1,113 @@
+import json
+import os
+import tempfile
+import time
+
+
+class RollingRestartError(Exception):
+    pass
+
+
+class RollingRestart(object):
+    """
+    Rolling restart of service roles with health gates.
+
+    Brokers are restarted in batches. Next batch is started only after
+    every broker of current batch is STARTED with GOOD health. Health
+    is polled with one roles request per poll, poll interval grows from
+    min_poll to max_poll while waiting, so rollout is bounded by broker
+    recovery time. Finished brokers are saved to state_file, so
+    interrupted rollout continues where it stopped.
+    """
+
+    def __init__(self, cloudera_manager, batch_size=1, state_file=None, timeout=600, min_poll=1, max_poll=15,
+                 service_name='kafka', role='KAFKA_BROKER'):
+        self.cm = cloudera_manager
+        self.batch_size = batch_size
+        self.state_file = state_file
+        self.timeout = timeout
+        self.min_poll = min_poll
+        self.max_poll = max_poll
+        self.service_name = service_name
+        self.role = role
+
+    def load_state(self):
+        if self.state_file is None or not os.path.exists(self.state_file):
+            return []
+        with open(self.state_file) as state_file:
+            return json.load(state_file)['done']
+
+    def save_state(self, done):
+        if self.state_file is None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.state_file))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as tmp_file:
+            json.dump({'done': done}, tmp_file)
+        os.rename(tmp_path, self.state_file)
+
+    def wait_healthy(self, nodenames):
+        """
+        Method waits until all brokers are STARTED with GOOD health.
+
+        Raises:
+            RollingRestartError: Brokers are not healthy in timeout.
+        """
+        deadline = time.time() + self.timeout
+        poll = self.min_poll
+        while True:
+            self.cm.invalidate(self.service_name)
+            roles = self.cm.get_roles_by_hostnames(nodenames, self.service_name, self.role)
+            unhealthy = sorted(
+                nodename for nodename, node in roles.items()
+                if node is None or node.roleState != 'STARTED' or node.healthSummary != 'GOOD'
+            )
+            if not unhealthy:
+                return
+            if time.time() + poll > deadline:
+                raise RollingRestartError(
+                    'Brokers are not healthy after {0} seconds: {1}'.format(self.timeout, ', '.join(unhealthy))
+                )
+            time.sleep(poll)
+            poll = min(poll * 2, self.max_poll)
+
+    def run(self, nodenames=None):
+        """
+        Method restarts brokers batch by batch.
+
+        Args:
+            nodenames(list): Hostnames of brokers, all brokers of service by default.
+
+        Yields:
+            (hostname, result) for every broker once its batch is healthy. Result is
+            STARTED or True if broker is in maintenance mode and was skipped.
+
+        Raises:
+            RollingRestartError: Broker restart failed or timed out, or batch is not healthy in timeout.
+        """
+        if nodenames is None:
+            nodenames = sorted(self.cm.get_hosts_by_role(self.service_name, self.role))
+        done = self.load_state()
+        remaining = [nodename for nodename in nodenames if nodename not in done]
+
+        for start in range(0, len(remaining), self.batch_size):
+            batch = remaining[start:start + self.batch_size]
+            results = []
+            for hostname, result in self.cm.kafka_brokers_action(
+                    'restart', nodenames=batch, max_in_flight=self.batch_size, poll_interval=self.min_poll,
+                    timeout=self.timeout, service_name=self.service_name, role=self.role):
+                # Timed out restart command yields "Error: command ... timed out" as well.
+                if result is None or (isinstance(result, basestring) and result.startswith('Error')):
+                    raise RollingRestartError('Restart of {0} failed: {1}'.format(hostname, result))
+                results.append((hostname, result))
+
+            restarted = [hostname for hostname, result in results if result is not True]
+            if restarted:
+                self.wait_healthy(restarted)
+            done.extend(restarted)
+            self.save_state(done)
+            for hostname, result in results:
+                yield hostname, result if result is True else 'STARTED'
+
+        if self.state_file is not None and os.path.exists(self.state_file):
+            os.unlink(self.state_file)
@@ -0,0 +1,35 @@
+import json
+
+# JSON round trip of NiagaraCMApi results, which preserves tuples and
+# native strings, so results answered from cache or daemon print exactly
+# like results of direct calls.
+
+
+def encode(value):
+    if isinstance(value, tuple):
+        return {'__tuple__': [encode(item) for item in value]}
+    if isinstance(value, list):
+        return [encode(item) for item in value]
+    if isinstance(value, dict):
+        return dict((key, encode(item)) for key, item in value.items())
+    return value
+
+
+def decode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    if isinstance(value, dict):
+        if value.keys() == ['__tuple__']:
+            return tuple(decode(item) for item in value['__tuple__'])
+        return dict((decode(key), decode(item)) for key, item in value.items())
+    return value
+
+
+def dumps(value):
+    return json.dumps(encode(value), separators=(',', ':'))
+
+
+def loads(text):
+    return decode(json.loads(text))
@@ -0,0 +1,247 @@
+import gzip
+import json
+import os
+import tempfile
+import time
+from multiprocessing.pool import ThreadPool
+
+from .apicm import CONFIG_SCOPES, SERVICE_PORT_KEYS, role_overrides
+from .serialization import decode
+
+SNAPSHOT_VERSION = 1
+
+# Role types, which role level config overrides are stored in snapshot
+# (f.e. broker.id and log.dirs of kafka brokers).
+ROLE_CONFIG_TYPES = frozenset(['KAFKA_BROKER'])
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def build_snapshot(cloudera_manager, workers=8):
+    """
+    Function dumps whole cluster model: services, role types, role config
+    groups, roles, hosts and role config overrides of ROLE_CONFIG_TYPES.
+    Hosts listing is one request, every service costs three requests,
+    which run concurrently, plus one roles listing with configs if service
+    has roles of ROLE_CONFIG_TYPES.
+
+    Args:
+        cloudera_manager(NiagaraCMApi): Cloudera manager API client.
+        workers(int): Max number of concurrent requests.
+
+    Returns:
+        snapshot(dict): JSON serializable cluster model.
+    """
+    hostnames = cloudera_manager.get_host_index()
+    services = cloudera_manager._get_cluster().get_all_services()
+    pool = ThreadPool(workers)
+    try:
+        def dump_service(service):
+            # Group configs with cloudera manager defaults resolved, same as live get_configs.
+            groups = cloudera_manager._get_role_config_groups_full(service.name)
+            roles = []
+            all_roles = service.get_all_roles()
+            overrides = {}
+            if any(role.type in ROLE_CONFIG_TYPES for role in all_roles):
+                # Overrides of all roles are read with one request, not with get_config per role.
+                overrides = dict((node['name'], role_overrides(node))
+                                 for node in cloudera_manager._get_roles_full(service.name)
+                                 if node.get('type') in ROLE_CONFIG_TYPES)
+            for role in all_roles:
+                roles.append({
+                    'name': role.name,
+                    'type': role.type,
+                    'hostId': role.hostRef.hostId,
+                    'hostname': hostnames.get(role.hostRef.hostId),
+                    'roleState': role.roleState,
+                    'healthSummary': role.healthSummary,
+                    'maintenanceMode': role.maintenanceMode,
+                    'haStatus': role.haStatus,
+                    'configStalenessStatus': role.configStalenessStatus,
+                    'healthChecks': [{'name': check.get('name'), 'summary': check.get('summary')}
+                                     for check in role.healthChecks or []],
+                    'roleConfigGroup': role.roleConfigGroupRef.roleConfigGroupName
+                    if role.roleConfigGroupRef is not None else None,
+                    'config': overrides.get(role.name, {}) if role.type in ROLE_CONFIG_TYPES else None,
+                })
+            return service.name, {
+                'type': service.type,
+                'role_types': service.get_role_types(),
+                'role_config_groups': groups,
+                'roles': roles,
+            }
+
+        dumped = dict(pool.map(dump_service, list(services)))
+    finally:
+        pool.close()
+
+    return {
+        'version': SNAPSHOT_VERSION,
+        'created': int(time.time()),
+        'cm_host': cloudera_manager.cm_host,
+        'cluster': cloudera_manager.cluster,
+        'hosts': hostnames,
+        'services': dumped,
+    }
+
+
+def write_snapshot(snapshot, path):
+    """
+    Function atomically writes compact snapshot file, gzipped if path ends with .gz.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            if path.endswith('.gz'):
+                with gzip.GzipFile(fileobj=tmp_file, mode='wb') as gzip_file:
+                    json.dump(snapshot, gzip_file, separators=(',', ':'))
+            else:
+                json.dump(snapshot, tmp_file, separators=(',', ':'))
+        os.rename(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_snapshot(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as snapshot_file:
+        snapshot = decode(json.load(snapshot_file))
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        raise SnapshotError('Unsupported snapshot version {0} in {1}.'.format(snapshot.get('version'), path))
+    return snapshot
+
+
+class SnapshotNiagaraCMApi(object):
+    """
+    Offline, read-only counterpart of NiagaraCMApi, that answers from
+    snapshot written by apicm-snapshot.
+    """
+
+    def __init__(self, snapshot):
+        if not isinstance(snapshot, dict):
+            snapshot = read_snapshot(snapshot)
+        self.snapshot = snapshot
+        self.cm_host = snapshot['cm_host']
+        self.cluster = snapshot['cluster']
+        self._host_ids = dict((hostname, host_id) for host_id, hostname in snapshot['hosts'].items())
+        self._role_index = {}
+        for service_name, service in snapshot['services'].items():
+            for node in service['roles']:
+                self._role_index.setdefault((service_name, node['type'], node['hostname']), node)
+
+    def _service(self, service_name):
+        try:
+            return self.snapshot['services'][service_name]
+        except KeyError:
+            raise SnapshotError('Service {0} is not in snapshot.'.format(service_name))
+
+    def _roles(self, service_name, role):
+        return [node for node in self._service(service_name)['roles'] if node['type'] == role]
+
+    def _role_by_hostname(self, nodename, service_name, role):
+        self._service(service_name)
+        return self._role_index.get((service_name, role, nodename))
+
+    def get_host_index(self):
+        return self.snapshot['hosts']
+
+    def get_hostname(self, host_id):
+        return self.snapshot['hosts'].get(host_id)
+
+    def get_host_id(self, hostname):
+        return self._host_ids.get(hostname)
+
+    def get_roles_on_host(self, hostname):
+        if hostname not in self._host_ids:
+            return None
+        result = []
+        for service_name, service in self.snapshot['services'].items():
+            for node in service['roles']:
+                if node['hostname'] == hostname:
+                    result.append({'service': service_name, 'type': node['type'], 'name': node['name'],
+                                   'roleState': node['roleState'], 'haStatus': node['haStatus']})
+        return sorted(result, key=lambda role: (role['service'], role['name']))
+
+    def get_hosts_by_role(self, service_name, role, haStatus=None):
+        result = []
+        for node in self._roles(service_name, role):
+            if haStatus == 'ACTIVE' and node['haStatus'] != 'ACTIVE':
+                continue
+            result.append(node['hostname'])
+        return result
+
+    def get_kafka_broker_id_by_hostname(self, nodename, role='KAFKA_BROKER', service_name='kafka'):
+        node = self._role_by_hostname(nodename, service_name, role)
+        if node is not None:
+            return node['config']['broker.id']
+
+    def get_all_kafka_broker_ids(self, role='KAFKA_BROKER', service_name='kafka'):
+        return dict(
+            (node['hostname'], (node['config'] or {}).get('broker.id')) for node in self._roles(service_name, role)
+        )
+
+    def get_configs(self, service_name, keys, scope='group', role=None):
+        """
+        Method answers NiagaraCMApi.get_configs from role config groups (with
+        defaults resolved) and role overrides stored in snapshot.
+        """
+        if scope not in CONFIG_SCOPES:
+            raise ValueError('Unknown config scope {0}, expected one of {1}.'.format(scope, ', '.join(CONFIG_SCOPES)))
+        if scope == 'service':
+            raise SnapshotError('Service config is not stored in snapshot.')
+
+        groups = self._service(service_name)['role_config_groups']
+        if scope == 'group':
+            return dict((name, dict((key, group['config'].get(key)) for key in keys)) for name, group in groups.items()
+                        if role is None or group['roleType'] == role)
+
+        if role is None:
+            raise ValueError('Role type is required by role scope.')
+        result = {}
+        for node in self._roles(service_name, role):
+            config = dict(groups.get(node['roleConfigGroup'], {'config': {}})['config'])
+            config.update(node['config'] or {})
+            result[node['hostname']] = dict((key, config.get(key)) for key in keys)
+        return result
+
+    def get_service_ports(self, service_name, role_config_group):
+        if service_name not in SERVICE_PORT_KEYS:
+            raise ValueError("Unknown service {0}".format(service_name))
+        groups = self._service(service_name)['role_config_groups']
+        if role_config_group not in groups:
+            raise ValueError("Unknown role config group {0}".format(role_config_group))
+        return groups[role_config_group]['config'].get(SERVICE_PORT_KEYS[service_name])
+
+    def get_all_role_config_groups(self, service_name):
+        return sorted(self._service(service_name)['role_config_groups'])
+
+    def get_log_dirs_for_kafka_broker(self, nodename, service_name='kafka', role='KAFKA_BROKER'):
+        node = self._role_by_hostname(nodename, service_name, role)
+        if node is not None:
+            return node['config']['log.dirs'].split(',')
+
+    def get_broker_status(self, nodename, service_name='kafka', role='KAFKA_BROKER'):
+        node = self._role_by_hostname(nodename, service_name, role)
+        if node is not None:
+            return node['roleState'], node['maintenanceMode']
+
+    def get_service_status(self, service_name='kafka', role='KAFKA_BROKER'):
+        status = {}
+        for node in self._roles(service_name, role):
+            status.setdefault(node['hostname'], {
+                'role': node['name'],
+                'roleState': node.get('roleState'),
+                'healthSummary': node.get('healthSummary'),
+                'maintenanceMode': node.get('maintenanceMode'),
+                'haStatus': node.get('haStatus'),
+                'configStalenessStatus': node.get('configStalenessStatus'),
+                'healthChecks': node.get('healthChecks', []),
+            })
+        return status
+
+    def get_role_types(self, service_name):
+        return self._service(service_name)['role_types']
@@ -0,0 +1,240 @@
+"""
+Benchmark of NiagaraCMApi methods and console scripts against FakeCMServer.
+
+Every scenario runs with a cold client, counts requests served by the
+fake cloudera manager and compares them with the scenario's request
+budget, so N+1 regressions fail the benchmark independently of machine
+speed. Wall time is reported and checked with --max-seconds (default 30,
+0 disables), which catches sleeping or serialized scenarios.
+
+Usage:
+    python -m apicm.tests.benchmark --brokers 10,100,1000 --latency 0.002
+"""
+import argparse
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from StringIO import StringIO
+
+from apicm import cmd_line_scripts
+from apicm.apicm import NiagaraCMApi
+from apicm.snapshot import build_snapshot
+from apicm.tests.fake_cm import FakeCluster, FakeCMServer
+from apicm.transport import PooledTransport
+
+KAFKA_GROUP = 'kafka-KAFKA_BROKER-BASE'
+THREE_BROKERS = 'host0.example.com,host1.example.com,host2.example.com'
+
+
+def brokers_of(cluster):
+    return [cluster.hosts[i]['hostname'] for i in range(len(cluster.services['kafka']['roles']))]
+
+
+def change_all_log_dirs(cm, cluster):
+    return cm.edit_kafka_log_dirs(dict((hostname, {'add': ['/data/new']}) for hostname in brokers_of(cluster)),
+                                  dry_run=True)
+
+
+def restart_all_brokers(cm, cluster):
+    return list(cm.kafka_brokers_action('restart', nodenames=brokers_of(cluster), poll_interval=0.01))
+
+
+def add_log_dir_one_by_one(cm, cluster, brokers=10):
+    return [cm.edit_log_dir_from_kafka_broker(hostname, '/data/new', 'add')
+            for hostname in brokers_of(cluster)[:brokers]]
+
+
+def change_log_dirs(cm, cluster):
+    return cm.edit_kafka_log_dirs(dict((hostname, {'remove': ['/data/new']}) for hostname in brokers_of(cluster)))
+
+
+def watch_one_poll(cm, cluster):
+    return next(cm.watch_roles('kafka', 'KAFKA_BROKER'))
+
+
+def detect_drift_with_baseline(cm, cluster):
+    baseline = {}
+    cm.detect_config_drift(baseline=baseline)
+    # Repeat run with cold topology refetches role listings only.
+    cm.invalidate()
+    return cm.detect_config_drift(baseline=baseline)
+
+
+def concurrent_get_hosts_by_role(cm, cluster, threads=10):
+    workers = [threading.Thread(target=cm.get_hosts_by_role, args=('kafka', 'KAFKA_BROKER')) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+# name, function(cm, cluster), request budget as function of number of brokers.
+API_SCENARIOS = [
+    ('get_host_index', lambda cm, cluster: cm.get_host_index(), lambda n: 1),
+    ('get_hosts_by_role', lambda cm, cluster: cm.get_hosts_by_role('kafka', 'KAFKA_BROKER'), lambda n: 4),
+    ('get_hosts_by_role (10 threads)', concurrent_get_hosts_by_role, lambda n: 4),
+    ('get_roles_by_hostnames', lambda cm, cluster: cm.get_roles_by_hostnames(brokers_of(cluster)), lambda n: 4),
+    ('get_kafka_broker_id_by_hostname',
+     lambda cm, cluster: cm.get_kafka_broker_id_by_hostname(brokers_of(cluster)[-1]), lambda n: 5),
+    ('get_all_kafka_broker_ids', lambda cm, cluster: cm.get_all_kafka_broker_ids(), lambda n: 2),
+    ('get_roles_on_host', lambda cm, cluster: cm.get_roles_on_host(brokers_of(cluster)[0]), lambda n: 11),
+    ('get_roles_on_host (every broker)',
+     lambda cm, cluster: [cm.get_roles_on_host(hostname) for hostname in brokers_of(cluster)], lambda n: n + 10),
+    ('get_service_ports', lambda cm, cluster: cm.get_service_ports('kafka', KAFKA_GROUP), lambda n: 1),
+    ('get_configs (group)', lambda cm, cluster: cm.get_configs('kafka', ['port', 'log.dirs']), lambda n: 1),
+    ('get_configs (role)',
+     lambda cm, cluster: cm.get_configs('kafka', ['port', 'log.dirs'], scope='role', role='KAFKA_BROKER'),
+     lambda n: 3),
+    ('detect_config_drift', lambda cm, cluster: cm.detect_config_drift(), lambda n: 5),
+    ('detect_config_drift (baseline)', detect_drift_with_baseline, lambda n: 10),
+    ('get_all_role_config_groups', lambda cm, cluster: cm.get_all_role_config_groups('kafka'), lambda n: 3),
+    ('get_role_types', lambda cm, cluster: cm.get_role_types('kafka'), lambda n: 3),
+    ('get_log_dirs_for_kafka_broker',
+     lambda cm, cluster: cm.get_log_dirs_for_kafka_broker(brokers_of(cluster)[-1]), lambda n: 6),
+    ('get_broker_status', lambda cm, cluster: cm.get_broker_status(brokers_of(cluster)[-1]), lambda n: 4),
+    ('edit_kafka_log_dirs (dry run)', change_all_log_dirs, lambda n: n + 6),
+    ('get_host_id', lambda cm, cluster: cm.get_host_id(brokers_of(cluster)[-1]), lambda n: 1),
+    ('get_role_by_hostname',
+     lambda cm, cluster: cm.get_role_by_hostname(brokers_of(cluster)[-1], 'kafka', 'KAFKA_BROKER'), lambda n: 4),
+    ('iter_hosts_by_role', lambda cm, cluster: list(cm.iter_hosts_by_role('kafka', 'KAFKA_BROKER')), lambda n: 4),
+    ('iter_configs (role)',
+     lambda cm, cluster: list(cm.iter_configs('kafka', ['port'], scope='role', role='KAFKA_BROKER')), lambda n: 3),
+    ('get_configs (service)', lambda cm, cluster: cm.get_configs('kafka', ['zookeeper.chroot'], scope='service'),
+     lambda n: 1),
+    ('get_service_status', lambda cm, cluster: cm.get_service_status('kafka', 'KAFKA_BROKER'), lambda n: 4),
+    ('watch_roles (one poll)', watch_one_poll, lambda n: 4),
+    # Every call reads and writes broker config and reloads invalidated roles listing.
+    ('edit_log_dir_from_kafka_broker (10 brokers)', add_log_dir_one_by_one, lambda n: 3 * min(n, 10) + 5),
+    ('edit_kafka_log_dirs', change_log_dirs, lambda n: 2 * n + 6),
+    ('kafka_broker_action (restart)',
+     lambda cm, cluster: cm.kafka_broker_action(brokers_of(cluster)[0], 'restart'), lambda n: 10),
+    ('kafka_brokers_action (restart)', restart_all_brokers, lambda n: 2 * n + 10),
+    ('build_snapshot', lambda cm, cluster: build_snapshot(cm), lambda n: 16),
+]
+
+# console script, extra arguments, request budget as function of number of brokers.
+SCRIPT_SCENARIOS = [
+    ('get_kafka_brokers', [], lambda n: 4),
+    ('get_zk_nodes', [], lambda n: 4),
+    ('get_kafka_ports', [], lambda n: 1),
+    ('get_configs', ['--scope', 'role', '--role-type', 'KAFKA_BROKER', '--keys', 'port,log.dirs,broker_max_heap_size'],
+     lambda n: 3),
+    ('detect_config_drift', ['--keys', 'port,broker_max_heap_size'], lambda n: 5),
+    ('get_kafka_role_groups', [], lambda n: 3),
+    ('get_hdfs_namenode', [], lambda n: 4),
+    ('get_yarn_resource_manager', [], lambda n: 4),
+    ('get_broker_id', ['--hostname', 'host0.example.com'], lambda n: 5),
+    ('get_broker_ids', [], lambda n: 2),
+    ('get_kafka_broker_status', ['--hostname', 'host0.example.com'], lambda n: 4),
+    ('get_kafka_fleet_status', ['--format', 'json'], lambda n: 4),
+    ('get_host_roles', ['--hostname', 'host0.example.com'], lambda n: 11),
+    ('get_zk_ports', [], lambda n: 1),
+    ('get_kafka_roles', [], lambda n: 3),
+    ('get_zk_roles', [], lambda n: 3),
+    ('get_zk_role_groups', [], lambda n: 3),
+    ('get_zk_fleet_status', ['--format', 'json'], lambda n: 4),
+    ('get_log_dirs_list', ['--hostname', 'host0.example.com'], lambda n: 6),
+    ('create_snapshot', ['--output', '{tmp}/snapshot.json.gz'], lambda n: 16),
+    # Mutating scripts, in order, so the fake cluster ends in its initial state.
+    ('add_kafka_log_dir', ['--hostname', 'host0.example.com', '--log-dir', '/data/new'], lambda n: 7),
+    ('remove_kafka_log_dir', ['--hostname', 'host0.example.com', '--log-dir', '/data/new'], lambda n: 7),
+    ('edit_kafka_log_dirs', ['--hostnames', 'host0.example.com,host1.example.com', '--add-log-dirs', '/data/new'],
+     lambda n: 8),
+    ('edit_kafka_log_dirs', ['--hostnames', 'host0.example.com,host1.example.com', '--remove-log-dirs', '/data/new'],
+     lambda n: 8),
+    ('stop_kafka_broker', ['--hostname', 'host0.example.com'], lambda n: 10),
+    ('start_kafka_broker', ['--hostname', 'host0.example.com'], lambda n: 10),
+    ('restart_kafka_broker', ['--hostname', 'host0.example.com'], lambda n: 10),
+    ('stop_kafka_brokers', ['--hostnames', THREE_BROKERS, '--max-in-flight', '2'], lambda n: 16),
+    ('start_kafka_brokers', ['--hostnames', THREE_BROKERS, '--max-in-flight', '2'], lambda n: 16),
+    ('restart_kafka_brokers', ['--hostnames', 'host0.example.com,host1.example.com'], lambda n: 14),
+    ('rolling_restart_kafka', ['--hostnames', 'host0.example.com,host1.example.com', '--batch-size', '2'],
+     lambda n: 16),
+]
+
+
+def run_script(name, port, extra_args, keep_alive=True):
+    argv, stdout = sys.argv, sys.stdout
+    sys.argv = [name, '--cm-host', '127.0.0.1', '--port', str(port), '-u', 'admin', '-p', 'admin',
+                '--no-daemon', '--no-cache'] + ([] if keep_alive else ['--no-keep-alive']) + extra_args
+    sys.stdout = StringIO()
+    try:
+        getattr(cmd_line_scripts, name)()
+    except SystemExit:
+        pass
+    finally:
+        sys.argv, sys.stdout = argv, stdout
+
+
+def measure(server, function):
+    server.reset()
+    start = time.time()
+    function()
+    return len(server.reset()), time.time() - start
+
+
+def run_benchmark(brokers, latency=0.0, names=None, keep_alive=True):
+    """
+    Function runs all scenarios against fake cloudera manager with given number of brokers.
+    With keep_alive clients use PooledTransport, otherwise cm_api urllib2 client.
+
+    Returns:
+        results(list): List of dictionaries with name, requests, budget and seconds.
+    """
+    results = []
+    tmp_dir = tempfile.mkdtemp()
+    with FakeCMServer(FakeCluster(brokers=brokers), latency=latency) as server:
+        for name, scenario, budget in API_SCENARIOS:
+            if names and name not in names:
+                continue
+            transport = PooledTransport('127.0.0.1', 'admin', 'admin', port=server.port) if keep_alive else None
+            cm = NiagaraCMApi('127.0.0.1', 'admin', 'admin', port=str(server.port), transport=transport)
+            requests, seconds = measure(server, lambda: scenario(cm, server.cluster))
+            if transport is not None:
+                transport.close()
+            results.append({'name': name, 'requests': requests, 'budget': budget(brokers), 'seconds': seconds})
+        for name, extra_args, budget in SCRIPT_SCENARIOS:
+            if names and name not in names:
+                continue
+            args = [arg.format(tmp=tmp_dir) for arg in extra_args]
+            requests, seconds = measure(server, lambda: run_script(name, server.port, args, keep_alive))
+            results.append({'name': name + ' (script)', 'requests': requests, 'budget': budget(brokers),
+                            'seconds': seconds})
+    shutil.rmtree(tmp_dir)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark apicm against fake cloudera manager.')
+    parser.add_argument('--brokers', type=str, default='10,100,1000',
+                        help='Comma separated fleet sizes. Default: 10,100,1000.')
+    parser.add_argument('--latency', type=float, default=0.002,
+                        help='Latency of every fake cloudera manager request in seconds. Default: 0.002.')
+    parser.add_argument('--scenarios', type=str, default=None, help='Comma separated scenarios to run.')
+    parser.add_argument('--no-keep-alive', action='store_true',
+                        help='Use cm_api urllib2 client instead of keep-alive PooledTransport.')
+    parser.add_argument('--max-seconds', type=float, default=30,
+                        help='Max wall time of one scenario, 0 disables the check. Default: 30.')
+    args = parser.parse_args()
+    names = args.scenarios.split(',') if args.scenarios else None
+
+    failed = False
+    for brokers in [int(size) for size in args.brokers.split(',')]:
+        print '{0} brokers, {1}s latency'.format(brokers, args.latency)
+        print '  {0:<40} {1:>9} {2:>9} {3:>9}'.format('scenario', 'requests', 'budget', 'seconds')
+        for result in run_benchmark(brokers, args.latency, names, not args.no_keep_alive):
+            status = ''
+            if result['requests'] > result['budget']:
+                status = 'OVER BUDGET'
+            elif args.max_seconds and result['seconds'] > args.max_seconds:
+                status = 'TOO SLOW'
+            failed = failed or bool(status)
+            print '  {0:<40} {1:>9} {2:>9} {3:>9.3f} {4}'.format(
+                result['name'], result['requests'], result['budget'], result['seconds'], status)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Startup-time benchmark of apicm console scripts.
+
+Every entry point of setup.py is imported in a fresh interpreter several
+times, median import time (interpreter startup excluded) and heavy modules
+loaded by the import are reported. Benchmark fails if an entry point takes
+longer than --max-ms or loads a heavy module it does not need.
+
+Usage:
+    python -m apicm.tests.benchmark_startup --runs 10 --max-ms 100
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+SETUP_PY = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'setup.py')
+
+# Modules, which are slow to import and needed only by some commands.
+HEAVY_MODULES = ('cm_api', 'multiprocessing', 'urllib2', 'SocketServer', 'logging', 'inspect', 'gzip', 'argparse')
+
+# Heavy modules, which entry point module needs at import time.
+ALLOWED_HEAVY_MODULES = {
+    'apicm.daemon': ('SocketServer', 'logging'),
+}
+
+PROBE = """
+import sys, time
+start = time.time()
+from {module} import {function}
+elapsed = time.time() - start
+print elapsed, ','.join(name for name in {heavy!r} if name in sys.modules)
+"""
+
+
+def get_entry_points(setup_py=SETUP_PY):
+    """
+    Function reads console scripts of setup.py.
+
+    Returns:
+        entry_points(list): Sorted list of (script, module, function).
+    """
+    with open(setup_py) as setup_file:
+        return sorted(re.findall(r"'([\w-]+)=([\w.]+):(\w+)'", setup_file.read()))
+
+
+def probe(module, function):
+    output = subprocess.check_output([sys.executable, '-c', PROBE.format(
+        module=module, function=function, heavy=HEAVY_MODULES)], cwd=os.path.dirname(SETUP_PY))
+    elapsed, heavy = output.split()[0], output.split()[1:]
+    return float(elapsed), heavy[0].split(',') if heavy else []
+
+
+def measure_entry_point(module, function, runs=5):
+    """
+    Function imports entry point in fresh interpreters.
+
+    Returns:
+        Median import time in seconds and list of unexpected heavy modules.
+    """
+    timings = []
+    heavy = []
+    for _ in range(runs):
+        elapsed, heavy = probe(module, function)
+        timings.append(elapsed)
+    allowed = ALLOWED_HEAVY_MODULES.get(module, ())
+    return sorted(timings)[len(timings) // 2], [name for name in heavy if name not in allowed]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark startup time of apicm console scripts.')
+    parser.add_argument('--runs', type=int, default=5, help='Imports per entry point. Default: 5.')
+    parser.add_argument('--max-ms', type=float, default=100, help='Max median import time. Default: 100.')
+    args = parser.parse_args()
+
+    failed = False
+    print '{0:<28} {1:>9}  {2}'.format('script', 'import ms', 'heavy modules')
+    for script, module, function in get_entry_points():
+        elapsed, heavy = measure_entry_point(module, function, args.runs)
+        status = ''
+        if heavy:
+            status = 'HEAVY IMPORTS'
+        elif elapsed * 1000 > args.max_ms:
+            status = 'TOO SLOW'
+        failed = failed or bool(status)
+        print '{0:<28} {1:>9.1f}  {2} {3}'.format(script, elapsed * 1000, ','.join(heavy) or '-', status)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,415 @@
+import json
+import re
+import socket
+import threading
+import time
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+
+class FakeCluster(object):
+    """
+    In-memory model of cloudera manager cluster with kafka, zookeeper,
+    hdfs and yarn services. Every broker runs on its own host, other roles
+    share first hosts of the fleet. Role commands finish command_duration
+    seconds after they are submitted.
+    """
+
+    def __init__(self, brokers=10, zookeepers=3, name='cluster', command_duration=0.0, timer=time.time):
+        self.name = name
+        self.command_duration = command_duration
+        self.timer = timer
+        self.lock = threading.Lock()
+        self.hosts = []
+        for i in range(max(brokers, zookeepers, 2)):
+            self.hosts.append({'hostId': 'host-id-{0}'.format(i), 'hostname': 'host{0}.example.com'.format(i)})
+
+        self.services = {}
+        self.add_service('kafka', 'KAFKA', 'KAFKA_BROKER', brokers, {'port': '9092'},
+                         lambda i: {'broker.id': str(i + 1), 'log.dirs': '/data/{0}/kafka'.format(i)},
+                         defaults={'port': '9092', 'log.dirs': '/var/local/kafka/data', 'broker.id': None,
+                                   'broker_max_heap_size': '1024'},
+                         service_config={'zookeeper.chroot': '/kafka'})
+        self.add_service('zookeeper', 'ZOOKEEPER', 'SERVER', zookeepers, {'clientPort': '2181'},
+                         defaults={'clientPort': '2181', 'dataDir': '/var/lib/zookeeper'})
+        self.add_service('hdfs', 'HDFS', 'NAMENODE', 2, {})
+        self.add_service('yarn', 'YARN', 'RESOURCEMANAGER', 2, {})
+        for service_name in ('hdfs', 'yarn'):
+            for i, role in enumerate(self.services[service_name]['roles']):
+                role['haStatus'] = 'ACTIVE' if i == 0 else 'STANDBY'
+
+        self.commands = {}
+        self.next_command_id = 1
+
+    def add_service(self, service_name, service_type, role_type, count, group_config, role_config=None,
+                    defaults=None, service_config=None):
+        group_name = '{0}-{1}-BASE'.format(service_name, role_type)
+        roles = []
+        for i in range(count):
+            roles.append({
+                'name': '{0}-{1}-{2}'.format(service_name, role_type, i),
+                'type': role_type,
+                'hostRef': {'hostId': self.hosts[i]['hostId']},
+                'serviceRef': {'clusterName': self.name, 'serviceName': service_name},
+                'roleState': 'STARTED',
+                'healthSummary': 'GOOD',
+                'healthChecks': [],
+                'configStalenessStatus': 'FRESH',
+                'haStatus': None,
+                'maintenanceMode': False,
+                'roleConfigGroupRef': {'roleConfigGroupName': group_name},
+                'config': role_config(i) if role_config is not None else {},
+            })
+        self.services[service_name] = {
+            'name': service_name,
+            'type': service_type,
+            'roleTypes': [role_type],
+            'config': service_config or {},
+            # Defaults of role config, reported by full view of groups and roles.
+            'defaults': defaults or {},
+            'roleConfigGroups': {
+                group_name: {'name': group_name, 'roleType': role_type, 'base': True, 'config': group_config},
+            },
+            'roles': roles,
+        }
+
+    def submit(self, service_name, command, role_names):
+        """
+        Method starts one command per role.
+        """
+        roles = dict((role['name'], role) for role in self.services[service_name]['roles'])
+        items = []
+        errors = []
+        with self.lock:
+            for role_name in role_names:
+                if role_name not in roles:
+                    errors.append('Role {0} does not exist.'.format(role_name))
+                    continue
+                command_id = self.next_command_id
+                self.next_command_id += 1
+                roles[role_name]['roleState'] = 'STOPPED' if command == 'stop' else 'STARTED'
+                if command != 'stop':
+                    roles[role_name]['configStalenessStatus'] = 'FRESH'
+                self.commands[command_id] = {
+                    'id': command_id,
+                    'name': command,
+                    'active': True,
+                    'success': None,
+                    'roleRef': {'roleName': role_name, 'serviceName': service_name, 'clusterName': self.name},
+                    'finishes': self.timer() + self.command_duration,
+                    'service': service_name,
+                }
+                items.append(command_json(self.commands[command_id]))
+        return {'items': items, 'errors': errors}
+
+    def _update(self, command):
+        if command['active'] and command['finishes'] <= self.timer():
+            command['active'] = False
+            command['success'] = True
+        return command
+
+    def fetch_command(self, command_id):
+        with self.lock:
+            return command_json(self._update(self.commands[command_id]))
+
+    def active_commands(self, service_name):
+        with self.lock:
+            return [command_json(command) for command in self.commands.values()
+                    if command['service'] == service_name and self._update(command)['active']]
+
+
+def command_json(command):
+    return dict((key, command[key]) for key in ('id', 'name', 'active', 'success', 'roleRef'))
+
+
+def config_json(config, defaults=None):
+    """
+    Function formats config list, full view (with defaults of all known keys) if defaults are given.
+    """
+    if defaults is None:
+        return {'items': [{'name': key, 'value': value} for key, value in sorted(config.items())]}
+    items = []
+    for key in sorted(set(config) | set(defaults)):
+        item = {'name': key, 'default': defaults.get(key)}
+        if key in config:
+            item['value'] = config[key]
+        items.append(item)
+    return {'items': items}
+
+
+def role_json(role):
+    return dict((key, value) for key, value in role.items() if key != 'config')
+
+
+def group_json(group, defaults=None):
+    result = dict(group)
+    result['config'] = config_json(group['config'], defaults)
+    return result
+
+
+class NotFound(Exception):
+    pass
+
+
+# Injected failure: request is processed and connection is closed without response.
+DROP = 'drop'
+
+
+class FakeCMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Responses are written at once and without Nagle's delay, so keep-alive clients
+    # do not wait for delayed ACKs (as with real cloudera manager).
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    ROUTES = [
+        ('GET', r'/hosts', 'get_hosts'),
+        ('GET', r'/hosts/([^/]+)', 'get_host'),
+        ('GET', r'/commands/(\d+)', 'get_command'),
+        ('GET', r'/clusters/([^/]+)', 'get_cluster'),
+        ('GET', r'/clusters/([^/]+)/services', 'get_services'),
+        ('GET', r'/clusters/([^/]+)/services/([^/]+)', 'get_service'),
+        ('GET', r'/clusters/([^/]+)/services/([^/]+)/config', 'get_service_config'),
+        ('GET', r'/clusters/([^/]+)/services/([^/]+)/roleTypes', 'get_role_types'),
+        ('GET', r'/clusters/([^/]+)/services/([^/]+)/commands', 'get_service_commands'),
+        ('GET', r'/clusters/([^/]+)/services/([^/]+)/roles', 'get_roles'),
+        ('GET', r'/clusters/([^/]+)/services/([^/]+)/roles/([^/]+)', 'get_role'),
+        ('GET', r'/clusters/([^/]+)/services/([^/]+)/roles/([^/]+)/config', 'get_role_config'),
+        ('PUT', r'/clusters/([^/]+)/services/([^/]+)/roles/([^/]+)/config', 'put_role_config'),
+        ('GET', r'/clusters/([^/]+)/services/([^/]+)/roleConfigGroups', 'get_role_config_groups'),
+        ('GET', r'/clusters/([^/]+)/services/([^/]+)/roleConfigGroups/([^/]+)', 'get_role_config_group'),
+        ('POST', r'/clusters/([^/]+)/services/([^/]+)/roleCommands/(start|stop|restart)', 'post_role_command'),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def dispatch(self, method):
+        url = urlparse.urlparse(self.path)
+        path = re.sub(r'^/api/v\d+', '', url.path)
+        self.params = urlparse.parse_qs(url.query)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        status, result = 404, {'message': 'Not found: {0} {1}'.format(method, path)}
+        failure = self.server.next_failure()
+        if failure not in (None, DROP):
+            status, result = failure, {'message': 'Injected failure'}
+        for route_method, pattern, handler in self.ROUTES:
+            match = re.match(pattern + '$', path)
+            if route_method == method and match and failure in (None, DROP):
+                try:
+                    status, result = 200, getattr(self, handler)(body, *match.groups())
+                except (KeyError, NotFound):
+                    pass
+                break
+        self.server.record(method, path, status)
+        if failure == DROP:
+            # Request is processed, but connection is closed before response.
+            self.close_connection = 1
+            return
+
+        data = json.dumps(result)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    @property
+    def cluster(self):
+        return self.server.cluster
+
+    def service(self, cluster_name, service_name):
+        if cluster_name != self.cluster.name:
+            raise NotFound()
+        return self.cluster.services[service_name]
+
+    def role(self, cluster_name, service_name, role_name):
+        for role in self.service(cluster_name, service_name)['roles']:
+            if role['name'] == role_name:
+                return role
+        raise NotFound()
+
+    def get_hosts(self, body):
+        return {'items': self.cluster.hosts}
+
+    def get_host(self, body, host_id):
+        for host in self.cluster.hosts:
+            if host['hostId'] == host_id:
+                result = dict(host)
+                result['roleRefs'] = [
+                    {'clusterName': self.cluster.name, 'serviceName': service_name, 'roleName': role['name']}
+                    for service_name, service in sorted(self.cluster.services.items())
+                    for role in service['roles'] if role['hostRef']['hostId'] == host_id
+                ]
+                return result
+        raise NotFound()
+
+    def get_command(self, body, command_id):
+        return self.cluster.fetch_command(int(command_id))
+
+    def get_cluster(self, body, cluster_name):
+        if cluster_name != self.cluster.name:
+            raise NotFound()
+        return {'name': cluster_name, 'displayName': cluster_name, 'version': 'CDH5'}
+
+    def get_services(self, body, cluster_name):
+        return {'items': [self.get_service(body, cluster_name, name) for name in sorted(self.cluster.services)]}
+
+    def get_service(self, body, cluster_name, service_name):
+        service = self.service(cluster_name, service_name)
+        return {'name': service['name'], 'type': service['type'], 'clusterRef': {'clusterName': cluster_name}}
+
+    def defaults(self, service):
+        return service['defaults'] if self.params.get('view') == ['full'] else None
+
+    def get_service_config(self, body, cluster_name, service_name):
+        service = self.service(cluster_name, service_name)
+        return config_json(service['config'], {} if self.params.get('view') == ['full'] else None)
+
+    def get_role_types(self, body, cluster_name, service_name):
+        return {'items': self.service(cluster_name, service_name)['roleTypes']}
+
+    def get_service_commands(self, body, cluster_name, service_name):
+        self.service(cluster_name, service_name)
+        return {'items': self.cluster.active_commands(service_name)}
+
+    def get_roles(self, body, cluster_name, service_name):
+        service = self.service(cluster_name, service_name)
+        if self.params.get('view') != ['full']:
+            return {'items': [role_json(role) for role in service['roles']]}
+        items = []
+        for role in service['roles']:
+            item = role_json(role)
+            item['config'] = config_json(role['config'], service['defaults'])
+            items.append(item)
+        return {'items': items}
+
+    def get_role(self, body, cluster_name, service_name, role_name):
+        return role_json(self.role(cluster_name, service_name, role_name))
+
+    def get_role_config(self, body, cluster_name, service_name, role_name):
+        return config_json(self.role(cluster_name, service_name, role_name)['config'],
+                           self.defaults(self.service(cluster_name, service_name)))
+
+    def put_role_config(self, body, cluster_name, service_name, role_name):
+        role = self.role(cluster_name, service_name, role_name)
+        for item in body['items']:
+            if item.get('value') is None:
+                role['config'].pop(item['name'], None)
+            else:
+                role['config'][item['name']] = item['value']
+        # Changed config is applied on next restart of the role.
+        role['configStalenessStatus'] = 'STALE'
+        return config_json(role['config'])
+
+    def get_role_config_groups(self, body, cluster_name, service_name):
+        service = self.service(cluster_name, service_name)
+        groups = service['roleConfigGroups']
+        return {'items': [group_json(groups[name], self.defaults(service)) for name in sorted(groups)]}
+
+    def get_role_config_group(self, body, cluster_name, service_name, group_name):
+        service = self.service(cluster_name, service_name)
+        return group_json(service['roleConfigGroups'][group_name], self.defaults(service))
+
+    def post_role_command(self, body, cluster_name, service_name, command):
+        self.service(cluster_name, service_name)
+        return self.cluster.submit(service_name, command, body['items'])
+
+
+class FakeCMServer(ThreadingMixIn, HTTPServer):
+    """
+    Fake cloudera manager REST API serving FakeCluster on localhost. Every
+    request waits latency seconds and is counted, so tests and benchmarks
+    can check how many requests apicm makes.
+
+    Example:
+        with FakeCMServer(FakeCluster(brokers=100), latency=0.005) as server:
+            cm = NiagaraCMApi('127.0.0.1', 'admin', 'admin', port=server.port)
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, cluster=None, latency=0.0):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), FakeCMHandler)
+        self.cluster = cluster if cluster is not None else FakeCluster()
+        self.latency = latency
+        self.port = self.server_address[1]
+        self.requests = []
+        # Statuses returned instead of real responses to next requests, f.e. [503, 503] or [DROP].
+        self.failures = []
+        self._requests_lock = threading.Lock()
+        # Open connections and threads handling them.
+        self._connections = {}
+        self._stopped = False
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def record(self, method, path, status):
+        with self._requests_lock:
+            self.requests.append((method, path, status))
+
+    def process_request(self, request, client_address):
+        thread = threading.Thread(target=self.process_request_thread, args=(request, client_address))
+        thread.daemon = True
+        with self._requests_lock:
+            self._connections[request] = thread
+        thread.start()
+
+    def shutdown_request(self, request):
+        with self._requests_lock:
+            self._connections.pop(request, None)
+        HTTPServer.shutdown_request(self, request)
+
+    def handle_error(self, request, client_address):
+        # Closed keep-alive connections of stopped server are not errors.
+        if not self._stopped:
+            HTTPServer.handle_error(self, request, client_address)
+
+    def next_failure(self):
+        with self._requests_lock:
+            return self.failures.pop(0) if self.failures else None
+
+    def reset(self):
+        with self._requests_lock:
+            requests, self.requests = self.requests, []
+        return requests
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self.shutdown()
+        self.server_close()
+        # Keep-alive connections are closed too, so their handler threads finish.
+        with self._requests_lock:
+            connections, self._connections = self._connections, {}
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        for thread in connections.values():
+            thread.join(1)
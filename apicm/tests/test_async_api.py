@@ -0,0 +1,65 @@
+import mock
+import threading
+import time
+import unittest
+
+from apicm.async_api import AsyncNiagaraCMApi, gather
+
+
+def make_host(host_id, hostname):
+    host = mock.Mock()
+    host.hostId = host_id
+    host.hostname = hostname
+    return host
+
+
+def make_role(host_id):
+    role = mock.Mock()
+    role.hostRef.hostId = host_id
+    role.haStatus = None
+    return role
+
+
+class TestAsyncNiagaraCMApi(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('cm_api.api_client.ApiResource')
+        self.addCleanup(patcher.stop)
+        api_resource = patcher.start()
+        api = api_resource.return_value
+        api.get_all_hosts.return_value = [make_host('id-1', 'broker1'), make_host('id-2', 'zk1')]
+
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        roles = {'KAFKA_BROKER': [make_role('id-1')], 'SERVER': [make_role('id-2')]}
+
+        def get_roles_by_type(role):
+            with self.lock:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            time.sleep(0.1)
+            with self.lock:
+                self.in_flight -= 1
+            return roles[role]
+
+        service = api.get_cluster.return_value.get_service.return_value
+        service.get_roles_by_type.side_effect = get_roles_by_type
+        self.cm_api = AsyncNiagaraCMApi(cm_host='cm_host', user='admin', password='admin', workers=4)
+        self.addCleanup(self.cm_api.close)
+
+    def test_fan_out_overlaps(self):
+        kafka, zookeeper = gather([
+            self.cm_api.get_hosts_by_role('kafka', 'KAFKA_BROKER'),
+            self.cm_api.get_hosts_by_role('zookeeper', 'SERVER'),
+        ], timeout=5)
+        self.assertEqual(kafka, ['broker1'])
+        self.assertEqual(zookeeper, ['zk1'])
+        self.assertEqual(self.max_in_flight, 2)
+
+    def test_map(self):
+        result = self.cm_api.map('get_hosts_by_role', [('kafka', 'KAFKA_BROKER'), ('zookeeper', 'SERVER')])
+        self.assertEqual(result, [['broker1'], ['zk1']])
+
+
+if __name__ == '__main__':
+    unittest.main()
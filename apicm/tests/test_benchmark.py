@@ -0,0 +1,13 @@
+import unittest
+
+from apicm.tests.benchmark import run_benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_request_budgets(self):
+        for result in run_benchmark(brokers=10):
+            self.assertLessEqual(result['requests'], result['budget'], result['name'])
+
+
+if __name__ == '__main__':
+    unittest.main()
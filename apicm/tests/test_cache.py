@@ -0,0 +1,142 @@
+import threading
+import time
+import unittest
+
+from apicm.cache import SingleFlight, TTLCache
+
+
+class FakeTimer(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+    def setUp(self):
+        self.timer = FakeTimer()
+        self.cache = TTLCache(maxsize=2, timer=self.timer)
+
+    def test_entry_expires(self):
+        self.cache.set(('cluster', 'cluster'), 'value', 10)
+        self.assertEqual(self.cache.get(('cluster', 'cluster')), 'value')
+        self.timer.now = 11
+        self.assertIsNone(self.cache.get(('cluster', 'cluster')))
+
+    def test_zero_ttl_is_not_cached(self):
+        self.cache.set(('roles', 'kafka'), 'value', 0)
+        self.assertNotIn(('roles', 'kafka'), self.cache)
+
+    def test_lru_eviction(self):
+        self.cache.set(('a',), 1, 10)
+        self.cache.set(('b',), 2, 10)
+        self.cache.get(('a',))
+        self.cache.set(('c',), 3, 10)
+        self.assertIn(('a',), self.cache)
+        self.assertNotIn(('b',), self.cache)
+
+    def test_fetch_calls_loader_once(self):
+        calls = []
+        loader = lambda: calls.append(1) or 'value'
+        self.assertEqual(self.cache.fetch(('a',), 10, loader), 'value')
+        self.assertEqual(self.cache.fetch(('a',), 10, loader), 'value')
+        self.assertEqual(len(calls), 1)
+
+    def test_fetch_coalesces_concurrent_loads(self):
+        calls = []
+        release = threading.Event()
+
+        def loader():
+            calls.append(1)
+            release.wait()
+            return 'value'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.fetch(('a',), 10, loader)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while self.cache._flights.shared < 4:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['value'] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_fetch_after_invalidation_does_not_join_old_load(self):
+        release = threading.Event()
+        values = iter(['old', 'new'])
+
+        def loader():
+            value = next(values)
+            if value == 'old':
+                release.wait()
+            return value
+
+        results = []
+        old_load = threading.Thread(target=lambda: results.append(self.cache.fetch(('roles', 'kafka'), 10, loader)))
+        old_load.start()
+        while not self.cache._flights._calls:
+            time.sleep(0.001)
+        self.cache.invalidate('roles', 'kafka')
+        new_load = threading.Thread(target=lambda: results.append(self.cache.fetch(('roles', 'kafka'), 10, loader)))
+        new_load.start()
+        new_load.join(5)
+        release.set()
+        old_load.join()
+        self.assertEqual(results, ['new', 'old'])
+        self.assertEqual(self.cache.get(('roles', 'kafka')), 'new')
+
+    def test_value_loaded_before_invalidation_is_not_cached(self):
+        def loader():
+            self.cache.invalidate('roles')
+            return 'old'
+
+        self.assertEqual(self.cache.fetch(('roles', 'kafka'), 10, loader), 'old')
+        self.assertNotIn(('roles', 'kafka'), self.cache)
+
+    def test_invalidate_by_prefix(self):
+        self.cache.set(('roles', 'kafka', 'KAFKA_BROKER'), 1, 10)
+        self.cache.set(('roles', 'zookeeper', 'SERVER'), 2, 10)
+        self.cache.invalidate('roles', 'kafka')
+        self.assertNotIn(('roles', 'kafka', 'KAFKA_BROKER'), self.cache)
+        self.assertIn(('roles', 'zookeeper', 'SERVER'), self.cache)
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_exception_is_shared(self):
+        flights = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        errors = []
+
+        def fail():
+            started.set()
+            release.wait()
+            raise ValueError('failed')
+
+        def call():
+            try:
+                flights.do('key', fail)
+            except ValueError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=call)
+        follower.start()
+        while flights.shared < 1:
+            time.sleep(0.001)
+        release.set()
+        leader.join()
+        follower.join()
+        self.assertEqual(len(errors), 2)
+        self.assertIs(errors[0], errors[1])
+        self.assertEqual(flights.do('key', lambda: 'value'), 'value')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import json
+import mock
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from apicm import cli
+from apicm.tests.fake_cm import FakeCluster, FakeCMServer
+
+
+class TestCli(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeCMServer(FakeCluster(brokers=3)).start()
+        self.common_args = ['--cm-host', '127.0.0.1', '--port', str(self.server.port), '-u', 'admin', '-p', 'admin',
+                            '--no-daemon', '--no-cache']
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_read_batch(self):
+        commands = cli.read_batch(StringIO('# provisioning\nget-kafka-brokers\n\nget-broker-id --hostname "h 1"\n'))
+        self.assertEqual(commands, [('get-kafka-brokers', ['get-kafka-brokers']),
+                                    ('get-broker-id --hostname "h 1"', ['get-broker-id', '--hostname', 'h 1'])])
+
+    def test_run_batch(self):
+        commands = cli.read_batch(StringIO('get-kafka-brokers\nget-kafka-port\nget-broker-id --hostname host1.example.com\n'))
+        output = StringIO()
+        self.assertEqual(cli.run_batch(commands, self.common_args, ndjson=True, output=output), 0)
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([result['command'] for result in results],
+                         ['get-kafka-brokers', 'get-kafka-port', 'get-broker-id --hostname host1.example.com'])
+        self.assertEqual([result['status'] for result in results], [0, 0, 0])
+        self.assertEqual(results[0]['output'], 'host0.example.com\nhost1.example.com\nhost2.example.com\n')
+        self.assertEqual(results[1]['output'], '9092\n')
+        self.assertEqual(results[2]['output'], '2\n')
+        # Cluster, service, roles and hosts are fetched once for all commands.
+        paths = [path for _, path, _ in self.server.requests]
+        self.assertEqual(paths.count('/clusters/cluster/services/kafka'), 1)
+        self.assertEqual(paths.count('/hosts'), 1)
+
+    def test_get_configs(self):
+        commands = [('get-configs', ['get-configs', '--scope', 'role', '--role-type', 'KAFKA_BROKER', '--keys',
+                                     'port,log.dirs,broker_max_heap_size', '--format', 'json'])]
+        output = StringIO()
+        self.assertEqual(cli.run_batch(commands, self.common_args, ndjson=True, output=output), 0)
+        configs = json.loads(json.loads(output.getvalue())['output'])
+        self.assertEqual(configs['host1.example.com'],
+                         {'port': '9092', 'log.dirs': '/data/1/kafka', 'broker_max_heap_size': '1024'})
+        self.assertEqual(len(configs), 3)
+
+    def test_ndjson_format(self):
+        commands = [('get-kafka-brokers', ['get-kafka-brokers', '--format', 'ndjson']),
+                     ('get-broker-ids', ['get-broker-ids', '--format', 'ndjson'])]
+        output = StringIO()
+        self.assertEqual(cli.run_batch(commands, self.common_args, ndjson=True, output=output), 0)
+        brokers, broker_ids = [json.loads(line)['output'].splitlines() for line in output.getvalue().splitlines()]
+        self.assertEqual([json.loads(line) for line in brokers],
+                         ['host0.example.com', 'host1.example.com', 'host2.example.com'])
+        self.assertEqual(sorted(json.loads(line)['hostname'] for line in broker_ids),
+                         ['host0.example.com', 'host1.example.com', 'host2.example.com'])
+
+    def test_detect_config_drift(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        baseline = os.path.join(tmp_dir, 'baseline.json')
+        commands = [('detect-config-drift', ['detect-config-drift', '--keys', 'port,broker_max_heap_size',
+                                             '--baseline', baseline, '--format', 'json'])]
+        self.assertEqual(cli.run_batch(commands, self.common_args, output=StringIO()), 0)
+        # Override is changed and applied by restart, so role config is not stale.
+        self.server.cluster.services['kafka']['roles'][1]['config']['broker_max_heap_size'] = '4096'
+        output = StringIO()
+        self.assertEqual(cli.run_batch(commands, self.common_args, ndjson=True, output=output), 1)
+        drift = json.loads(json.loads(output.getvalue())['output'])
+        self.assertEqual(drift['outliers'], {
+            'host1.example.com': {'broker_max_heap_size': {'expected': '1024', 'actual': '4096'}}})
+        self.assertEqual(drift['changed'], ['host1.example.com'])
+        with open(baseline) as baseline_file:
+            self.assertEqual(len(json.load(baseline_file)), 3)
+
+    def test_edit_log_dirs_of_broker_without_override(self):
+        del self.server.cluster.services['kafka']['roles'][0]['config']['log.dirs']
+        commands = [('edit-kafka-log-dirs', ['edit-kafka-log-dirs', '--hostnames', 'host0.example.com',
+                                             '--add-log-dirs', '/data/new', '--dry-run', '--format', 'json'])]
+        output = StringIO()
+        self.assertEqual(cli.run_batch(commands, self.common_args, ndjson=True, output=output), 0)
+        plans = json.loads(json.loads(output.getvalue())['output'])
+        self.assertEqual(plans[0]['old'], ['/var/local/kafka/data'])
+        self.assertEqual(plans[0]['new'], ['/var/local/kafka/data', '/data/new'])
+
+    def test_run_batch_stops_on_failure(self):
+        commands = cli.read_batch(StringIO('get-kafka-topics\nget-kafka-port\n'))
+        output = StringIO()
+        self.assertEqual(cli.run_batch(commands, self.common_args, ndjson=True, output=output), 2)
+        self.assertEqual(len(output.getvalue().splitlines()), 1)
+        output = StringIO()
+        self.assertEqual(cli.run_batch(commands, self.common_args, keep_going=True, ndjson=True, output=output), 2)
+        self.assertEqual(len(output.getvalue().splitlines()), 2)
+
+
+    def test_run_batch_keeps_going_after_exception(self):
+        commands = cli.read_batch(StringIO('get-configs --service missing --keys port\nget-kafka-brokers\n'))
+        output = StringIO()
+        with mock.patch('sys.stderr', new_callable=StringIO) as stderr:
+            self.assertEqual(cli.run_batch(commands, self.common_args, keep_going=True, ndjson=True, output=output), 1)
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([result['status'] for result in results], [1, 0])
+        self.assertEqual(results[1]['output'], 'host0.example.com\nhost1.example.com\nhost2.example.com\n')
+        self.assertIn('Error: get-configs:', stderr.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,11 @@
 import mock
 import os
+import shutil
+import tempfile
 import unittest
 
 from apicm import cmd_line_scripts
+from apicm.snapshot import SNAPSHOT_VERSION, write_snapshot
 
 
 CM_HOST = 'cm_host'
@@ -68,6 +71,38 @@ class TestCMDLineScripts(unittest.TestCase):
         cmd_line_scripts.get_zk_role_groups()
         get_arcg.assert_called_with('zookeeper')
 
+    @mock.patch('apicm.NiagaraCMApi')
+    @mock.patch('apicm.NiagaraCMApi.get_hosts_by_role')
+    def test_get_kafka_brokers_from_disk_cache(self, get_host, ncmapi):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        os.environ['APICM_CACHE_DIR'] = cache_dir
+        self.addCleanup(os.environ.pop, 'APICM_CACHE_DIR')
+        get_host.return_value = ['broker1']
+        cmd_line_scripts.get_kafka_brokers()
+        cmd_line_scripts.get_kafka_brokers()
+        self.assertEqual(get_host.call_count, 1)
+
+    @mock.patch('apicm.NiagaraCMApi.get_kafka_broker_id_by_hostname')
+    def test_get_broker_id_from_snapshot(self, get_broker_id):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'snapshot.json')
+        write_snapshot({
+            'version': SNAPSHOT_VERSION, 'created': 0, 'cm_host': CM_HOST, 'cluster': 'cluster',
+            'hosts': {'id-1': 'broker1'},
+            'services': {'kafka': {'type': 'KAFKA', 'role_types': ['KAFKA_BROKER'], 'role_config_groups': {},
+                                   'roles': [{'name': 'broker-1', 'type': 'KAFKA_BROKER', 'hostname': 'broker1',
+                                              'config': {'broker.id': '42'}}]}},
+        }, path)
+        os.environ['APICM_SNAPSHOT'] = path
+        self.addCleanup(os.environ.pop, 'APICM_SNAPSHOT')
+        with mock.patch('sys.argv', ['get-broker-id', '--hostname', 'broker1']):
+            with mock.patch('sys.stdout') as stdout:
+                cmd_line_scripts.get_broker_id()
+        self.assertIn('42', ''.join(call[0][0] for call in stdout.write.call_args_list))
+        self.assertFalse(get_broker_id.called)
+
 
 if __name__ == '__main__':
     unittest.main()
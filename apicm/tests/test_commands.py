@@ -0,0 +1,91 @@
+import mock
+import unittest
+
+from apicm.commands import CommandTracker
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+        self.sleeps = []
+
+    def timer(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_command(command_id, polls_until_done, success=True):
+    """
+    Command, that stays active for polls_until_done fetches.
+    """
+    state = {'polls': 0}
+    command = mock.Mock()
+    command.id = command_id
+    command.active = True
+
+    def fetch():
+        state['polls'] += 1
+        fetched = mock.Mock()
+        fetched.id = command_id
+        fetched.active = state['polls'] < polls_until_done
+        fetched.success = success
+        fetched.fetch.side_effect = fetch
+        return fetched
+
+    command.fetch.side_effect = fetch
+    return command
+
+
+class TestCommandTracker(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.tracker = CommandTracker(min_poll=1, max_poll=8, timer=self.clock.timer, sleep=self.clock.sleep)
+
+    def test_as_completed_yields_in_finish_order(self):
+        self.tracker.track(make_command(1, 3))
+        self.tracker.track(make_command(2, 1))
+        finished = [future.id for future in self.tracker.as_completed()]
+        self.assertEqual(finished, [2, 1])
+
+    def test_backoff_grows_and_resets(self):
+        self.tracker.track(make_command(1, 1))
+        self.tracker.track(make_command(2, 6))
+        futures = self.tracker.wait()
+        self.assertEqual(futures, [])
+        self.assertEqual(self.clock.sleeps, [1, 2, 4, 8, 8])
+
+    def test_timeout(self):
+        future = self.tracker.track(make_command(1, 100), timeout=5)
+        self.tracker.wait()
+        self.assertTrue(future.done())
+        self.assertTrue(future.timed_out)
+        self.assertFalse(future.success)
+        self.assertLessEqual(self.clock.now, 5)
+
+    def test_list_active_saves_fetches(self):
+        commands = [make_command(1, 2), make_command(2, 1)]
+        self.tracker.list_active = mock.Mock(side_effect=[[commands[1]], []])
+        futures = self.tracker.wait(commands)
+        self.assertTrue(all(future.success for future in futures))
+        self.assertEqual(commands[1].fetch.call_count, 1)
+
+    def test_finished_command_is_completed_immediately(self):
+        command = mock.Mock()
+        command.active = False
+        command.success = True
+        future = self.tracker.track(command)
+        self.assertEqual(list(self.tracker.as_completed()), [future])
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_background_futures(self):
+        tracker = CommandTracker(min_poll=0.01, max_poll=0.05).start()
+        self.addCleanup(tracker.stop)
+        future = tracker.track(make_command(1, 2))
+        self.assertTrue(future.result(timeout=5).success)
+
+
+if __name__ == '__main__':
+    unittest.main()
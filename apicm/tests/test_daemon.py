@@ -0,0 +1,132 @@
+import mock
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import unittest
+
+from apicm.daemon import ApicmDaemon, DaemonClient, DaemonUnavailable, ensure_socket_directory, remove_stale_socket
+from apicm.daemon_client import default_socket_path
+
+TARGET = ['cm_host', '7180', 'cluster']
+
+
+def make_cm():
+    cloudera_manager = mock.Mock()
+    cloudera_manager.cm_host = 'cm_host'
+    cloudera_manager.port = '7180'
+    cloudera_manager.cluster = 'cluster'
+    cloudera_manager.get_hosts_by_role.return_value = ['broker1', 'broker2']
+    cloudera_manager.get_broker_status.return_value = ('STARTED', False)
+    return cloudera_manager
+
+
+class TestApicmDaemon(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.socket_path = os.path.join(directory, 'apicm.sock')
+        self.server = ApicmDaemon(make_cm, self.socket_path)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = DaemonClient(self.socket_path)
+
+    def test_call(self):
+        result = self.client.call(TARGET, 'get_hosts_by_role', 'kafka', 'KAFKA_BROKER')
+        self.assertEqual(result, ['broker1', 'broker2'])
+        self.server.active.get_hosts_by_role.assert_called_with('kafka', 'KAFKA_BROKER')
+
+    def test_tuple_result_is_preserved(self):
+        result = self.client.call(TARGET, 'get_broker_status', nodename='broker1')
+        self.assertEqual(result, ('STARTED', False))
+
+    def test_other_target_is_rejected(self):
+        with self.assertRaises(DaemonUnavailable):
+            self.client.call(['other_host', '7180', 'cluster'], 'get_hosts_by_role', 'kafka', 'KAFKA_BROKER')
+
+    def test_write_method_is_rejected(self):
+        with self.assertRaises(DaemonUnavailable):
+            self.client.call(TARGET, 'kafka_broker_action', 'broker1', 'stop')
+
+    def test_refresh_rewarms_standby_and_swaps(self):
+        self.client.call(TARGET, 'get_hosts_by_role', 'kafka', 'KAFKA_BROKER')
+        standby = self.server.standby
+        self.server.refresh()
+        self.assertIs(self.server.active, standby)
+        standby.invalidate.assert_called_with()
+        standby.get_hosts_by_role.assert_called_with('kafka', 'KAFKA_BROKER')
+
+    def test_only_recent_topology_queries_are_rewarmed(self):
+        self.server.max_queries = 2
+        self.server.active.get_all_kafka_broker_ids.return_value = {}
+        self.server.active.get_all_role_config_groups.return_value = []
+        self.client.call(TARGET, 'get_all_kafka_broker_ids')
+        for service_name in ('kafka', 'zookeeper', 'hdfs'):
+            self.client.call(TARGET, 'get_all_role_config_groups', service_name)
+        standby = self.server.standby
+        self.server.refresh()
+        self.assertFalse(standby.get_all_kafka_broker_ids.called)
+        self.assertEqual(standby.get_all_role_config_groups.call_args_list,
+                         [mock.call('zookeeper'), mock.call('hdfs')])
+
+    def test_slow_query_does_not_block_others(self):
+        release = threading.Event()
+        self.server.active.get_all_kafka_broker_ids.side_effect = lambda: release.wait(5) and {}
+        slow = threading.Thread(target=self.client.call, args=(TARGET, 'get_all_kafka_broker_ids'))
+        slow.start()
+        try:
+            while not self.server.active.get_all_kafka_broker_ids.called:
+                time.sleep(0.001)
+            self.assertEqual(self.client.call(TARGET, 'get_hosts_by_role', 'kafka', 'KAFKA_BROKER'),
+                             ['broker1', 'broker2'])
+            self.assertTrue(slow.is_alive())
+        finally:
+            release.set()
+            slow.join()
+
+    def test_running_daemon_socket_is_not_removed(self):
+        self.assertFalse(remove_stale_socket(self.socket_path))
+
+    def test_socket_is_private(self):
+        self.assertEqual(stat.S_IMODE(os.stat(self.socket_path).st_mode), 0o600)
+
+    def test_socket_of_other_user_is_not_trusted(self):
+        with mock.patch('os.getuid', return_value=os.getuid() + 1):
+            with self.assertRaises(DaemonUnavailable):
+                self.client.call(TARGET, 'get_hosts_by_role', 'kafka', 'KAFKA_BROKER')
+        self.assertFalse(self.server.active.get_hosts_by_role.called)
+
+
+class TestDaemonClient(unittest.TestCase):
+    def test_missing_socket(self):
+        with self.assertRaises(DaemonUnavailable):
+            DaemonClient('/nonexistent/apicm.sock').call(TARGET, 'get_hosts_by_role', 'kafka', 'KAFKA_BROKER')
+
+    def test_file_is_not_socket(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'apicm.sock')
+        open(path, 'w').close()
+        with self.assertRaises(DaemonUnavailable):
+            DaemonClient(path).call(TARGET, 'get_hosts_by_role', 'kafka', 'KAFKA_BROKER')
+
+    def test_default_socket_path(self):
+        with mock.patch.dict('os.environ', {'XDG_RUNTIME_DIR': '/run/user/1000'}, clear=True):
+            self.assertEqual(default_socket_path(), '/run/user/1000/apicm.sock')
+        with mock.patch.dict('os.environ', {}, clear=True):
+            self.assertEqual(default_socket_path(), '/tmp/apicm-{0}/apicm.sock'.format(os.getuid()))
+
+    def test_socket_directory_is_private(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        ensure_socket_directory(os.path.join(directory, 'apicm', 'apicm.sock'))
+        self.assertEqual(stat.S_IMODE(os.stat(os.path.join(directory, 'apicm')).st_mode), 0o700)
+
+
+if __name__ == '__main__':
+    unittest.main()
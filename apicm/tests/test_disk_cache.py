@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from apicm.disk_cache import DiskCache, MISSING
+
+
+class TestDiskCache(unittest.TestCase):
+    KEY = ['cm_host', '7180', 'cluster', 'get_hosts_by_role', ('kafka', 'KAFKA_BROKER'), {}]
+
+    def setUp(self):
+        self.now = 1000
+        self.directory = os.path.join(tempfile.mkdtemp(), 'cache')
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.directory))
+        self.cache = DiskCache(self.directory, ttl=60, timer=lambda: self.now)
+
+    def test_missing_entry(self):
+        self.assertIs(self.cache.get(self.KEY), MISSING)
+
+    def test_set_and_get(self):
+        self.cache.set(self.KEY, ['broker1', 'broker2'])
+        self.assertEqual(self.cache.get(self.KEY), ['broker1', 'broker2'])
+        self.assertEqual(DiskCache(self.directory, ttl=60, timer=lambda: self.now).get(self.KEY),
+                         ['broker1', 'broker2'])
+
+    def test_none_value_is_cached(self):
+        self.cache.set(self.KEY, None)
+        self.assertIsNone(self.cache.get(self.KEY))
+
+    def test_entry_expires(self):
+        self.cache.set(self.KEY, 'value')
+        self.now += 61
+        self.assertIs(self.cache.get(self.KEY), MISSING)
+
+    def test_no_temporary_files_left(self):
+        self.cache.set(self.KEY, 'value')
+        self.assertEqual([name for name in os.listdir(self.directory) if name.startswith('.tmp-')], [])
+
+    def test_corrupted_entry_is_ignored(self):
+        self.cache.set(self.KEY, 'value')
+        for name in os.listdir(self.directory):
+            with open(os.path.join(self.directory, name), 'w') as cache_file:
+                cache_file.write('{"key": ')
+        self.assertIs(self.cache.get(self.KEY), MISSING)
+
+    def test_clear(self):
+        self.cache.set(self.KEY, 'value')
+        self.cache.clear()
+        self.assertIs(self.cache.get(self.KEY), MISSING)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import mock
+import time
+import unittest
+
+from apicm.fleet import FleetClient
+
+
+class TestFleetClient(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('cm_api.api_client.ApiResource')
+        self.addCleanup(patcher.stop)
+        patcher.start()
+        self.fleet = FleetClient([('cm1', 'cluster'), ('cm2', 'cluster'), ('cm3', 'other')], 'admin', 'admin',
+                                 timeout=0.5)
+
+    def patch_method(self, side_effects):
+        for client, side_effect in zip(self.fleet.clients, side_effects):
+            client.get_hosts_by_role = mock.Mock(side_effect=side_effect)
+
+    def test_merged_results(self):
+        self.patch_method([lambda *args: ['broker1'], lambda *args: ['broker2', 'broker3'], lambda *args: []])
+        result = self.fleet.query('get_hosts_by_role', 'kafka', 'KAFKA_BROKER')
+        self.assertTrue(result.ok)
+        self.assertEqual(result.merged(), [
+            ('cm1', 'cluster', 'broker1'), ('cm2', 'cluster', 'broker2'), ('cm2', 'cluster', 'broker3')
+        ])
+
+    def test_partial_failure_and_timeout(self):
+        def fail(*args):
+            raise ValueError('boom')
+
+        self.patch_method([lambda *args: ['broker1'], fail, lambda *args: time.sleep(2)])
+        started = time.time()
+        result = self.fleet.query('get_hosts_by_role', 'kafka', 'KAFKA_BROKER')
+        self.assertLess(time.time() - started, 1.5)
+        self.assertEqual(result.merged(), [('cm1', 'cluster', 'broker1')])
+        self.assertEqual([(error['cm_host'], error['error']) for error in result.errors], [
+            ('cm2', 'ValueError: boom'), ('cm3', 'Timed out after 0.5 seconds.')
+        ])
+
+    def test_targets_run_concurrently(self):
+        self.patch_method([lambda *args: time.sleep(0.3) or []] * 3)
+        started = time.time()
+        self.assertTrue(self.fleet.query('get_hosts_by_role', 'kafka', 'KAFKA_BROKER').ok)
+        self.assertLess(time.time() - started, 0.6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import mock
+import threading
+import unittest
+
+from apicm.instrumentation import CallCounter, Instrumentation, RestCall, instrumented
+
+
+def make_response(body, code=200):
+    response = mock.Mock()
+    response.read.return_value = body
+    response.getcode.return_value = code
+    return response
+
+
+class Client(object):
+    def __init__(self, instrumentation):
+        self.instrumentation = instrumentation
+        self.execute = self.raw_execute = mock.Mock(return_value=make_response('{"items": []}'))
+        instrumentation.instrument_client(self)
+
+    @instrumented
+    def get_roles(self):
+        return self.execute('GET', '/roles').read()
+
+    @instrumented
+    def get_all(self):
+        self.get_roles()
+        result = []
+
+        def get_config(name):
+            return self.execute('GET', '/roles/{0}/config'.format(name)).read()
+
+        threads = [threading.Thread(target=self.instrumentation.bind(get_config), args=(name,))
+                   for name in ('a', 'b')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return result
+
+    @instrumented
+    def iter_roles(self):
+        for name in ('a', 'b'):
+            self.execute('GET', '/roles/{0}'.format(name))
+            yield name
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.timer = mock.Mock(side_effect=[float(i) for i in range(100)])
+        self.instrumentation = Instrumentation(timer=self.timer)
+        self.calls = []
+        self.instrumentation.subscribe(self.calls.append)
+        self.client = Client(self.instrumentation)
+
+    def test_records_request(self):
+        self.assertEqual(self.client.get_roles(), '{"items": []}')
+        self.assertEqual(self.calls, [RestCall('get_roles', 'GET', '/roles', 200, 13, 1.0)])
+
+    def test_no_subscribers(self):
+        self.instrumentation.unsubscribe(self.calls.append)
+        self.client.get_roles()
+        self.assertFalse(self.timer.called)
+
+    def test_error_status(self):
+        error = Exception('Not found')
+        error.code = 404
+        self.client.raw_execute.side_effect = error
+        self.assertRaises(Exception, self.client.get_roles)
+        self.assertEqual(self.calls[0].status, 404)
+        self.assertEqual(self.calls[0].bytes, 0)
+
+    def test_nested_and_threaded_requests(self):
+        self.client.get_all()
+        self.assertEqual(len(self.calls), 3)
+        self.assertEqual(set(call.api_method for call in self.calls), set(['get_all']))
+        self.client.execute('GET', '/hosts')
+        self.assertEqual(self.calls[-1].api_method, None)
+
+    def test_generator(self):
+        for _ in self.client.iter_roles():
+            self.client.execute('GET', '/hosts')
+        self.assertEqual([call.api_method for call in self.calls], ['iter_roles', None, 'iter_roles', None])
+
+    def test_call_counter(self):
+        counter = self.instrumentation.subscribe(CallCounter())
+        self.client.get_all()
+        self.client.get_roles()
+        self.assertEqual(counter.methods['get_all']['count'], 3)
+        self.assertEqual(counter.methods['get_roles']['count'], 1)
+        self.assertEqual(counter.requests[('get_all', 'GET', '/roles')]['count'], 1)
+        self.assertEqual(counter.total()['count'], 4)
+        report = counter.report()
+        self.assertTrue(report.startswith('4 requests, 0 errors'))
+        self.assertIn('  get_all: 3 requests', report)
+
+
+if __name__ == '__main__':
+    unittest.main()
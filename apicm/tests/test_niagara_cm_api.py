@@ -0,0 +1,401 @@
+import mock
+import unittest
+import urllib2
+
+from apicm import NiagaraCMApi
+from apicm.apicm import check_broker_ids, find_config_drift, plan_log_dirs
+
+
+def make_host(host_id, hostname):
+    host = mock.Mock()
+    host.hostId = host_id
+    host.hostname = hostname
+    return host
+
+
+def make_command(role_name, success=True):
+    command = mock.Mock()
+    command.roleRef.roleName = role_name
+    command.active = True
+    finished = mock.Mock()
+    finished.active = False
+    finished.success = success
+    finished.resultMessage = 'Failed to start' if not success else None
+    command.fetch.return_value = finished
+    return command
+
+
+def make_role(name, host_id, role_state='STARTED', maintenance=False, ha_status=None, group='kafka-KAFKA_BROKER-BASE'):
+    role = mock.Mock()
+    role.name = name
+    role.roleConfigGroupRef.roleConfigGroupName = group
+    role.hostRef.hostId = host_id
+    role.roleState = role_state
+    role.maintenanceMode = maintenance
+    role.haStatus = ha_status
+    role.get_config.return_value = {'broker.id': name[-1], 'log.dirs': '/data1/kafka,/data2/kafka'}
+    return role
+
+
+class TestNiagaraCMApi(unittest.TestCase):
+    HOSTS = [make_host('id-1', 'broker1.example.com'), make_host('id-2', 'broker2.example.com')]
+
+    def setUp(self):
+        patcher = mock.patch('cm_api.api_client.ApiResource')
+        self.addCleanup(patcher.stop)
+        patcher.start()
+        self.cm_api = NiagaraCMApi(cm_host='cm_host', user='admin', password='admin')
+        self.cm_api.api.get_all_hosts.return_value = self.HOSTS
+        self.roles = [make_role('kafka-broker-1', 'id-1'), make_role('kafka-broker-2', 'id-2')]
+        self.service = self.cm_api.api.get_cluster.return_value.get_service.return_value
+        self.service.get_roles_by_type.return_value = self.roles
+        self.service.get_commands.return_value = []
+
+    def test_get_hosts_by_role_uses_host_index(self):
+        result = self.cm_api.get_hosts_by_role('kafka', 'KAFKA_BROKER')
+        self.assertEqual(result, ['broker1.example.com', 'broker2.example.com'])
+        self.assertEqual(self.cm_api.api.get_all_hosts.call_count, 1)
+        self.assertFalse(self.cm_api.api.get_host.called)
+
+    def test_host_index_is_reused(self):
+        self.cm_api.get_hosts_by_role('kafka', 'KAFKA_BROKER')
+        self.cm_api.get_broker_status('broker2.example.com')
+        self.assertEqual(self.cm_api.api.get_all_hosts.call_count, 1)
+
+    def test_get_host_id(self):
+        self.assertEqual(self.cm_api.get_host_id('broker2.example.com'), 'id-2')
+
+    def test_get_hostname_refreshes_unknown_host(self):
+        self.cm_api.get_host_index()
+        self.cm_api.api.get_all_hosts.return_value = self.HOSTS + [make_host('id-3', 'broker3.example.com')]
+        self.assertEqual(self.cm_api.get_hostname('id-3'), 'broker3.example.com')
+        self.assertEqual(self.cm_api.api.get_all_hosts.call_count, 2)
+
+    def test_cluster_service_and_roles_are_cached(self):
+        self.cm_api.get_hosts_by_role('kafka', 'KAFKA_BROKER')
+        self.cm_api.get_broker_status('broker1.example.com')
+        self.cm_api.get_log_dirs_for_kafka_broker('broker1.example.com')
+        self.assertEqual(self.cm_api.api.get_cluster.call_count, 1)
+        self.assertEqual(self.service.get_roles_by_type.call_count, 1)
+
+    def test_broker_action_invalidates_roles(self):
+        self.roles[0].maintenanceMode = False
+        self.service.stop_roles.return_value = [make_command('kafka-broker-1')]
+        with mock.patch('apicm.commands.time.sleep'):
+            self.cm_api.kafka_broker_action('broker1.example.com', 'stop')
+        self.service.stop_roles.assert_called_with('kafka-broker-1')
+        self.assertEqual(self.service.get_roles_by_type.call_count, 2)
+        self.assertEqual(self.cm_api.api.get_cluster.call_count, 1)
+
+    def test_get_roles_by_hostnames(self):
+        result = self.cm_api.get_roles_by_hostnames(['broker2.example.com', 'unknown.example.com'])
+        self.assertEqual(result, {'broker2.example.com': self.roles[1], 'unknown.example.com': None})
+
+    def test_per_broker_lookups_use_role_index(self):
+        self.assertEqual(self.cm_api.get_kafka_broker_id_by_hostname('broker2.example.com'), '2')
+        self.assertEqual(self.cm_api.get_broker_status('broker1.example.com'), ('STARTED', False))
+        self.assertIsNone(self.cm_api.get_broker_status('unknown.example.com'))
+        self.assertEqual(self.service.get_roles_by_type.call_count, 1)
+
+    def test_kafka_brokers_action_bounds_in_flight(self):
+        self.roles.append(make_role('kafka-broker-3', 'id-3'))
+        self.roles.append(make_role('kafka-broker-4', 'id-4', maintenance=True))
+        self.cm_api.api.get_all_hosts.return_value = self.HOSTS + [
+            make_host('id-3', 'broker3.example.com'), make_host('id-4', 'broker4.example.com')
+        ]
+        self.service.restart_roles.side_effect = lambda *names: [
+            make_command(name, success=name != 'kafka-broker-2') for name in names
+        ]
+        results = list(self.cm_api.kafka_brokers_action(
+            'restart', role_config_group='kafka-KAFKA_BROKER-BASE', max_in_flight=2, poll_interval=0
+        ))
+        self.assertEqual(self.service.restart_roles.call_args_list, [
+            mock.call('kafka-broker-1', 'kafka-broker-2'), mock.call('kafka-broker-3')
+        ])
+        self.assertEqual(sorted(results), [
+            ('broker1.example.com', 'STARTED'),
+            ('broker2.example.com', 'Error: Failed to start'),
+            ('broker3.example.com', 'STARTED'),
+            ('broker4.example.com', True),
+        ])
+
+    def test_kafka_brokers_action_unknown_action(self):
+        with self.assertRaises(ValueError):
+            list(self.cm_api.kafka_brokers_action('reboot', nodenames=['broker1.example.com']))
+        with self.assertRaises(ValueError):
+            list(self.cm_api.kafka_brokers_action('restart', nodenames=['broker1.example.com'], max_in_flight=0))
+
+    def test_kafka_brokers_action_continues_after_failed_batch(self):
+        class BulkCommands(list):
+            errors = None
+
+        self.roles.append(make_role('kafka-broker-3', 'id-3'))
+        self.cm_api.api.get_all_hosts.return_value = self.HOSTS + [make_host('id-3', 'broker3.example.com')]
+        busy = BulkCommands()
+        busy.errors = ['role busy']
+        self.service.restart_roles.side_effect = [busy, [make_command('kafka-broker-2')],
+                                                  [make_command('kafka-broker-3')]]
+        results = list(self.cm_api.kafka_brokers_action(
+            'restart', nodenames=['broker1.example.com', 'broker2.example.com', 'broker3.example.com'],
+            max_in_flight=1, poll_interval=0
+        ))
+        self.assertEqual(results, [
+            ('broker1.example.com', 'Error: role busy'),
+            ('broker2.example.com', 'STARTED'),
+            ('broker3.example.com', 'STARTED'),
+        ])
+
+    def test_plan_log_dirs_matches_whole_paths(self):
+        self.assertEqual(plan_log_dirs(['/data1', '/data10'], remove=['/data1']), ['/data10'])
+        self.assertEqual(plan_log_dirs(['/data1'], add=['/data1/', '/data2']), ['/data1', '/data2'])
+
+    def test_edit_kafka_log_dirs(self):
+        changes = {
+            'broker1.example.com': {'add': ['/data3/kafka'], 'remove': ['/data1/kafka']},
+            'broker2.example.com': {'add': ['/data2/kafka']},
+            'unknown.example.com': {'add': ['/data3/kafka']},
+        }
+        result = self.cm_api.edit_kafka_log_dirs(changes)
+        self.assertEqual(result['broker1.example.com']['status'], 'updated')
+        self.assertEqual(result['broker2.example.com']['status'], 'unchanged')
+        self.assertEqual(result['unknown.example.com']['status'], 'error')
+        self.roles[0].update_config.assert_called_once_with({'log.dirs': '/data2/kafka,/data3/kafka'})
+        self.assertFalse(self.roles[1].update_config.called)
+
+    def test_edit_kafka_log_dirs_connection_error(self):
+        self.roles[1].update_config.side_effect = urllib2.URLError('Connection refused')
+        changes = {
+            'broker1.example.com': {'add': ['/data3/kafka']},
+            'broker2.example.com': {'add': ['/data3/kafka']},
+        }
+        with mock.patch.object(self.cm_api, 'invalidate') as invalidate:
+            result = self.cm_api.edit_kafka_log_dirs(changes)
+        self.assertEqual(result['broker1.example.com']['status'], 'updated')
+        self.assertEqual(result['broker2.example.com']['status'], 'error')
+        self.assertIn('Connection refused', result['broker2.example.com']['message'])
+        invalidate.assert_called_once_with('kafka')
+
+    def test_edit_kafka_log_dirs_dry_run_and_group_value(self):
+        self.set_role_config_groups()
+        self.roles[0].get_config.return_value = {'broker.id': '1'}
+        result = self.cm_api.edit_kafka_log_dirs({'broker1.example.com': {'add': ['/data2/kafka']}}, dry_run=True)
+        # Broker without log.dirs override uses cloudera manager default.
+        self.assertEqual(result['broker1.example.com'], {
+            'old': ['/var/local/kafka/data'], 'new': ['/var/local/kafka/data', '/data2/kafka'], 'status': 'planned',
+            'message': None
+        })
+        self.assertFalse(self.roles[0].update_config.called)
+
+    def test_edit_log_dir_from_kafka_broker(self):
+        self.roles[0].get_config.return_value = {'broker.id': '1', 'log.dirs': '/data1,/data10'}
+        self.assertEqual(self.cm_api.edit_log_dir_from_kafka_broker('broker1.example.com', '/data1', 'remove'),
+                         (0, 'Broker config updated.'))
+        self.roles[0].update_config.assert_called_once_with({'log.dirs': '/data10'})
+        self.assertEqual(self.cm_api.edit_log_dir_from_kafka_broker('broker1.example.com', '/data10/', 'add'),
+                         (0, 'Log dir /data10/ is already in a config.'))
+        self.assertEqual(self.cm_api.edit_log_dir_from_kafka_broker('broker1.example.com', '/data2', 'remove'),
+                         (0, 'Log dir /data2 is not in a config.'))
+        self.assertEqual(self.roles[0].update_config.call_count, 1)
+
+    def test_get_all_kafka_broker_ids(self):
+        self.roles.append(make_role('kafka-broker-3', 'id-3'))
+        self.roles[2].get_config.return_value = {}
+        self.cm_api.api.get_all_hosts.return_value = self.HOSTS + [make_host('id-3', 'broker3.example.com')]
+        self.set_role_config_groups()
+        result = self.cm_api.get_all_kafka_broker_ids()
+        self.assertEqual(result, {'broker1.example.com': '1', 'broker2.example.com': '2', 'broker3.example.com': None})
+        self.assertEqual(self.cm_api.api.get_all_hosts.call_count, 1)
+        self.assertFalse(self.cm_api.api.get_host.called)
+        # Role configs are read with one roles listing, not per role.
+        self.cm_api.api.get.assert_called_once_with('/clusters/cluster/services/kafka/roles', params={'view': 'full'})
+        self.assertFalse(any(node.get_config.called for node in self.roles))
+
+    def test_check_broker_ids(self):
+        result = check_broker_ids({'broker1': '1', 'broker2': '1', 'broker3': None, 'broker4': '4'})
+        self.assertEqual(result, {'missing': ['broker3'], 'duplicates': {'1': ['broker1', 'broker2']}})
+
+    def test_get_roles_on_host(self):
+        def role_ref(service_name, role_name, cluster_name='cluster'):
+            ref = mock.Mock()
+            ref.clusterName, ref.serviceName, ref.roleName = cluster_name, service_name, role_name
+            return ref
+
+        zookeeper = make_role('zookeeper-server-1', 'id-1')
+        zookeeper.type = 'SERVER'
+        for node in self.roles:
+            node.type = 'KAFKA_BROKER'
+        self.service.get_all_roles.return_value = self.roles + [zookeeper]
+        self.cm_api.api.get_host.return_value.roleRefs = [
+            role_ref('zookeeper', 'zookeeper-server-1'),
+            role_ref('kafka', 'kafka-broker-1'),
+            role_ref('mgmt', 'mgmt-HOSTMONITOR-1', cluster_name=None),
+        ]
+        result = self.cm_api.get_roles_on_host('broker1.example.com')
+        self.assertEqual(result, [
+            {'service': 'kafka', 'type': 'KAFKA_BROKER', 'name': 'kafka-broker-1', 'roleState': 'STARTED',
+             'haStatus': None},
+            {'service': 'zookeeper', 'type': 'SERVER', 'name': 'zookeeper-server-1', 'roleState': 'STARTED',
+             'haStatus': None},
+        ])
+        self.cm_api.api.get_host.assert_called_once_with('id-1')
+        # Roles of every service are listed once.
+        self.assertEqual(self.service.get_all_roles.call_count, 2)
+        self.assertIsNone(self.cm_api.get_roles_on_host('unknown.example.com'))
+
+    def set_role_config_groups(self):
+        groups = {'items': [
+            {'name': 'kafka-KAFKA_BROKER-BASE', 'roleType': 'KAFKA_BROKER', 'config': {'items': [
+                {'name': 'port', 'value': '9093', 'default': '9092'},
+                {'name': 'log.dirs', 'default': '/var/local/kafka/data'},
+                {'name': 'broker_max_heap_size', 'default': '1024'},
+            ]}},
+            {'name': 'kafka-GATEWAY-BASE', 'roleType': 'GATEWAY'},
+        ]}
+
+        def get(path, params=None):
+            if path.endswith('/roleConfigGroups'):
+                return groups
+            # Full view of roles listing, config items of overrides only.
+            return {'items': [{
+                'name': node.name, 'type': 'KAFKA_BROKER', 'hostRef': {'hostId': node.hostRef.hostId},
+                'roleConfigGroupRef': {'roleConfigGroupName': node.roleConfigGroupRef.roleConfigGroupName},
+                'config': {'items': [{'name': key, 'value': value}
+                                     for key, value in node.get_config.return_value.items()]},
+            } for node in self.roles]}
+        self.cm_api.api.get.side_effect = get
+
+    def test_get_configs_group_scope(self):
+        self.set_role_config_groups()
+        result = self.cm_api.get_configs('kafka', ['port', 'log.dirs', 'unknown'])
+        self.assertEqual(result, {
+            'kafka-KAFKA_BROKER-BASE': {'port': '9093', 'log.dirs': '/var/local/kafka/data', 'unknown': None},
+            'kafka-GATEWAY-BASE': {'port': None, 'log.dirs': None, 'unknown': None},
+        })
+        self.assertEqual(self.cm_api.get_service_ports('kafka', 'kafka-KAFKA_BROKER-BASE'), '9093')
+        self.cm_api.api.get.assert_called_once_with('/clusters/cluster/services/kafka/roleConfigGroups',
+                                                    params={'view': 'full'})
+
+    def test_get_configs_role_scope(self):
+        self.set_role_config_groups()
+        result = self.cm_api.get_configs('kafka', ['port', 'log.dirs', 'broker_max_heap_size'], scope='role',
+                                         role='KAFKA_BROKER')
+        self.assertEqual(result, {
+            'broker1.example.com': {'port': '9093', 'log.dirs': '/data1/kafka,/data2/kafka',
+                                    'broker_max_heap_size': '1024'},
+            'broker2.example.com': {'port': '9093', 'log.dirs': '/data1/kafka,/data2/kafka',
+                                    'broker_max_heap_size': '1024'},
+        })
+        self.assertEqual(self.cm_api.api.get.call_count, 2)
+        self.assertFalse(any(node.get_config.called for node in self.roles))
+
+    def test_iter_configs_is_lazy(self):
+        self.set_role_config_groups()
+        configs = self.cm_api.iter_configs('kafka', ['port'], scope='role', role='KAFKA_BROKER')
+        self.assertFalse(self.cm_api.api.get.called)
+        self.assertEqual(sorted(configs), [('broker1.example.com', {'port': '9093'}),
+                                           ('broker2.example.com', {'port': '9093'})])
+
+    def test_iter_hosts_by_role(self):
+        hosts = self.cm_api.iter_hosts_by_role('kafka', 'KAFKA_BROKER')
+        self.assertEqual(next(hosts), 'broker1.example.com')
+        self.assertEqual(list(hosts), ['broker2.example.com'])
+
+    def test_find_config_drift(self):
+        result = find_config_drift({'broker1': {'port': '9092'}, 'broker2': {'port': '9092'},
+                                    'broker3': {'port': '9093'}})
+        self.assertEqual([group['hostnames'] for group in result['groups']], [['broker1', 'broker2'], ['broker3']])
+        self.assertTrue(result['groups'][0]['reference'])
+        self.assertEqual(result['outliers'], {'broker3': {'port': {'expected': '9092', 'actual': '9093'}}})
+        self.assertEqual(find_config_drift({}), {'groups': [], 'outliers': {}})
+
+    def test_detect_config_drift(self):
+        self.set_role_config_groups()
+        self.roles[0].get_config.return_value = {'broker.id': '1', 'log.dirs': '/data1/kafka, /data2/kafka'}
+        self.roles[1].get_config.return_value = {'broker.id': '2', 'log.dirs': '/data1/kafka,/data2/kafka',
+                                                 'broker_max_heap_size': '2048'}
+        baseline = {}
+        result = self.cm_api.detect_config_drift(baseline=baseline)
+        self.assertEqual(result['keys'], ['broker_max_heap_size', 'log.dirs'])
+        self.assertEqual(result['outliers'], {
+            'broker2.example.com': {'broker_max_heap_size': {'expected': '1024', 'actual': '2048'}}})
+        self.assertEqual(result['roles'], 2)
+        self.assertEqual(result['changed'], ['broker1.example.com', 'broker2.example.com'])
+        self.assertEqual(sorted(baseline), ['broker1.example.com', 'broker2.example.com'])
+
+        # Applied change (role is not stale anymore) is found as well.
+        self.roles[1].get_config.return_value = {'broker.id': '2', 'log.dirs': '/data1/kafka,/data2/kafka'}
+        result = self.cm_api.detect_config_drift(baseline=baseline)
+        self.assertEqual(result['outliers'], {})
+        self.assertEqual(result['changed'], ['broker2.example.com'])
+        self.assertFalse(self.roles[0].get_config.called)
+        self.assertEqual(self.cm_api.api.get.call_count, 3)
+
+    def test_get_configs_service_scope(self):
+        self.cm_api.api.get.return_value = {'items': [{'name': 'zookeeper.chroot', 'value': '/kafka'}]}
+        self.assertEqual(self.cm_api.get_configs('kafka', ['zookeeper.chroot'], scope='service'),
+                         {'zookeeper.chroot': '/kafka'})
+
+    def test_get_configs_errors(self):
+        self.assertRaises(ValueError, self.cm_api.get_configs, 'kafka', ['port'], scope='host')
+        self.assertRaises(ValueError, self.cm_api.get_configs, 'kafka', ['port'], scope='role')
+        self.assertRaises(ValueError, self.cm_api.get_service_ports, 'hdfs', 'hdfs-NAMENODE-BASE')
+
+    def test_get_service_status(self):
+        for node in self.roles:
+            node.healthSummary = 'GOOD'
+            node.configStalenessStatus = 'FRESH'
+            node.healthChecks = [{'name': 'KAFKA_BROKER_HOST_HEALTH', 'summary': 'GOOD', 'suppressed': False}]
+        self.roles[1].configStalenessStatus = 'STALE'
+        status = self.cm_api.get_service_status('kafka', 'KAFKA_BROKER')
+        self.assertEqual(sorted(status), ['broker1.example.com', 'broker2.example.com'])
+        self.assertEqual(status['broker2.example.com'], {
+            'role': 'kafka-broker-2', 'roleState': 'STARTED', 'healthSummary': 'GOOD', 'maintenanceMode': False,
+            'haStatus': None, 'configStalenessStatus': 'STALE',
+            'healthChecks': [{'name': 'KAFKA_BROKER_HOST_HEALTH', 'summary': 'GOOD'}],
+        })
+        self.assertEqual(self.service.get_roles_by_type.call_count, 1)
+        self.assertEqual(self.cm_api.api.get_all_hosts.call_count, 1)
+
+    @mock.patch('apicm.apicm.time.sleep')
+    def test_watch_roles(self, sleep):
+        for node in self.roles:
+            node.type = 'KAFKA_BROKER'
+            node.healthSummary = 'GOOD'
+        stopped = make_role('kafka-broker-1', 'id-1', role_state='STOPPED')
+        stopped.type = 'KAFKA_BROKER'
+        stopped.healthSummary = 'BAD'
+        self.service.get_all_roles.side_effect = [
+            self.roles, self.roles, self.roles, [stopped, self.roles[1]], [self.roles[1]],
+        ]
+        watch = self.cm_api.watch_roles('kafka', 'KAFKA_BROKER', interval=1, max_interval=3)
+        first = [next(watch), next(watch)]
+        self.assertEqual([event['hostname'] for event in first], ['broker1.example.com', 'broker2.example.com'])
+        self.assertEqual(first[0]['changes']['roleState'], [None, 'STARTED'])
+        changed = next(watch)
+        self.assertEqual(changed['role'], 'kafka-broker-1')
+        self.assertEqual(changed['changes'], {'roleState': ['STARTED', 'STOPPED'], 'healthSummary': ['GOOD', 'BAD']})
+        # Nothing changed in two polls, interval grew up to max_interval.
+        self.assertEqual([call[0][0] for call in sleep.call_args_list], [1, 2, 3])
+        removed = next(watch)
+        self.assertEqual(removed['changes']['roleState'], ['STOPPED', None])
+        self.assertEqual(sleep.call_args[0][0], 1)
+        self.assertEqual(self.service.get_all_roles.call_count, 5)
+        self.assertEqual(self.cm_api.api.get_all_hosts.call_count, 1)
+
+
+    @mock.patch('apicm.apicm.time.sleep')
+    def test_watch_roles_backs_off_after_errors(self, sleep):
+        for node in self.roles:
+            node.type = 'KAFKA_BROKER'
+            node.healthSummary = 'GOOD'
+        self.service.get_all_roles.side_effect = [IOError('refused')] * 3 + [self.roles]
+        watch = self.cm_api.watch_roles('kafka', 'KAFKA_BROKER', interval=1, max_interval=3)
+        errors = [next(watch) for _ in range(3)]
+        self.assertEqual([event['error'] for event in errors], ['refused'] * 3)
+        self.assertEqual(next(watch)['hostname'], 'broker1.example.com')
+        # Failed polls back off like idle ones, interval is reset only by role changes.
+        self.assertEqual([call[0][0] for call in sleep.call_args_list], [2, 3, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
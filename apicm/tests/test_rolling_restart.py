@@ -0,0 +1,74 @@
+import json
+import mock
+import os
+import shutil
+import tempfile
+import unittest
+
+from apicm.rolling_restart import RollingRestart, RollingRestartError
+
+BROKERS = ['broker1', 'broker2', 'broker3']
+
+
+def make_role(role_state='STARTED', health='GOOD'):
+    role = mock.Mock()
+    role.roleState = role_state
+    role.healthSummary = health
+    return role
+
+
+class TestRollingRestart(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.state_file = os.path.join(directory, 'state.json')
+        self.cm = mock.Mock()
+        self.cm.get_hosts_by_role.return_value = BROKERS
+        self.cm.kafka_brokers_action.side_effect = lambda action, nodenames, **kwargs: [
+            (nodename, 'STARTING') for nodename in nodenames
+        ]
+        self.cm.get_roles_by_hostnames.side_effect = lambda nodenames, *args: dict(
+            (nodename, make_role()) for nodename in nodenames
+        )
+        self.rollout = RollingRestart(self.cm, batch_size=2, state_file=self.state_file, min_poll=0)
+
+    def test_restart_in_batches(self):
+        results = list(self.rollout.run())
+        self.assertEqual(results, [(broker, 'STARTED') for broker in BROKERS])
+        batches = [call[1]['nodenames'] for call in self.cm.kafka_brokers_action.call_args_list]
+        self.assertEqual(batches, [['broker1', 'broker2'], ['broker3']])
+        self.assertFalse(os.path.exists(self.state_file))
+
+    def test_resume_from_state(self):
+        with open(self.state_file, 'w') as state_file:
+            json.dump({'done': ['broker1', 'broker2']}, state_file)
+        results = list(self.rollout.run())
+        self.assertEqual(results, [('broker3', 'STARTED')])
+
+    def test_unhealthy_batch_stops_rollout(self):
+        self.cm.get_roles_by_hostnames.side_effect = lambda nodenames, *args: dict(
+            (nodename, make_role(health='BAD')) for nodename in nodenames
+        )
+        self.rollout.timeout = 0
+        with self.assertRaises(RollingRestartError):
+            list(self.rollout.run())
+        self.assertEqual(self.cm.kafka_brokers_action.call_count, 1)
+
+    def test_restart_timeout_stops_rollout(self):
+        self.cm.kafka_brokers_action.side_effect = lambda action, nodenames, **kwargs: [
+            (nodename, 'Error: command 7 timed out') for nodename in nodenames
+        ]
+        with self.assertRaises(RollingRestartError):
+            list(self.rollout.run())
+        self.assertEqual(self.cm.kafka_brokers_action.call_args[1]['timeout'], self.rollout.timeout)
+        self.assertFalse(self.cm.get_roles_by_hostnames.called)
+
+    def test_state_saved_after_batch(self):
+        rollout = self.rollout.run()
+        next(rollout)
+        with open(self.state_file) as state_file:
+            self.assertEqual(json.load(state_file)['done'], ['broker1', 'broker2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
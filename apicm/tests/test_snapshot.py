@@ -0,0 +1,163 @@
+import mock
+import os
+import shutil
+import tempfile
+import unittest
+
+from apicm import NiagaraCMApi
+from apicm.snapshot import SnapshotError, SnapshotNiagaraCMApi, build_snapshot, read_snapshot, write_snapshot
+from apicm.tests.fake_cm import FakeCluster, FakeCMServer
+
+
+def make_host(host_id, hostname):
+    host = mock.Mock()
+    host.hostId = host_id
+    host.hostname = hostname
+    return host
+
+
+def make_role(name, role_type, host_id, ha_status=None, config=None, service_name='kafka'):
+    role = mock.Mock()
+    role.name = name
+    role.type = role_type
+    role.hostRef.hostId = host_id
+    role.roleState = 'STARTED'
+    role.healthSummary = 'GOOD'
+    role.maintenanceMode = False
+    role.haStatus = ha_status
+    role.configStalenessStatus = 'FRESH'
+    role.healthChecks = [{'name': '{0}_HOST_HEALTH'.format(role_type), 'summary': 'GOOD'}]
+    role.roleConfigGroupRef.roleConfigGroupName = '{0}-{1}-BASE'.format(service_name, role_type)
+    role.get_config.return_value = config or {}
+    return role
+
+
+def make_service(name, service_type, roles):
+    service = mock.Mock()
+    service.name = name
+    service.type = service_type
+    service.get_all_roles.return_value = roles
+    service.get_role_types.return_value = sorted(set(role.type for role in roles))
+    return service
+
+
+def role_config_groups(groups):
+    """
+    Function makes full view of role config groups listing from dictionary group name:config items.
+    """
+    return {'items': [{'name': name, 'roleType': name.split('-')[1], 'config': {'items': items}}
+                      for name, items in groups.items()]}
+
+
+def roles_full(roles):
+    """
+    Function makes full view of roles listing, config items of overrides only.
+    """
+    return {'items': [{'name': role.name, 'type': role.type, 'hostRef': {'hostId': role.hostRef.hostId},
+                       'config': {'items': [{'name': key, 'value': value}
+                                            for key, value in role.get_config.return_value.items()]}}
+                      for role in roles]}
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('cm_api.api_client.ApiResource')
+        self.addCleanup(patcher.stop)
+        patcher.start()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'snapshot.json.gz')
+
+        cm_api = NiagaraCMApi(cm_host='cm_host', user='admin', password='admin')
+        cm_api.api.get_all_hosts.return_value = [make_host('id-1', 'node1'), make_host('id-2', 'node2')]
+        kafka = make_service('kafka', 'KAFKA', [
+            make_role('broker-1', 'KAFKA_BROKER', 'id-1', config={'broker.id': '11', 'log.dirs': '/data1,/data2'}),
+            make_role('broker-2', 'KAFKA_BROKER', 'id-2', config={'broker.id': '12', 'log.dirs': '/data1'}),
+        ])
+        hdfs = make_service('hdfs', 'HDFS', [
+            make_role('nn-1', 'NAMENODE', 'id-1', ha_status='ACTIVE', service_name='hdfs'),
+            make_role('nn-2', 'NAMENODE', 'id-2', ha_status='STANDBY', service_name='hdfs'),
+        ])
+        cm_api.api.get_cluster.return_value.get_all_services.return_value = [kafka, hdfs]
+        groups = {
+            # Port is not overridden, cloudera manager default is used.
+            'kafka': role_config_groups({'kafka-KAFKA_BROKER-BASE': [
+                {'name': 'port', 'default': '9092'}, {'name': 'log.dirs', 'default': '/var/local/kafka/data'}]}),
+            'hdfs': role_config_groups({'hdfs-NAMENODE-BASE': []}),
+        }
+        services = {'kafka': kafka, 'hdfs': hdfs}
+
+        def get(path, params=None):
+            service_name = path.split('/')[4]
+            if path.endswith('/roles'):
+                return roles_full(services[service_name].get_all_roles.return_value)
+            return groups[service_name]
+        cm_api.api.get.side_effect = get
+        self.cm_api = cm_api
+        self.snapshot = build_snapshot(cm_api)
+        self.roles = kafka.get_all_roles.return_value + hdfs.get_all_roles.return_value
+
+    def test_role_configs_are_read_with_one_listing(self):
+        self.assertFalse(any(role.get_config.called for role in self.roles))
+        paths = [call[0][0] for call in self.cm_api.api.get.call_args_list]
+        self.assertEqual(sorted(path for path in paths if path.endswith('/roles')),
+                         ['/clusters/cluster/services/kafka/roles'])
+
+    def test_round_trip(self):
+        write_snapshot(self.snapshot, self.path)
+        cm_api = SnapshotNiagaraCMApi(self.path)
+        self.assertEqual(cm_api.get_hosts_by_role('kafka', 'KAFKA_BROKER'), ['node1', 'node2'])
+        self.assertEqual(cm_api.get_hosts_by_role('hdfs', 'NAMENODE', haStatus='ACTIVE'), ['node1'])
+        self.assertEqual(cm_api.get_kafka_broker_id_by_hostname('node2'), '12')
+        self.assertEqual(cm_api.get_log_dirs_for_kafka_broker('node1'), ['/data1', '/data2'])
+        self.assertEqual(cm_api.get_broker_status('node1'), ('STARTED', False))
+        self.assertEqual(cm_api.get_service_ports('kafka', 'kafka-KAFKA_BROKER-BASE'), '9092')
+        self.assertRaises(ValueError, cm_api.get_service_ports, 'kafka', 'kafka-GATEWAY-BASE')
+        self.assertEqual(cm_api.get_configs('kafka', ['port']), {'kafka-KAFKA_BROKER-BASE': {'port': '9092'}})
+        self.assertEqual(cm_api.get_configs('kafka', ['broker.id', 'port'], scope='role', role='KAFKA_BROKER'),
+                         {'node1': {'broker.id': '11', 'port': '9092'}, 'node2': {'broker.id': '12', 'port': '9092'}})
+        self.assertEqual(cm_api.get_all_role_config_groups('kafka'), ['kafka-KAFKA_BROKER-BASE'])
+        self.assertEqual(cm_api.get_role_types('hdfs'), ['NAMENODE'])
+        self.assertEqual([role['name'] for role in cm_api.get_roles_on_host('node1')], ['nn-1', 'broker-1'])
+        self.assertIsNone(cm_api.get_roles_on_host('node3'))
+        status = cm_api.get_service_status('kafka', 'KAFKA_BROKER')
+        self.assertEqual(status['node2']['configStalenessStatus'], 'FRESH')
+        self.assertEqual(status['node2']['healthChecks'], [{'name': 'KAFKA_BROKER_HOST_HEALTH', 'summary': 'GOOD'}])
+
+    def test_unknown_service(self):
+        with self.assertRaises(SnapshotError):
+            SnapshotNiagaraCMApi(self.snapshot).get_hosts_by_role('yarn', 'RESOURCEMANAGER')
+
+    def test_unsupported_version(self):
+        self.snapshot['version'] = 0
+        write_snapshot(self.snapshot, self.path)
+        with self.assertRaises(SnapshotError):
+            read_snapshot(self.path)
+
+
+class TestSnapshotMatchesLive(unittest.TestCase):
+    def test_configs(self):
+        cluster = FakeCluster(brokers=3)
+        # Group without port override, cloudera manager default is used.
+        cluster.services['kafka']['roleConfigGroups']['kafka-KAFKA_BROKER-BASE']['config'] = {}
+        with FakeCMServer(cluster) as server:
+            live = NiagaraCMApi('127.0.0.1', 'admin', 'admin', port=str(server.port))
+            offline = SnapshotNiagaraCMApi(build_snapshot(live))
+            for cm_api in (live, offline):
+                self.assertEqual(cm_api.get_service_ports('kafka', 'kafka-KAFKA_BROKER-BASE'), '9092')
+            keys = ['port', 'log.dirs', 'broker.id', 'broker_max_heap_size']
+            self.assertEqual(offline.get_configs('kafka', keys), live.get_configs('kafka', keys))
+            self.assertEqual(offline.get_configs('kafka', keys, scope='role', role='KAFKA_BROKER'),
+                             live.get_configs('kafka', keys, scope='role', role='KAFKA_BROKER'))
+
+    def test_requests_do_not_grow_with_brokers(self):
+        requests = []
+        for brokers in (3, 30):
+            with FakeCMServer(FakeCluster(brokers=brokers)) as server:
+                build_snapshot(NiagaraCMApi('127.0.0.1', 'admin', 'admin', port=str(server.port)))
+                requests.append(len(server.requests))
+        self.assertEqual(requests[0], requests[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,16 @@
+import unittest
+
+from apicm.tests.benchmark_startup import get_entry_points, measure_entry_point
+
+
+class TestStartup(unittest.TestCase):
+    def test_entry_points_do_not_import_heavy_modules(self):
+        entry_points = get_entry_points()
+        self.assertIn(('get-kafka-brokers', 'apicm.cmd_line_scripts', 'get_kafka_brokers'), entry_points)
+        for script, module, function in entry_points:
+            _, heavy = measure_entry_point(module, function, runs=1)
+            self.assertEqual(heavy, [], script)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+import socket
+import threading
+import time
+import unittest
+import urllib2
+
+import mock
+from cm_api.api_client import ApiException
+
+from apicm.apicm import NiagaraCMApi
+from apicm.instrumentation import CallCounter
+from apicm.tests.fake_cm import DROP, FakeCluster, FakeCMServer
+from apicm.transport import CircuitBreaker, CircuitOpenError, PooledTransport, RateLimiter
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.now = [0]
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, timer=lambda: self.now[0])
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.breaker.allow()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'open')
+        self.assertRaises(CircuitOpenError, self.breaker.allow)
+
+    def test_half_open_lets_one_trial_through(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now[0] = 10
+        self.assertEqual(self.breaker.state, 'half-open')
+        self.breaker.allow()
+        self.assertRaises(CircuitOpenError, self.breaker.allow)
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'open')
+        self.now[0] = 20
+        self.breaker.allow()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, 'closed')
+        self.breaker.allow()
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_bursts_are_delayed(self):
+        now = [0]
+        sleep = mock.Mock()
+        limiter = RateLimiter(2, burst=2, timer=lambda: now[0], sleep=sleep)
+        self.assertEqual([limiter.acquire() for _ in range(4)], [0, 0, 0.5, 1.0])
+        self.assertEqual(sleep.call_args_list, [mock.call(0.5), mock.call(1.0)])
+        now[0] = 10
+        self.assertEqual(limiter.acquire(), 0)
+
+
+class TestPooledTransport(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeCMServer(FakeCluster(brokers=3)).start()
+        self.sleep = mock.Mock()
+        self.transport = PooledTransport('127.0.0.1', 'admin', 'admin', port=self.server.port, retries=2,
+                                         failure_threshold=3, sleep=self.sleep)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.stop()
+
+    def test_connections_are_reused(self):
+        for _ in range(3):
+            response = self.transport.execute('GET', 'hosts')
+            self.assertEqual(response.getcode(), 200)
+            self.assertEqual(response.info().getmaintype(), 'application')
+        stats = self.transport.stats()
+        self.assertEqual(stats['connections_created'], 1)
+        self.assertEqual(stats['connections_reused'], 2)
+        self.assertEqual(stats['idle_connections'], 1)
+
+    def test_get_is_retried(self):
+        self.server.failures = [503, 502]
+        self.assertEqual(self.transport.execute('GET', 'hosts').getcode(), 200)
+        self.assertEqual([status for _, _, status in self.server.requests], [503, 502, 200])
+        self.assertEqual(self.transport.stats()['retries'], 2)
+        self.assertEqual(self.sleep.call_count, 2)
+
+    def test_post_is_not_retried(self):
+        self.server.failures = [503]
+        with self.assertRaises(ApiException) as context:
+            self.transport.execute('POST', 'clusters/cluster/services/kafka/roleCommands/restart',
+                                   data='{"items": []}')
+        self.assertEqual(context.exception.code, 503)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_post_is_not_resent_on_reused_connection(self):
+        self.transport.execute('GET', 'hosts')
+        self.server.failures = [DROP]
+        self.assertRaises(urllib2.URLError, self.transport.execute, 'POST',
+                          'clusters/cluster/services/kafka/roleCommands/restart',
+                          data='{"items": ["kafka-KAFKA_BROKER-0"]}')
+        self.assertEqual([method for method, _, _ in self.server.requests], ['GET', 'POST'])
+        self.assertEqual(self.transport.stats()['connections_reused'], 1)
+
+    def test_get_is_resent_on_reused_connection(self):
+        self.transport.execute('GET', 'hosts')
+        self.server.failures = [DROP]
+        self.assertEqual(self.transport.execute('GET', 'hosts').getcode(), 200)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_client_errors_are_not_retried(self):
+        with self.assertRaises(ApiException) as context:
+            self.transport.execute('GET', 'clusters/other')
+        self.assertEqual(context.exception.code, 404)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.transport.stats()['circuit'], 'closed')
+
+    def test_circuit_opens(self):
+        self.server.failures = [503] * 3
+        self.assertRaises(ApiException, self.transport.execute, 'GET', 'hosts')
+        self.assertRaises(CircuitOpenError, self.transport.execute, 'GET', 'hosts')
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.transport.stats()['rejected'], 1)
+
+    def test_connection_error(self):
+        with mock.patch.object(self.transport, '_send', side_effect=socket.error(111, 'Connection refused')):
+            self.assertRaises(urllib2.URLError, self.transport.execute, 'GET', 'hosts')
+        self.assertEqual(self.transport.stats()['failures'], 3)
+
+    def test_concurrent_reads_are_coalesced(self):
+        self.server.latency = 0.2
+        responses = []
+        threads = [threading.Thread(target=lambda: responses.append(self.transport.execute('GET', 'hosts')))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([response.getcode() for response in responses], [200] * 5)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.transport.stats()['coalesced'], 4)
+
+    def test_reads_after_write_are_not_coalesced_with_earlier_reads(self):
+        release = threading.Event()
+        calls = []
+
+        def execute(http_method, url, data, headers):
+            calls.append(http_method)
+            call = len(calls)
+            if call == 1:
+                release.wait()
+            return call
+
+        results = []
+        with mock.patch.object(self.transport, '_execute', side_effect=execute):
+            old_read = threading.Thread(target=lambda: results.append(self.transport.execute('GET', 'hosts')))
+            old_read.start()
+            while not calls:
+                time.sleep(0.001)
+            self.transport.execute('PUT', 'clusters/cluster/services/kafka/roles/kafka-KAFKA_BROKER-0/config',
+                                   data='{"items": []}')
+            new_read = threading.Thread(target=lambda: results.append(self.transport.execute('GET', 'hosts')))
+            new_read.start()
+            new_read.join(5)
+            release.set()
+            old_read.join()
+        self.assertEqual(calls, ['GET', 'PUT', 'GET'])
+        # Read issued after the write got its own response, before the earlier read finished.
+        self.assertEqual(results, [3, 1])
+
+    def test_rate_limit(self):
+        transport = PooledTransport('127.0.0.1', 'admin', 'admin', port=self.server.port, rate_limit=1, burst=2,
+                                    sleep=self.sleep)
+        for _ in range(3):
+            transport.execute('GET', 'hosts')
+        transport.close()
+        self.assertEqual(self.sleep.call_count, 1)
+        self.assertGreater(transport.stats()['rate_limited_seconds'], 0)
+
+    def test_shared_transport(self):
+        clients = [NiagaraCMApi('127.0.0.1', 'admin', 'admin', port=str(self.server.port), transport=self.transport)
+                   for _ in range(2)]
+        counters = [client.instrumentation.subscribe(CallCounter()) for client in clients]
+        clients[0].get_host_index()
+        self.assertEqual([counter.total()['count'] for counter in counters], [1, 0])
+
+    def test_niagara_cm_api(self):
+        cm = NiagaraCMApi('127.0.0.1', 'admin', 'admin', port=str(self.server.port), transport=self.transport)
+        self.assertEqual(cm.get_hosts_by_role('kafka', 'KAFKA_BROKER'),
+                         ['host0.example.com', 'host1.example.com', 'host2.example.com'])
+        self.assertEqual(self.transport.stats()['connections_created'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
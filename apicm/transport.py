@@ -0,0 +1,339 @@
+import base64
+import httplib
+import logging
+import posixpath
+import random
+import socket
+import threading
+import time
+import urllib
+import urllib2
+from StringIO import StringIO
+
+from .cache import SingleFlight
+
+# Responses, which mean cloudera manager is overloaded or restarting.
+RETRYABLE_STATUSES = frozenset([502, 503, 504])
+
+
+class CircuitOpenError(IOError):
+    pass
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker of cloudera manager requests.
+
+    After failure_threshold consecutive failures circuit opens and requests
+    fail fast with CircuitOpenError. After reset_timeout seconds one trial
+    request is let through: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, timer=time.time):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.timer = timer
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if self.timer() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        """
+        Method checks whether request could be sent.
+
+        Raises:
+            CircuitOpenError: Circuit is open or trial request is already running.
+        """
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return
+            if state == 'half-open' and not self._trial:
+                self._trial = True
+                return
+            raise CircuitOpenError('Cloudera manager is unhealthy, requests are suspended for {0} seconds.'.format(
+                max(0, int(self.reset_timeout - (self.timer() - self.opened_at)))))
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = self.timer()
+            self._trial = False
+
+
+class RateLimiter(object):
+    """
+    Token bucket limiting rate of cloudera manager requests. Up to burst
+    requests are sent at once, after that callers are delayed, so at most
+    rate requests per second reach cloudera manager. One limiter could be
+    shared by many transports to limit the whole process.
+    """
+
+    def __init__(self, rate, burst=None, timer=time.time, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1, rate))
+        self.timer = timer
+        self.sleep = sleep
+        self.waited = 0.0
+        self._tokens = self.burst
+        self._updated = timer()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Method takes one token, waiting until it is available.
+
+        Returns:
+            Seconds spent waiting.
+        """
+        with self._lock:
+            now = self.timer()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Token is taken in advance, so concurrent callers queue up behind each other.
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0
+            self.waited += delay
+        if delay:
+            self.sleep(delay)
+        return delay
+
+
+class TransportResponse(object):
+    """
+    Fully read response, that quacks like urllib2 response for cm_api.
+    """
+
+    def __init__(self, status, reason, headers, body):
+        self.code = status
+        self.msg = reason
+        self.headers = headers
+        self._body = body
+
+    def read(self):
+        return self._body
+
+    def info(self):
+        return self.headers
+
+    def getcode(self):
+        return self.code
+
+
+class PooledTransport(object):
+    """
+    HTTP transport of cloudera manager API, which replaces urllib2 based
+    cm_api HttpClient (see NiagaraCMApi transport argument).
+
+    Connections are kept alive and reused from a pool bounded by pool_size,
+    which also bounds number of concurrent requests. Idempotent GET requests
+    are retried on connection errors, timeouts and 502/503/504 responses with
+    jittered exponential backoff. Consecutive failures open circuit breaker,
+    so callers fail fast instead of hammering overloaded cloudera manager.
+
+    Transport is thread-safe and is meant to be shared by all clients of
+    one cloudera manager: identical GET requests of concurrent callers are
+    sent once and share the response, and rate_limit (requests per second)
+    or shared rate_limiter bounds load of the whole process.
+    """
+
+    def __init__(self, cm_host, user, password, port='7180', version=17, use_tls=False, timeout=30, pool_size=8,
+                 retries=2, backoff=0.5, max_backoff=5, failure_threshold=5, reset_timeout=30, exc_class=None,
+                 rate_limit=None, burst=None, rate_limiter=None, timer=time.time, sleep=time.sleep):
+        if exc_class is None:
+            from cm_api.api_client import ApiException
+            exc_class = ApiException
+        self.host = cm_host
+        self.port = int(port)
+        self.connection_class = httplib.HTTPSConnection if use_tls else httplib.HTTPConnection
+        self.path = '/api/v{0}'.format(version)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.exc_class = exc_class
+        self.sleep = sleep
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, timer)
+        if rate_limiter is None and rate_limit:
+            rate_limiter = RateLimiter(rate_limit, burst, timer, sleep)
+        self.rate_limiter = rate_limiter
+        self._flights = SingleFlight()
+        # Bumped by every write, so reads issued after it do not share responses fetched before it.
+        self._write_epoch = 0
+        self.headers = {
+            'Content-Type': 'application/json',
+            'Authorization': 'Basic ' + base64.b64encode('{0}:{1}'.format(user, password)),
+        }
+        self.counters = dict.fromkeys(
+            ['requests', 'connections_created', 'connections_reused', 'retries', 'failures', 'rejected'], 0)
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(__name__)
+
+    @property
+    def base_url(self):
+        scheme = 'https' if self.connection_class is httplib.HTTPSConnection else 'http'
+        return '{0}://{1}:{2}{3}'.format(scheme, self.host, self.port, self.path)
+
+    @property
+    def logger(self):
+        return self._logger
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['idle_connections'] = len(self._idle)
+        stats['coalesced'] = self._flights.shared
+        if self.rate_limiter is not None:
+            stats['rate_limited_seconds'] = round(self.rate_limiter.waited, 3)
+        stats['circuit'] = self.breaker.state
+        return stats
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def _acquire(self):
+        self._slots.acquire()
+        with self._lock:
+            if self._idle:
+                self.counters['connections_reused'] += 1
+                return self._idle.pop(), True
+            self.counters['connections_created'] += 1
+        return self.connection_class(self.host, self.port, timeout=self.timeout), False
+
+    def _release(self, connection, keep):
+        if keep:
+            with self._lock:
+                self._idle.append(connection)
+        else:
+            connection.close()
+        self._slots.release()
+
+    def _send(self, http_method, url, data, headers):
+        connection, reused = self._acquire()
+        try:
+            connection.request(http_method, url, data, headers)
+            response = connection.getresponse()
+            body = response.read()
+        except (httplib.BadStatusLine, socket.error) as e:
+            self._release(connection, False)
+            if http_method == 'GET' and reused and (isinstance(e, httplib.BadStatusLine) or
+                                                    getattr(e, 'errno', None) in (32, 104)):
+                # Cloudera manager most likely closed idle keep-alive connection. It may as well have
+                # processed request and dropped connection, so only idempotent reads are resent.
+                return self._send(http_method, url, data, headers)
+            raise
+        except Exception:
+            self._release(connection, False)
+            raise
+        self._release(connection, not response.will_close)
+        return TransportResponse(response.status, response.reason, response.msg, body)
+
+    def _make_url(self, path, params):
+        url = self.path
+        if path:
+            url += posixpath.normpath('/' + path.lstrip('/'))
+        url = urllib.quote(url.encode('utf-8') if isinstance(url, unicode) else url, safe="/#%[]=:;$&()+,!?*@'~")
+        if params:
+            url += '?' + urllib.urlencode(params, True)
+        return url
+
+    def execute(self, http_method, path, params=None, data=None, headers=None):
+        """
+        Method sends request to cloudera manager, same interface as cm_api HttpClient.execute.
+
+        Returns:
+            TransportResponse with 2xx status.
+
+        Raises:
+            CircuitOpenError: Cloudera manager is considered unhealthy.
+            urllib2.URLError: Connection failed.
+            exc_class: Cloudera manager responded with error status.
+        """
+        url = self._make_url(path, params)
+        request_headers = dict(self.headers)
+        request_headers.update(headers or {})
+        if http_method in ('GET', 'DELETE'):
+            data = None
+        if http_method != 'GET':
+            with self._lock:
+                self._write_epoch += 1
+            return self._execute(http_method, url, data, request_headers)
+        # Identical reads of concurrent callers are sent once.
+        key = (url, tuple(sorted(request_headers.items())), self._write_epoch)
+        return self._flights.do(key, lambda: self._execute(http_method, url, data, request_headers))
+
+    def _execute(self, http_method, url, data, request_headers):
+        attempts = 1 + (self.retries if http_method == 'GET' else 0)
+        for attempt in range(attempts):
+            try:
+                self.breaker.allow()
+            except CircuitOpenError:
+                self._count('rejected')
+                raise
+            if attempt:
+                self._count('retries')
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            self._count('requests')
+            error = None
+            try:
+                response = self._send(http_method, url, data, request_headers)
+            except (httplib.HTTPException, socket.error) as e:
+                error = urllib2.URLError(e)
+            else:
+                if response.code not in RETRYABLE_STATUSES:
+                    self.breaker.record_success()
+                    if response.code >= 400:
+                        raise self.exc_class(urllib2.HTTPError(self.base_url + url, response.code, response.msg,
+                                                               response.headers, StringIO(response.read())))
+                    return response
+                error = self.exc_class(urllib2.HTTPError(self.base_url + url, response.code, response.msg,
+                                                         response.headers, StringIO(response.read())))
+
+            self._count('failures')
+            self.breaker.record_failure()
+            if attempt + 1 >= attempts:
+                raise error
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            self._logger.warning('{0} {1} failed: {2}. Retrying in {3:.2f}s.'.format(http_method, url, error, delay))
+            self.sleep(delay)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+class TransportClient(object):
+    """
+    Handle of shared transport owned by one NiagaraCMApi, so every client
+    instruments its own handle and requests are published once, to the
+    instrumentation of the client that made them.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.execute = transport.execute
+
+    def __getattr__(self, name):
+        return getattr(self.transport, name)
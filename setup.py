@@ -32,7 +32,21 @@ setup(name='apicm',
                     'get-kafka-broker-status=apicm.cmd_line_scripts:get_kafka_broker_status',
                     'get-kafka-broker-log-dirs=apicm.cmd_line_scripts:get_log_dirs_list',
                     'get-yarn-rm-host=apicm.cmd_line_scripts:get_yarn_resource_manager',
-                    'get-broker-id=apicm.cmd_line_scripts:get_broker_id'
+                    'get-broker-id=apicm.cmd_line_scripts:get_broker_id',
+                    'apicm-daemon=apicm.daemon:main',
+                    'start-kafka-brokers=apicm.cmd_line_scripts:start_kafka_brokers',
+                    'stop-kafka-brokers=apicm.cmd_line_scripts:stop_kafka_brokers',
+                    'restart-kafka-brokers=apicm.cmd_line_scripts:restart_kafka_brokers',
+                    'rolling-restart-kafka=apicm.cmd_line_scripts:rolling_restart_kafka',
+                    'edit-kafka-log-dirs=apicm.cmd_line_scripts:edit_kafka_log_dirs',
+                    'apicm-snapshot=apicm.cmd_line_scripts:create_snapshot',
+                    'get-broker-ids=apicm.cmd_line_scripts:get_broker_ids',
+                    'get-kafka-fleet-status=apicm.cmd_line_scripts:get_kafka_fleet_status',
+                    'get-zk-fleet-status=apicm.cmd_line_scripts:get_zk_fleet_status',
+                    'get-configs=apicm.cmd_line_scripts:get_configs',
+                    'get-host-roles=apicm.cmd_line_scripts:get_host_roles',
+                    'detect-config-drift=apicm.cmd_line_scripts:detect_config_drift',
+                    'apicm=apicm.cli:main'
                 ],
       },
       zip_safe=False)